@@ -0,0 +1,66 @@
+"""
+Latency of light requests (uploads of a small file) while heavy clustering requests are running, with the
+analysis pipeline run inline on the event loop, in a thread pool or in a process pool.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_concurrency.py
+"""
+import os
+import sys
+import io
+import time
+import asyncio
+import numpy as np
+import pandas as pd
+import httpx
+from cohorts import synthetic_cohort
+# hina is imported from this checkout, which need not be installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hina.app.api import api
+from hina.app.api.cache import results
+from hina.app.api.executor import ComputePool
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'hina', 'data')
+
+async def upload(client, df, name):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    response = await client.post("/upload", files={"file": (name, buffer.getvalue(), "text/csv")})
+    return response.json()["upload_id"]
+
+async def cluster(client, upload_id):
+    await client.post("/build-cluster-network", data={
+        "upload_id": upload_id, "student_col": "student", "object1_col": "object",
+        "pruning": "none", "layout": "bipartite"}, timeout=None)
+
+async def light_latencies(client, light_df, n_requests, interval=0.05):
+    latencies = []
+    for i in range(n_requests):
+        start = time.perf_counter()
+        await upload(client, light_df, 'light.csv')
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+    return np.array(latencies)
+
+async def run(kind, n_heavy=4, n_requests=40):
+    results.clear()
+    api.pool = ComputePool(kind)
+    light_df = pd.read_csv(os.path.join(DATA_DIR, 'synthetic_data.csv'), dtype=str).head(200)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://hina") as client:
+        idle = await light_latencies(client, light_df, n_requests)
+        upload_ids = [await upload(client, synthetic_cohort(n_students=400, n_objects=30, n_profiles=15, seed=seed), f'cohort {seed}.csv') for seed in range(n_heavy)]
+        start = time.perf_counter()
+        heavy = asyncio.gather(*[cluster(client, upload_id) for upload_id in upload_ids])
+        loaded = await light_latencies(client, light_df, n_requests)
+        await heavy
+        heavy_time = time.perf_counter() - start
+    api.pool.shutdown()
+    return idle, loaded, heavy_time
+
+if __name__ == '__main__':
+    print(f"{'executor':<10}{'idle p50':>10}{'idle p99':>10}{'loaded p50':>12}{'loaded p99':>12}{'heavy (s)':>11}   (latencies in ms)")
+    for kind in ['inline', 'thread', 'process']:
+        idle, loaded, heavy_time = asyncio.run(run(kind))
+        p = lambda x, q: 1000 * np.percentile(x, q)
+        print(f"{kind:<10}{p(idle, 50):>10.1f}{p(idle, 99):>10.1f}{p(loaded, 50):>12.1f}{p(loaded, 99):>12.1f}{heavy_time:>11.2f}")
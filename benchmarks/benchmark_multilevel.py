@@ -0,0 +1,46 @@
+"""
+Objective gap and runtime of the multilevel mode of hina_communities against the exact mode.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_multilevel.py
+"""
+import os
+import sys
+import time
+import pandas as pd
+from cohorts import synthetic_cohort
+# hina is imported from this checkout, which need not be installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hina.construction import get_bipartite
+from hina.mesoscale import hina_communities
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'hina', 'data')
+
+def datasets():
+    df = pd.read_csv(os.path.join(DATA_DIR, 'synthetic_data.csv'), dtype=str)
+    yield 'synthetic_data.csv (student id x code 2)', get_bipartite(df, 'student id', 'code 2')
+    yield 'synthetic_data.csv (student id x task)', get_bipartite(df, 'student id', 'task')
+    df = pd.read_excel(os.path.join(DATA_DIR, 'example_dataset.xlsx'), dtype=str)
+    yield 'example_dataset.xlsx (student x codes)', get_bipartite(df, 'student id (student_col)', 'codes (obj1_col)')
+    yield 'synthetic cohort (300 students)', get_bipartite(synthetic_cohort(), 'student', 'object')
+
+def run(G, **kwargs):
+    start = time.perf_counter()
+    results = hina_communities(G.copy(), **kwargs)
+    return results, time.perf_counter() - start
+
+if __name__ == '__main__':
+    modes = [('identical', False), ('support', False), ('support', True)]
+    print(f"{'dataset':<42}{'mode':<20}{'leaves':>8}{'B':>5}{'ratio':>10}{'gap':>10}{'time (s)':>10}")
+    for name, G in datasets():
+        exact, t_exact = run(G)
+        n_nodes = len(exact['dendrogram']['nodes'])
+        ratio_exact = exact['community structure quality value']
+        print(f"{name:<42}{'exact':<20}{n_nodes:>8}{exact['number of communities']:>5}{ratio_exact:>10.4f}{0:>10.4f}{t_exact:>10.3f}")
+        for coarsen, refine in modes:
+            results, t = run(G, coarsen=coarsen, refine=refine)
+            n_leaves = len(results['dendrogram']['linkage']) + 1
+            ratio = results['community structure quality value']
+            mode = coarsen + (' + refine' if refine else '')
+            print(f"{'':<42}{mode:<20}{n_leaves:>8}{results['number of communities']:>5}{ratio:>10.4f}{ratio-ratio_exact:>10.4f}{t:>10.3f}")
@@ -0,0 +1,78 @@
+"""
+Peak memory and time of parsing an upload (200 MB CSV by default) through the former base64 round trip,
+which also returned the whole dataset as JSON, against parsing it from the spooled file and returning its
+schema and preview. Each path runs in a fresh process, and its peak resident memory is reported above the
+memory of the process after the imports.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_upload_memory.py [size in MB]
+"""
+import os
+import sys
+import time
+import base64
+import importlib
+import resource
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+# hina is imported from this checkout, which need not be installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def synthetic_upload(path, size_mb, seed=0):
+    """
+    Interaction log in the layout of the example datasets, appended in blocks until it reaches size_mb.
+    """
+    rng = np.random.default_rng(seed)
+    codes = np.array(['ask questions', 'answer questions', 'evaluating', 'monitoring', 'planning', 'explaining'])
+    tasks = np.array(['task 1', 'task 2', 'task 3'])
+    header = True
+    while not os.path.exists(path) or os.path.getsize(path) < size_mb * 1024**2:
+        n = 200000
+        pd.DataFrame({
+            'group': [f'group {g}' for g in rng.integers(0, 50, n)],
+            'student id': [f'student {s}' for s in rng.integers(0, 5000, n)],
+            'code 2': codes[rng.integers(0, len(codes), n)],
+            'code 3': codes[rng.integers(0, len(codes), n)],
+            'task': tasks[rng.integers(0, len(tasks), n)],
+        }).to_csv(path, mode='a', header=header, index=False)
+        header = False
+
+def base64_round_trip(path):
+    from hina.app.api import utils
+    with open(path, 'rb') as f:
+        contents = f.read()
+    encoded = base64.b64encode(contents).decode('utf-8')
+    df = utils.parse_contents(encoded, path)
+    return len(df.to_json(orient="split"))
+
+def spooled_file(path):
+    from hina.app.api import utils
+    with open(path, 'rb') as f:
+        df = utils.read_upload(f, path)
+    return len(str(utils.upload_schema(df)))
+
+def measure(method, path):
+    # the modules are imported before the baseline, so that their memory is not counted
+    importlib.import_module('hina.app.api.utils')
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    response_size = method(path)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (peak - baseline) / 1024, elapsed, response_size
+
+if __name__ == '__main__':
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'upload.csv')
+        synthetic_upload(path, size_mb)
+        print(f"CSV file: {os.path.getsize(path) / 1024**2:.0f} MB")
+        print(f"{'path':<20}{'peak memory (MB)':>18}{'time (s)':>10}{'response (kB)':>15}")
+        context = multiprocessing.get_context('spawn')
+        for name, method in [('base64 round trip', base64_round_trip), ('spooled file', spooled_file)]:
+            with context.Pool(1) as pool:
+                memory, elapsed, response_size = pool.apply(measure, (method, path))
+            print(f"{name:<20}{memory:>18.0f}{elapsed:>10.2f}{response_size / 1024:>15.0f}")
@@ -0,0 +1,70 @@
+"""
+Payload size and encoding time of the network elements of a 100k-edge bipartite graph, as the default
+Cytoscape elements serialized by FastAPI, as columnar JSON, in binary form and as an NDJSON stream, each
+uncompressed, gzipped and (if the brotli package is installed) brotli-compressed. The time to the first
+line of the stream is reported separately.
+
+Run from the repository root with:
+
+    python benchmarks/benchmark_wire_format.py [number of edges]
+"""
+import os
+import sys
+import time
+import numpy as np
+import networkx as nx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+# hina is imported from this checkout, which need not be installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from hina.app.api import utils, wire
+
+def synthetic_network(n_edges=100000, n_students=20000, n_objects=2000, seed=0):
+    """
+    Student-object network with the node and edge attributes set by `construct_network`, and a random layout.
+    """
+    rng = np.random.default_rng(seed)
+    G = nx.Graph()
+    G.add_nodes_from((f'student {i}', {'type': 'student', 'color': 'grey'}) for i in range(n_students))
+    G.add_nodes_from((f'object {i}', {'type': 'object1', 'color': 'blue'}) for i in range(n_objects))
+    edges = {}
+    while len(edges) < n_edges:
+        for s, o, w in zip(rng.integers(0, n_students, n_edges), rng.integers(0, n_objects, n_edges), rng.integers(1, 20, n_edges)):
+            edges[(f'student {s}', f'object {o}')] = int(w)
+            if len(edges) == n_edges:
+                break
+    G.add_edges_from((u, v, {'weight': w, 'label': str(w)}) for (u, v), w in edges.items())
+    pos = {node: rng.uniform(-1, 1, 2) for node in G.nodes}
+    return G, pos
+
+def timed(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+if __name__ == '__main__':
+    n_edges = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    G, pos = synthetic_network(n_edges)
+    print(f"Graph: {G.number_of_nodes()} nodes, {G.number_of_edges()} edges")
+    elements, build_elements = timed(lambda: utils.cy_elements_from_graph(G, pos))
+    columns, build_columns = timed(lambda: utils.cy_columns_from_graph(G, pos))
+    formats = [
+        ('elements (FastAPI)', build_elements, lambda: JSONResponse(jsonable_encoder({'elements': elements})).body),
+        ('columnar JSON', build_columns, lambda: wire.encode_json({'elements': columns})),
+        ('binary', build_columns, lambda: wire.encode_binary({'elements': columns})),
+        ('ndjson stream', build_columns, lambda: b''.join(wire.ndjson_lines({'elements': columns}))),
+    ]
+    encodings = ['identity', 'gzip'] + (['br'] if wire.brotli is not None else [])
+    print(f"{'format':<20}{'build (ms)':>12}{'encode (ms)':>13}" + ''.join(f"{encoding + ' (kB)':>15}{encoding + ' (ms)':>15}" for encoding in encodings[1:]) + f"{'raw (kB)':>12}")
+    for name, build, encode in formats:
+        body, encode_time = timed(encode)
+        row = f"{name:<20}{1000 * build:>12.0f}{1000 * encode_time:>13.0f}"
+        for encoding in encodings[1:]:
+            compressed, compress_time = timed(lambda: wire.compress(body, encoding))
+            row += f"{len(compressed) / 1024:>15.0f}{1000 * compress_time:>15.0f}"
+        print(row + f"{len(body) / 1024:>12.0f}")
+    _, first_line = timed(lambda: next(wire.ndjson_lines({'elements': columns})))
+    print(f"First line of the stream after {1000 * (build_columns + first_line):.0f} ms")
@@ -0,0 +1,18 @@
+"""
+Synthetic datasets shared by the benchmarks.
+"""
+import numpy as np
+import pandas as pd
+
+def synthetic_cohort(n_students=300, n_objects=20, n_profiles=12, seed=0):
+    """
+    Students drawing their interactions from a few shared profiles, as in large MOOC-style cohorts.
+    """
+    rng = np.random.default_rng(seed)
+    profiles = [rng.choice(n_objects, size=rng.integers(2, 6), replace=False) for _ in range(n_profiles)]
+    rows = []
+    for i in range(n_students):
+        profile = profiles[rng.integers(n_profiles)]
+        for obj in profile:
+            rows += [(f'student {i}', f'object {obj}')] * int(rng.integers(1, 3))
+    return pd.DataFrame(rows, columns=['student', 'object'])
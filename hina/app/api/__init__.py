@@ -1,2 +1,10 @@
+import pandas as pd
+
+# The stored datasets are shared between requests as shallow copies (see DatasetStore.get_entry), which
+# copy-on-write keeps from being modified through them: it is always on from pandas 3.0, and turned on here
+# for pandas 2
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.options.mode.copy_on_write = True
+
 from .api import *
 from .utils import *
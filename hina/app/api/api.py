@@ -1,16 +1,35 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 import uvicorn
 import pandas as pd
 from hina.app.api import utils
-import base64
-import networkx as nx
+from hina.app.api.store import DatasetStore, DATASET_TTL
+from hina.app.api.cache import results, text_key, pruning_key
+from hina.app.api.executor import ComputePool
+from hina.app.api.jobs import JobManager
+from hina.app.api.upload_cache import UploadCache, file_key
+from hina.app.api.shared import SharedStore
+from hina.app.api.wire import encode_response
+from hina.app.api import metrics
+import os
 import json
 from io import StringIO
 import uuid
 from datetime import datetime
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="HINA REST API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    jobs.shutdown()
+    pool.shutdown(wait=False)
+
+app = FastAPI(title="HINA REST API", lifespan=lifespan)
+
+# Uploads larger than HINA_UPLOAD_MAX_BYTES are refused (keep client_max_body_size in nginx.conf above it)
+UPLOAD_MAX_BYTES = int(os.environ.get('HINA_UPLOAD_MAX_BYTES', 256 * 1024**2))
 
 origins = [
     # "http://localhost:3000",
@@ -25,6 +44,107 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["Content-Disposition"]
 )
+# Request counts, durations and sizes for /metrics, and one timing log line per request
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Parsed uploads, so that endpoints receive an upload_id instead of the whole dataset
+datasets = DatasetStore()
+# Parsed uploads on disk, keyed by the hash of the uploaded bytes
+upload_cache = UploadCache()
+# The upload cache key of each upload_id, so that the other server workers can load its dataset
+uploads = SharedStore('uploads', ttl=DATASET_TTL)
+# CPU-bound work runs in this pool, off the event loop
+pool = ComputePool()
+# Long clustering runs are submitted as jobs, polled by the clients
+jobs = JobManager(pool)
+
+def collect_metrics():
+    """
+    Gauges of the stores and jobs, computed when /metrics is scraped.
+    """
+    lines = ['# HELP hina_datasets Parsed uploads held in memory.', '# TYPE hina_datasets gauge', f'hina_datasets {len(datasets)}',
+             '# HELP hina_datasets_bytes Bytes of DataFrame memory held by the parsed uploads.', '# TYPE hina_datasets_bytes gauge',
+             f'hina_datasets_bytes {datasets.nbytes}',
+             '# HELP hina_upload_cache_lookups_total Lookups of the on-disk upload cache by result.', '# TYPE hina_upload_cache_lookups_total counter',
+             f'hina_upload_cache_lookups_total{{result="hit"}} {upload_cache.hits}',
+             f'hina_upload_cache_lookups_total{{result="miss"}} {upload_cache.misses}',
+             '# HELP hina_jobs Known jobs by state.', '# TYPE hina_jobs gauge']
+    lines += [f'hina_jobs{{state="{state}"}} {count}' for state, count in jobs.counts().items()]
+    return lines
+
+metrics.register_collector(collect_metrics)
+
+def load_dataframe(data: str, upload_id: str):
+    """
+    Return the DataFrame of a previous upload by its upload_id, or parse the dataset JSON posted
+    as `data` by older clients, together with the content hash keying the result caches.
+    """
+    if upload_id not in [None, "none", "null", "undefined", ""]:
+        entry = datasets.get_entry(upload_id)
+        if entry is None:
+            entry = shared_dataset(upload_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired upload_id, please upload the file again")
+        return entry
+    if data in [None, ""]:
+        raise HTTPException(status_code=422, detail="Either upload_id or data is required")
+    with metrics.stage('parse'):
+        return pd.read_json(StringIO(data), orient="split"), text_key(data)
+
+async def cached_response(key, func, **kwargs):
+    """
+    Return the cached response of `key`, or compute `func(**kwargs)` in the pool and cache it.
+    """
+    hit, response = await run_in_threadpool(results.lookup, 'response', key)
+    if not hit:
+        response = await pool.run(func, **kwargs)
+        await run_in_threadpool(results.put, 'response', key, response)
+    return response
+
+def check_aggregate(aggregate: str):
+    """
+    The level of detail requested as form value: None for the full network, else "community" or "group".
+    """
+    if aggregate in [None, "none", "null", "undefined", ""]:
+        return None
+    if aggregate not in utils.AGGREGATE_LEVELS:
+        raise HTTPException(status_code=422, detail=f"Unknown aggregate {aggregate}, expected one of {utils.AGGREGATE_LEVELS}")
+    return aggregate
+
+def check_elements_format(elements_format: str):
+    if elements_format not in utils.ELEMENTS_FORMATS:
+        raise HTTPException(status_code=422, detail=f"Unknown elements_format {elements_format}, expected one of {utils.ELEMENTS_FORMATS}")
+
+def shared_dataset(upload_id: str):
+    """
+    Load the dataset of an upload received by another server worker from the upload cache and store it, or
+    return None if the upload_id is unknown.
+    """
+    key = uploads.get(upload_id)
+    cached = upload_cache.load(key) if key is not None else None
+    if cached is None:
+        return None
+    df, content_key = cached
+    datasets.put(upload_id, df, content_key)
+    return df.copy(deep=False), content_key
+
+def parse_upload(file, filename: str, upload_id: str):
+    """
+    Parse an uploaded file, or load it from the upload cache if the same bytes were uploaded before,
+    and store it under its upload_id.
+    """
+    key = file_key(file, filename)
+    cached = upload_cache.load(key)
+    if cached is not None:
+        df, content_key = cached
+        datasets.put(upload_id, df, content_key)
+    else:
+        with metrics.stage('parse'):
+            df = utils.read_upload(file, filename)
+        upload_cache.save(key, df, datasets.put(upload_id, df))
+    if upload_cache.enabled:
+        uploads[upload_id] = key
+    return df
 
 # @app.get("/health")
 # async def health_check():
@@ -32,16 +152,20 @@ app.add_middleware(
 
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
+    # The upload is spooled to a temporary file while the request is received, and parsed from there
+    size = file.size if file.size is not None else file.file.seek(0, 2)
+    if size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"The file exceeds the upload limit of {UPLOAD_MAX_BYTES // 1024**2} MB")
     try:
-        contents = await file.read()
-        # Encode the file contents in base64 and generate uuid and timestamp
+        file.file.seek(0)
+        # Generate uuid and timestamp
         upload_id = str(uuid.uuid4())
         timestamp = datetime.now().isoformat()
-        encoded = base64.b64encode(contents).decode('utf-8') 
-        df = utils.parse_contents(encoded, file.filename)
+        df = await run_in_threadpool(parse_upload, file.file, file.filename, upload_id)
+        schema = await run_in_threadpool(utils.upload_schema, df)
         return {
             "columns": df.columns.tolist(),
-            "data": df.to_json(orient="split"),
+            **schema,
             "upload_id": upload_id,
             "timestamp": timestamp,
             "filename": file.filename
@@ -52,7 +176,9 @@ async def upload_file(file: UploadFile = File(...)):
 
 @app.post("/build-hina-network")
 async def build_hina_network_endpoint(
-    data: str = Form(...),
+    request: Request,
+    data: str = Form(None),
+    upload_id: str = Form(None),
     group_col: str = Form(None),  
     group: str = Form(...),
     student_col: str = Form(...),  
@@ -62,18 +188,25 @@ async def build_hina_network_endpoint(
     pruning: str = Form(...),     # "none" or "custom"
     alpha: float = Form(0.05),
     fix_deg: str = Form(None),
-    layout: str = Form("bipartite")
+    layout: str = Form("bipartite"),
+    elements_format: str = Form("elements"),    # "elements", "columnar", "binary" or "ndjson"
+    aggregate: str = Form(None)     # "community" or "group" to collapse the students of each into a super-node
 ):
+    check_elements_format(elements_format)
+    aggregate = check_aggregate(aggregate)
+    df, cache_key = await run_in_threadpool(load_dataframe, data, upload_id)
     try:
         object2_col = None if object2_col in ["none", "null", "undefined", ""] else object2_col
         attr_col = None if attr_col in ["none", "null", "undefined", ""] else attr_col
         group_col = None if group_col in ["none", "null", "undefined", ""] else group_col
         
-        df = pd.read_json(StringIO(data), orient="split")
 
         pruning_param = {"fix_deg": fix_deg, "alpha": alpha} if pruning == "custom" else "none"
 
-        nx_G, pos, significant_edges = utils.build_hina_network(
+        # Identical requests are answered from the response cache, the earlier stages are cached by utils
+        key = ("hina", cache_key, group_col, group, student_col, object1_col, object2_col, attr_col, pruning_key(pruning_param), layout,
+               elements_format != "elements", aggregate)
+        response = await cached_response(key, utils.hina_network_response,
             df=df, 
             group_col=group_col, 
             group=group, 
@@ -82,20 +215,28 @@ async def build_hina_network_endpoint(
             object2_col=object2_col,
             attr_col=attr_col,
             pruning=pruning_param, 
-            layout=layout
+            layout=layout,
+            cache_key=cache_key,
+            dataset=cache_key,
+            elements_format=elements_format,
+            aggregate=aggregate
         )
-        elements = utils.cy_elements_from_graph(nx_G, pos)
-        return {
-            "elements": elements,
-            "significant_edges": significant_edges
-        }
+        return encode_response(response, elements_format, request.headers.get("accept-encoding"))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # e.g. an unsupported layout, or columns which do not form a bipartite network
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(f"Error in build_hina_network_endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/build-cluster-network")
 async def build_cluster_network_endpoint(
-    data: str = Form(...),
+    request: Request,
+    data: str = Form(None),
+    upload_id: str = Form(None),
     group_col: str = Form(None),  
     student_col: str = Form(...),  
     object1_col: str = Form(...), 
@@ -105,16 +246,22 @@ async def build_cluster_network_endpoint(
     alpha: float = Form(0.05),
     fix_deg: str = Form(None),
     layout: str = Form("bipartite"),
-    number_cluster: str = Form(None)
+    number_cluster: str = Form(None),
+    elements_format: str = Form("elements"),    # "elements", "columnar", "binary" or "ndjson"
+    aggregate: str = Form(None)     # "community" or "group" to collapse the students of each into a super-node
 ):
+    check_elements_format(elements_format)
+    aggregate = check_aggregate(aggregate)
+    df, cache_key = await run_in_threadpool(load_dataframe, data, upload_id)
     try:
         attr_col = None if attr_col in ["none", "null", "undefined", ""] else attr_col
         group_col = None if group_col in ["none", "null", "undefined", ""] else group_col
         
-        df = pd.read_json(StringIO(data), orient="split")
         pruning_param = {"fix_deg": fix_deg, "alpha": alpha} if pruning == "custom" else "none"
 
-        nx_G, pos, significant_edges, cluster_labels, compression_ratio, object_object_graphs = utils.build_clustered_network(
+        key = ("cluster", cache_key, group_col, student_col, object1_col, object2_col, attr_col, pruning_key(pruning_param), layout, number_cluster,
+               elements_format != "elements", aggregate)
+        response = await cached_response(key, utils.cluster_network_response,
             df=df, 
             group_col=group_col, 
             student_col=student_col, 
@@ -123,22 +270,149 @@ async def build_cluster_network_endpoint(
             attr_col=attr_col,
             pruning=pruning_param, 
             layout=layout,
-            number_cluster=number_cluster
+            number_cluster=number_cluster,
+            cache_key=cache_key,
+            dataset=cache_key,
+            elements_format=elements_format,
+            aggregate=aggregate
         )
-        elements = utils.cy_elements_from_graph(nx_G, pos)
-        # Convert NetworkX graphs to JSON serializable format
-        serializable_graphs = {}
-        for comm_id, graph in object_object_graphs.items():
-            serializable_graphs[comm_id] = nx.node_link_data(graph, edges="links")
-        return {
-            "elements": elements,
-            "cluster_labels": cluster_labels,
-            "compression_ratio": compression_ratio,
-            "object_object_graphs": serializable_graphs,
-            "significant_edges": significant_edges  
-        }
+        return encode_response(response, elements_format, request.headers.get("accept-encoding"))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # e.g. an unsupported layout, or columns which do not form a bipartite network
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(f"Error in build_cluster_network_endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/jobs/cluster-network")
+async def submit_cluster_network_job(
+    data: str = Form(None),
+    upload_id: str = Form(None),
+    group_col: str = Form(None),  
+    student_col: str = Form(...),  
+    object1_col: str = Form(...), 
+    object2_col: str = Form(None),  
+    attr_col: str = Form(None),   
+    pruning: str = Form(...),     # "none" or "custom"
+    alpha: float = Form(0.05),
+    fix_deg: str = Form(None),
+    layout: str = Form("bipartite"),
+    number_cluster: str = Form(None),
+    elements_format: str = Form("elements"),    # "elements", "columnar", "binary" or "ndjson"
+    aggregate: str = Form(None)     # "community" or "group" to collapse the students of each into a super-node
+):
+    """
+    Submit the /build-cluster-network analysis as a job, returning its job_id and status.
+    """
+    check_elements_format(elements_format)
+    aggregate = check_aggregate(aggregate)
+    df, cache_key = await run_in_threadpool(load_dataframe, data, upload_id)
+    attr_col = None if attr_col in ["none", "null", "undefined", ""] else attr_col
+    group_col = None if group_col in ["none", "null", "undefined", ""] else group_col
+    pruning_param = {"fix_deg": fix_deg, "alpha": alpha} if pruning == "custom" else "none"
+
+    key = ("cluster", cache_key, group_col, student_col, object1_col, object2_col, attr_col, pruning_key(pruning_param), layout, number_cluster,
+           elements_format != "elements", aggregate)
+    # the responses may be read from and saved to the shared store, off the event loop
+    hit, response = await run_in_threadpool(results.lookup, 'response', key)
+    if hit:
+        job = await run_in_threadpool(jobs.done, "cluster-network", response)
+    else:
+        job = await jobs.submit("cluster-network", utils.cluster_network_response,
+            on_done=lambda response: results.put('response', key, response),
+            df=df, 
+            group_col=group_col, 
+            student_col=student_col, 
+            object1_col=object1_col, 
+            object2_col=object2_col,
+            attr_col=attr_col,
+            pruning=pruning_param, 
+            layout=layout,
+            number_cluster=number_cluster,
+            cache_key=cache_key,
+            dataset=cache_key,
+            elements_format=elements_format,
+            aggregate=aggregate
+        )
+    return await run_in_threadpool(jobs.status, job.job_id)
+
+# The jobs of the other server workers are read from the shared store, off the event loop
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return await run_in_threadpool(jobs.status, job_id)
+
+@app.get("/jobs/{job_id}/result")
+async def job_result(request: Request, job_id: str, elements_format: str = "columnar"):
+    # the results of jobs submitted with another elements_format than "elements" are columns, returned in
+    # the elements_format of this request
+    check_elements_format(elements_format)
+    result = await run_in_threadpool(jobs.result, job_id)
+    return encode_response(result, elements_format, request.headers.get("accept-encoding"))
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    return await run_in_threadpool(jobs.cancel, job_id)
+
+@app.post("/expand")
+async def expand_endpoint(
+    request: Request,
+    data: str = Form(None),
+    upload_id: str = Form(None),
+    group_col: str = Form(None),  
+    group: str = Form("All"),
+    student_col: str = Form(...),  
+    object1_col: str = Form(...), 
+    object2_col: str = Form(None),  
+    attr_col: str = Form(None),   
+    pruning: str = Form(...),     # "none" or "custom"
+    alpha: float = Form(0.05),
+    fix_deg: str = Form(None),
+    layout: str = Form("bipartite"),
+    number_cluster: str = Form(None),
+    aggregate: str = Form(...),     # "community" or "group"
+    part: str = Form(...),     # the community label or group to expand
+    elements_format: str = Form("elements")     # "elements", "columnar", "binary" or "ndjson"
+):
+    """
+    Expand one super-node of an aggregated network (with the parameters of the request that built it) into its members.
+    """
+    check_elements_format(elements_format)
+    aggregate = check_aggregate(aggregate)
+    if aggregate is None:
+        raise HTTPException(status_code=422, detail=f"aggregate is required, expected one of {utils.AGGREGATE_LEVELS}")
+    df, cache_key = await run_in_threadpool(load_dataframe, data, upload_id)
+    object2_col = None if object2_col in ["none", "null", "undefined", ""] else object2_col
+    attr_col = None if attr_col in ["none", "null", "undefined", ""] else attr_col
+    group_col = None if group_col in ["none", "null", "undefined", ""] else group_col
+    pruning_param = {"fix_deg": fix_deg, "alpha": alpha} if pruning == "custom" else "none"
+    if group != "All" and group_col in df.columns:
+        df = df[df[group_col] == group]
+        cache_key = (cache_key, group)
+
+    key = ("expand", cache_key, group_col, student_col, object1_col, object2_col, attr_col, pruning_key(pruning_param), layout, number_cluster,
+           aggregate, part, elements_format != "elements")
+    try:
+        response = await cached_response(key, utils.expand_response,
+            df=df, 
+            group_col=group_col, 
+            student_col=student_col, 
+            object1_col=object1_col, 
+            object2_col=object2_col,
+            attr_col=attr_col,
+            pruning=pruning_param, 
+            layout=layout,
+            aggregate=aggregate,
+            part=part,
+            number_cluster=number_cluster,
+            cache_key=cache_key,
+            dataset=cache_key,
+            elements_format=elements_format
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    return encode_response(response, elements_format, request.headers.get("accept-encoding"))
 
 @app.post("/build-object-network")
 async def build_object_network_endpoint(
@@ -157,39 +431,9 @@ async def build_object_network_endpoint(
         # Get the NetworkX graph for this community
         graph_data = object_graphs_data[community_id]
         # print(f"Graph data for community {community_id}: {graph_data}")
-        G = nx.node_link_graph(graph_data, edges="links")
-        if len(G.nodes()) == 0:
-            return {"elements": [], "community_id": community_id}
-        
-        # Set attributes for nodes based on bipartite attribute
-        for node, attrs in G.nodes(data=True):
-            node_str = str(node)
-            bipartite_value = str(attrs.get('bipartite', ''))
-            if object1_col in bipartite_value:
-                G.nodes[node]['color'] = 'blue' if node_str != 'NA' else 'black'
-                G.nodes[node]['type'] = 'object1'
-            else:
-                G.nodes[node]['color'] = 'green' if node_str != 'NA' else 'black'
-                G.nodes[node]['type'] = 'object2'
-        
-        if layout == 'spring':
-            pos = nx.spring_layout(G, k=0.3)
-        elif layout == 'circular':
-            pos = nx.circular_layout(G)
-        elif layout == 'bipartite':
-            object1_nodes = [n for n, d in G.nodes(data=True) if d.get('type') == 'object1']
-            if object1_nodes:
-                pos = nx.bipartite_layout(G, object1_nodes, align='vertical', scale=1.5, aspect_ratio=0.7)
-            else:
-                pos = nx.spring_layout(G, k=0.3)
-        else:
-            pos = nx.spring_layout(G, k=0.3)
-            
-        elements = utils.cy_elements_from_graph(G, pos)
-        return {
-            "elements": elements,
-            "community_id": community_id
-        }
+        return await pool.run(utils.object_network_response, graph_data, community_id, object1_col, layout)
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in build_object_network_endpoint: {str(e)}")
         # raise HTTPException(status_code=500, detail=str(e))
@@ -197,48 +441,98 @@ async def build_object_network_endpoint(
 
 @app.post("/quantity-diversity")
 async def quantity_diversity_endpoint(
-    data: str = Form(...),
+    data: str = Form(None),
+    upload_id: str = Form(None),
     student_col: str = Form(...),  
     object1_col: str = Form(...),  
     object2_col: str = Form(...),
     attr_col: str = Form(None),   
     group_col: str = Form(None)   
 ):
+    df, cache_key = await run_in_threadpool(load_dataframe, data, upload_id)
     try:
-        df = pd.read_json(StringIO(data), orient="split")
         attr_col = None if attr_col in ["none", "null", "undefined", ""] else attr_col
         group_col = None if group_col in ["none", "null", "undefined", ""] else group_col
         object2_col = None if object2_col in ["none", "null", "undefined", ""] else object2_col
-        if object2_col is not None and attr_col is None:
-            B= utils.get_tripartite(df, student_col, object1_col, object2_col, group_col)
-        else:
-            B = utils.get_bipartite(df, student_col, object1_col, attr_col, group_col)
-        
-        # Get all quantities
-        quantity_results, _ = utils.quantity(B, attr=attr_col, group=group_col, return_type='all')
-        # Get diversity
-        diversity_results, _ = utils.diversity(B, attr=attr_col)
-        
-        response = {
-            "quantity": quantity_results.get('quantity', {}),
-            "normalized_quantity": quantity_results.get('normalized_quantity', {}),
-            "diversity": diversity_results
-        }
-        # Convert tuple keys to string for JSON serialization
-        if 'quantity_by_category' in quantity_results:
-            category_dict = {}
-            for (node, category), value in quantity_results['quantity_by_category'].items():
-                if node not in category_dict:
-                    category_dict[node] = {}
-                category_dict[node][str(category)] = value
-            response["quantity_by_category"] = category_dict
-            
-        if 'normalized_quantity_by_group' in quantity_results:
-            response["normalized_quantity_by_group"] = quantity_results['normalized_quantity_by_group']       
-
-        return utils.convert_numpy_scalars(response)
+        return await pool.run(utils.quantity_diversity_response, df=df, student_col=student_col, object1_col=object1_col, object2_col=object2_col,
+                              attr_col=attr_col, group_col=group_col, cache_key=cache_key, dataset=cache_key)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # e.g. an unsupported layout, or columns which do not form a bipartite network
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(f"Error in quantity_diversity_endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze")
+async def analyze_endpoint(
+    request: Request,
+    data: str = Form(None),
+    upload_id: str = Form(None),
+    group_col: str = Form(None),  
+    group: str = Form("All"),
+    student_col: str = Form(...),  
+    object1_col: str = Form(...), 
+    object2_col: str = Form(None),  
+    attr_col: str = Form(None),   
+    pruning: str = Form("none"),     # "none" or "custom"
+    alpha: float = Form(0.05),
+    fix_deg: str = Form(None),
+    layout: str = Form("bipartite"),
+    number_cluster: str = Form(None),
+    outputs: str = Form(None),    # comma-separated subset of utils.ANALYSIS_OUTPUTS, all by default
+    elements_format: str = Form("elements"),    # "elements", "columnar", "binary" or "ndjson"
+    aggregate: str = Form(None)     # "community" or "group" to collapse the students of each into a super-node
+):
+    # The outputs of /build-hina-network (or /build-cluster-network) and /quantity-diversity from one graph build
+    outputs = utils.ANALYSIS_OUTPUTS if outputs in [None, ""] else [output.strip() for output in outputs.split(",") if output.strip()]
+    unknown = sorted(set(outputs) - set(utils.ANALYSIS_OUTPUTS))
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown outputs {unknown}, expected some of {utils.ANALYSIS_OUTPUTS}")
+    check_elements_format(elements_format)
+    aggregate = check_aggregate(aggregate)
+    df, cache_key = await run_in_threadpool(load_dataframe, data, upload_id)
+    try:
+        object2_col = None if object2_col in ["none", "null", "undefined", ""] else object2_col
+        attr_col = None if attr_col in ["none", "null", "undefined", ""] else attr_col
+        group_col = None if group_col in ["none", "null", "undefined", ""] else group_col
+
+        pruning_param = {"fix_deg": fix_deg, "alpha": alpha} if pruning == "custom" else "none"
+
+        key = ("analyze", cache_key, group_col, group, student_col, object1_col, object2_col, attr_col, pruning_key(pruning_param), layout,
+               number_cluster, tuple(sorted(set(outputs))), elements_format != "elements", aggregate)
+        response = await cached_response(key, utils.analyze,
+            df=df, 
+            group_col=group_col, 
+            group=group, 
+            student_col=student_col, 
+            object1_col=object1_col, 
+            object2_col=object2_col,
+            attr_col=attr_col,
+            pruning=pruning_param, 
+            layout=layout,
+            number_cluster=number_cluster,
+            outputs=outputs,
+            cache_key=cache_key,
+            dataset=cache_key,
+            elements_format=elements_format,
+            aggregate=aggregate
+        )
+        return encode_response(response, elements_format, request.headers.get("accept-encoding"))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # e.g. an unsupported layout, or columns which do not form a bipartite network
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        print(f"Error in analyze_endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,138 @@
+import os
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+import pandas as pd
+from hina.app.api.shared import SharedStore, SHARED_DIR
+
+# Number of entries kept for each stage of the analysis pipeline, the least recently used ones are evicted
+STAGE_CACHE_SIZES = {
+    'graph': int(os.environ.get('HINA_GRAPH_CACHE_SIZE', 16)),
+    'network': int(os.environ.get('HINA_NETWORK_CACHE_SIZE', 32)),
+    'clustering': int(os.environ.get('HINA_CLUSTER_CACHE_SIZE', 16)),
+    'response': int(os.environ.get('HINA_RESPONSE_CACHE_SIZE', 64)),
+}
+
+# The entries of these stages are also saved in the shared store, so that the server workers reuse each other's
+# results (the graphs and networks are cheaper to rebuild than to load)
+SHARED_STAGES = [stage for stage in os.environ.get('HINA_SHARED_STAGES', 'clustering,response').split(',') if stage]
+
+NONE_VALUES = ["None", "none", "null", "undefined", "", None]
+
+def dataset_key(df: pd.DataFrame) -> str:
+    """
+    Content hash of a DataFrame (values, index and column names), identifying a dataset in the caches
+    whatever upload it comes from.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr(df.columns.tolist()).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return digest.hexdigest()
+
+def text_key(text: str) -> str:
+    """
+    Content hash of a serialized dataset.
+    """
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+def pruning_key(pruning):
+    """
+    Normalized pruning parameters, so that equivalent requests share their cache entries.
+    """
+    if not isinstance(pruning, dict):
+        return 'none' if pruning == 'none' else 'default'
+    fix_deg = pruning.get('fix_deg')
+    return (None if fix_deg in NONE_VALUES else str(fix_deg), float(pruning.get('alpha', 0.05)))
+
+class ResultCache:
+    """
+    LRU caches of the stages of the analysis pipeline (constructed graph, pruned network, clustering result
+    and endpoint response), each bounded by its entry count in STAGE_CACHE_SIZES.
+
+    Keys are tuples built from the dataset content hash and the normalized parameters the stage depends on,
+    so a request changing only a late parameter (e.g. the layout) reuses the earlier stages. A `None` key
+    disables caching for that call. Values are computed outside the lock, so that a long computation does
+    not block the other stages; hits and misses are counted per stage.
+
+    The stages in `shared_stages` are backed by a SharedStore in `shared_dir`: a key missing from memory is
+    looked up there (counting a hit if another process computed it), and stored values are also saved there.
+    """
+    def __init__(self, sizes: dict = None, shared_stages: list = None, shared_dir: str = SHARED_DIR):
+        self.sizes = dict(STAGE_CACHE_SIZES if sizes is None else sizes)
+        shared_stages = SHARED_STAGES if shared_stages is None else shared_stages
+        self._shared = {stage: SharedStore(f'results-{stage}', shared_dir) for stage in shared_stages if stage in self.sizes}
+        self._stages = {stage: OrderedDict() for stage in self.sizes}
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+
+    def lookup(self, stage: str, key):
+        """
+        Return `(True, value)` if `key` is cached in `stage` (counting a hit), else `(False, None)` (counting a miss).
+        """
+        if key is None:
+            return False, None
+        cache = self._stages[stage]
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                self.hits[stage] += 1
+                return True, cache[key]
+        if stage in self._shared:
+            value = self._shared[stage].get(key, self)
+            if value is not self:
+                self._put(stage, key, value)
+                with self._lock:
+                    self.hits[stage] += 1
+                return True, value
+        with self._lock:
+            self.misses[stage] += 1
+        return False, None
+
+    def put(self, stage: str, key, value):
+        """
+        Store `value` under `key` in `stage`, evicting the least recently used entries beyond the stage size.
+        """
+        if key is None:
+            return
+        self._put(stage, key, value)
+        if stage in self._shared:
+            self._shared[stage][key] = value
+
+    def _put(self, stage: str, key, value):
+        cache = self._stages[stage]
+        with self._lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.sizes[stage]:
+                cache.popitem(last=False)
+
+    def get_or_compute(self, stage: str, key, compute):
+        """
+        Return the cached value of `key` in `stage`, or compute, store and return it.
+        """
+        hit, value = self.lookup(stage, key)
+        if hit:
+            return value
+        value = compute()
+        self.put(stage, key, value)
+        return value
+
+    def size(self, stage: str) -> int:
+        with self._lock:
+            return len(self._stages[stage])
+
+    def clear(self, stage: str = None):
+        """
+        Remove the entries of `stage` (all stages by default), also from the shared store, and reset their counts.
+        """
+        with self._lock:
+            for name in ([stage] if stage else list(self._stages)):
+                self._stages[name].clear()
+                if name in self._shared:
+                    self._shared[name].clear()
+                self.hits.pop(name, None)
+                self.misses.pop(name, None)
+
+# Shared by the utils functions and the endpoints
+results = ResultCache()
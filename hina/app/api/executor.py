@@ -0,0 +1,154 @@
+import os
+import asyncio
+import functools
+import contextvars
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+from hina.app.api import metrics
+
+# The analysis pipeline (network construction, pruning, clustering and layouts) runs in a pool of HINA_WORKERS
+# workers, either processes ('process', the default), threads ('thread') or on the event loop itself ('inline',
+# for debugging), and requests taking longer than HINA_REQUEST_TIMEOUT seconds are answered with a 504. Each
+# worker process keeps the DataFrames of the last HINA_WORKER_DATASETS datasets it received
+EXECUTOR = os.environ.get('HINA_EXECUTOR', 'process')
+WORKERS = int(os.environ.get('HINA_WORKERS', max(1, (os.cpu_count() or 1) - 1)))
+REQUEST_TIMEOUT = float(os.environ.get('HINA_REQUEST_TIMEOUT', 600))
+START_METHOD = os.environ.get('HINA_START_METHOD', 'spawn')
+WORKER_DATASETS = int(os.environ.get('HINA_WORKER_DATASETS', 4))
+
+class DatasetMissing(Exception):
+    """
+    Raised by a worker process asked to run on a dataset it no longer holds.
+    """
+
+class _Held:
+    # sent as `df` in place of a DataFrame the worker process already holds
+    pass
+
+# The DataFrames held by a worker process, by dataset key
+_datasets = OrderedDict()
+
+def _call_with_dataset(func, args, kwargs, dataset, max_datasets: int):
+    """
+    Entry point of a call on a dataset in a worker process: the DataFrame passed as `df` is kept for the
+    following calls on the same dataset, which receive a _Held marker instead.
+    """
+    if isinstance(kwargs['df'], _Held):
+        if dataset not in _datasets:
+            raise DatasetMissing(dataset)
+        _datasets.move_to_end(dataset)
+        kwargs = {**kwargs, 'df': _datasets[dataset]}
+    else:
+        _datasets[dataset] = kwargs['df']
+        while len(_datasets) > max_datasets:
+            _datasets.popitem(last=False)
+    return metrics.timed_call(func, args, kwargs)
+
+class ComputePool:
+    """
+    Runs the CPU-bound work of the endpoints off the asyncio event loop, so that a long clustering request does
+    not block the other users.
+
+    With `kind='process'` the work runs in `workers` worker processes (started lazily with the `start_method`
+    context, so that they do not inherit the threads of the server), which sidesteps the GIL: the functions and
+    their arguments must be picklable. The calls on a dataset (see `run`) always run in the same worker, which
+    keeps the stage caches of the dataset and receives its DataFrame only once, and the other calls run in the
+    least busy worker. With `kind='thread'` the work runs in a thread pool, sharing the caches of the server.
+
+    A request exceeding `timeout` seconds raises a 504 HTTPException: its call is cancelled if it has not
+    started yet, else the worker is not interrupted (the running analysis continues until it completes, and its
+    result is discarded). A broken worker process (e.g. killed by the OOM killer) is replaced and the request
+    answered with a 503.
+    """
+    def __init__(self, kind: str = EXECUTOR, workers: int = WORKERS, timeout: float = REQUEST_TIMEOUT, start_method: str = START_METHOD):
+        if kind not in ['process', 'thread', 'inline']:
+            raise ValueError(f"Unknown executor kind '{kind}', expected 'process', 'thread' or 'inline'")
+        self.kind = kind
+        self.workers = workers
+        self.timeout = timeout
+        self.start_method = start_method
+        self._executor = None
+        # one single-process executor per worker process, with the datasets it was sent and its pending calls
+        self._processes = [None] * workers
+        self._held = [OrderedDict() for _ in range(workers)]
+        self._pending = [0] * workers
+
+    @property
+    def executor(self):
+        if self._executor is None and self.kind == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hina-compute')
+        return self._executor
+
+    def process(self, index: int):
+        if self._processes[index] is None:
+            self._processes[index] = ProcessPoolExecutor(max_workers=1, initializer=metrics.init_worker,
+                                                         mp_context=multiprocessing.get_context(self.start_method))
+        return self._processes[index]
+
+    async def run(self, func, *args, timeout: float = None, dataset=None, **kwargs):
+        """
+        Run `func(*args, **kwargs)` in the pool and return its result. The stage timings of the call are
+        recorded in the metrics of the server, and of the current request.
+
+        `dataset` is a key identifying the DataFrame passed as the `df` keyword argument (e.g. the cache key of
+        the upload), by which the worker process of the call is chosen.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        if self.kind == 'inline':
+            return metrics.timed_call(func, args, kwargs)[0]
+        if self.kind == 'thread':
+            call = functools.partial(contextvars.copy_context().run, metrics.timed_call, func, args, kwargs)
+            return await self._wait(self.executor, call, timeout)
+        if dataset is None:
+            index = self._pending.index(min(self._pending))
+            return await self._run_process(index, functools.partial(metrics.timed_call, func, args, kwargs), timeout)
+        index = hash(dataset) % self.workers
+        held = self._held[index]
+        if dataset in held:
+            held.move_to_end(dataset)
+            call = functools.partial(_call_with_dataset, func, args, {**kwargs, 'df': _Held()}, dataset, WORKER_DATASETS)
+            try:
+                return await self._run_process(index, call, timeout)
+            except DatasetMissing:
+                pass
+        # the worker runs its calls in order, so it holds the dataset for the calls submitted after this one
+        held[dataset] = True
+        while len(held) > WORKER_DATASETS:
+            held.popitem(last=False)
+        call = functools.partial(_call_with_dataset, func, args, kwargs, dataset, WORKER_DATASETS)
+        return await self._run_process(index, call, timeout)
+
+    async def _run_process(self, index: int, call, timeout: float):
+        self._pending[index] += 1
+        try:
+            return await self._wait(self.process(index), call, timeout)
+        except BrokenProcessPool:
+            self._processes[index].shutdown(wait=False, cancel_futures=True)
+            self._processes[index] = None
+            self._held[index].clear()
+            raise HTTPException(status_code=503, detail="An analysis worker stopped unexpectedly, please try again")
+        finally:
+            self._pending[index] -= 1
+
+    async def _wait(self, executor, call, timeout: float):
+        future = executor.submit(call)
+        try:
+            result, records, lookups = await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # only a call that has not started yet can be cancelled
+            future.cancel()
+            raise HTTPException(status_code=504, detail=f"The analysis did not complete within {timeout:g} seconds")
+        metrics.merge(records, lookups)
+        return result
+
+    def shutdown(self, wait: bool = True):
+        for executor in [self._executor, *self._processes]:
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
+        self._executor = None
+        self._processes = [None] * self.workers
+        for held in self._held:
+            held.clear()
@@ -0,0 +1,251 @@
+import os
+import time
+import uuid
+import asyncio
+import threading
+import multiprocessing
+from collections import OrderedDict
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from hina.app.api.executor import ComputePool
+from hina.app.api.shared import SharedStore
+
+# At most JOB_QUEUE_SIZE jobs are queued or running at a time, jobs running longer than JOB_TIMEOUT seconds
+# are abandoned, and finished jobs are kept for JOB_TTL seconds for their results to be fetched
+JOB_QUEUE_SIZE = int(os.environ.get('HINA_JOB_QUEUE_SIZE', 16))
+JOB_TIMEOUT = float(os.environ.get('HINA_JOB_TIMEOUT', 3600))
+JOB_TTL = float(os.environ.get('HINA_JOB_TTL', 3600))
+
+class JobCancelled(Exception):
+    pass
+
+class ProgressReporter:
+    """
+    Progress callback of a job, passed to `hina_communities` in the worker. It records the merge progress in
+    the shared `board` (a SharedStore, else a plain dict for thread workers or a manager dict for process
+    workers), at most every percent, and raises JobCancelled once the job has been cancelled so that the worker stops early.
+    """
+    def __init__(self, board, job_id: str):
+        self.board = board
+        self.job_id = job_id
+        self._reported = -1
+
+    def start(self):
+        if self.board.get((self.job_id, 'cancelled')):
+            raise JobCancelled(self.job_id)
+        self.board[(self.job_id, 'running')] = True
+
+    def __call__(self, B: int, B0: int):
+        percent = 100 if B0 <= 1 else int(100 * (B0 - B) / (B0 - 1))
+        if percent > self._reported or B == 1:
+            if self.board.get((self.job_id, 'cancelled')):
+                raise JobCancelled(self.job_id)
+            self.board[(self.job_id, 'progress')] = (B, B0)
+            self._reported = percent
+
+def run_job(func, reporter: ProgressReporter, **kwargs):
+    """
+    Entry point of a job in the worker.
+    """
+    reporter.start()
+    return func(progress=reporter, **kwargs)
+
+class Job:
+    def __init__(self, job_id: str, kind: str):
+        self.job_id = job_id
+        self.kind = kind
+        self.submitted = time.time()
+        self.finished = None
+        self.task = None
+        self.result = None
+        self.error = None
+        self.cancelled = False
+
+class JobManager:
+    """
+    Asynchronous jobs for the analyses that outlive the proxy and browser timeouts.
+
+    A job is submitted with the function computing its response (called as `func(progress=..., **kwargs)`),
+    runs in the compute pool, and is identified by its job_id to poll its status and progress, fetch its
+    result or cancel it. At most `max_jobs` jobs are queued or running, beyond which submissions are refused
+    with a 429, and finished jobs are forgotten `ttl` seconds after they finished.
+
+    When the `shared` store is enabled, it is the board of the jobs, and each job is also saved there with its
+    result, so that any server worker can report the status of a job, return its result or cancel it (the
+    worker running a cancelled job stops it at its next merge). The queue is bounded per server worker.
+    """
+    def __init__(self, pool: ComputePool, max_jobs: int = JOB_QUEUE_SIZE, timeout: float = JOB_TIMEOUT, ttl: float = JOB_TTL,
+                 shared: SharedStore = None):
+        self.pool = pool
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.ttl = ttl
+        self.shared = SharedStore('jobs') if shared is None else shared
+        self._jobs = OrderedDict()
+        self._board = None
+        self._lock = threading.Lock()
+
+    @property
+    def board(self):
+        # worker processes report their progress through a manager, started on the first job
+        if self._board is None:
+            if self.shared.enabled:
+                self._board = self.shared
+            elif self.pool.kind == 'process':
+                self._manager = multiprocessing.get_context(self.pool.start_method).Manager()
+                self._board = self._manager.dict()
+            else:
+                self._board = {}
+        return self._board
+
+    async def submit(self, kind: str, func, on_done=None, **kwargs) -> Job:
+        """
+        Start a job of the given kind (e.g. 'cluster-network') and return it. `on_done` is called with the
+        result of a successful job, e.g. to cache it, and a `dataset` keyword is passed to ComputePool.run. The
+        job is saved to the shared store off the event loop.
+        """
+        with self._lock:
+            self._expire()
+            if sum(job.finished is None for job in self._jobs.values()) >= self.max_jobs:
+                raise HTTPException(status_code=429, detail="Too many analyses are running, please try again later")
+            job = Job(uuid.uuid4().hex, kind)
+            self._jobs[job.job_id] = job
+        await run_in_threadpool(self._save, job)
+        reporter = ProgressReporter(self.board, job.job_id)
+        job.task = asyncio.get_running_loop().create_task(self._run(job, func, reporter, kwargs, on_done))
+        return job
+
+    def done(self, kind: str, result) -> Job:
+        """
+        Register a job whose result is already known (e.g. cached), so that clients follow the same protocol.
+        """
+        job = Job(uuid.uuid4().hex, kind)
+        job.result, job.finished = result, time.time()
+        with self._lock:
+            self._expire()
+            self._jobs[job.job_id] = job
+        self._save(job)
+        return job
+
+    async def _run(self, job: Job, func, reporter: ProgressReporter, kwargs: dict, on_done):
+        try:
+            job.result = await self.pool.run(run_job, func, reporter, timeout=self.timeout, **kwargs)
+            if on_done is not None:
+                await run_in_threadpool(on_done, job.result)
+        except asyncio.CancelledError:
+            job.cancelled = True
+        except HTTPException as e:
+            job.error = e.detail
+        except JobCancelled:
+            job.cancelled = True
+        except Exception as e:
+            print(f"Error in job {job.job_id}: {str(e)}")
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            await run_in_threadpool(self._save, job)
+
+    def _save(self, job: Job):
+        # the result is saved apart, so that polling the status of a job does not load it
+        if self.shared.enabled:
+            if job.finished is not None and job.result is not None:
+                self.shared[(job.job_id, 'result')] = job.result
+            self.shared[(job.job_id, 'job')] = {"kind": job.kind, "submitted": job.submitted, "finished": job.finished,
+                                                "error": job.error, "cancelled": job.cancelled}
+
+    def _load(self, job_id: str):
+        # a job submitted to another server worker, whose expired records are removed here since that worker
+        # may have stopped (a job that never finished expires once its timeout has passed too)
+        record = self.shared.get((job_id, 'job'))
+        if record is None:
+            return None
+        now = time.time()
+        if (record["finished"] if record["finished"] is not None else record["submitted"] + self.timeout) + self.ttl <= now:
+            for key in ['running', 'progress', 'cancelled', 'job', 'result']:
+                self.shared.pop((job_id, key), None)
+            return None
+        job = Job(job_id, record["kind"])
+        job.submitted, job.finished, job.error, job.cancelled = record["submitted"], record["finished"], record["error"], record["cancelled"]
+        return job
+
+    def get(self, job_id: str) -> Job:
+        with self._lock:
+            self._expire()
+            if job_id in self._jobs:
+                return self._jobs[job_id]
+        job = self._load(job_id) if self.shared.enabled else None
+        if job is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired job_id")
+        return job
+
+    def status(self, job_id: str) -> dict:
+        """
+        Status of a job: 'queued', 'running', 'done', 'failed' or 'cancelled', with its progress between 0 and 1
+        and, while clustering, the current number of communities out of the number of leaves.
+        """
+        job = self.get(job_id)
+        status = {"job_id": job.job_id, "kind": job.kind, "submitted": job.submitted, "finished": job.finished}
+        if job.cancelled or (job.finished is None and self.board.get((job.job_id, 'cancelled'))):
+            return {**status, "status": "cancelled", "progress": None}
+        if job.error is not None:
+            return {**status, "status": "failed", "progress": None, "error": job.error}
+        if job.finished is not None:
+            return {**status, "status": "done", "progress": 1.0}
+        progress = self.board.get((job.job_id, 'progress'))
+        if progress is None:
+            running = self.board.get((job.job_id, 'running'), False)
+            return {**status, "status": "running" if running else "queued", "progress": 0.0}
+        B, B0 = progress
+        return {**status, "status": "running", "progress": 1.0 if B0 <= 1 else (B0 - B) / (B0 - 1),
+                "communities": B, "leaves": B0}
+
+    def result(self, job_id: str):
+        job = self.get(job_id)
+        if job.finished is None or job.cancelled or job.error is not None:
+            raise HTTPException(status_code=409, detail=f"Job {job_id} has no result, its status is {self.status(job_id)['status']}")
+        if job.result is None and self.shared.enabled:
+            return self.shared.get((job_id, 'result'))
+        return job.result
+
+    def cancel(self, job_id: str) -> dict:
+        """
+        Cancel a job: a queued job never starts, and a running clustering stops at its next merge.
+        """
+        job = self.get(job_id)
+        if job.finished is None:
+            job.cancelled = True
+            self.board[(job.job_id, 'cancelled')] = True
+            # a job of another server worker is stopped by its worker
+            if job.task is not None:
+                job.task.cancel()
+        return self.status(job_id)
+
+    def counts(self) -> dict:
+        """
+        Number of known jobs by state: 'active' (queued or running), 'done', 'failed' or 'cancelled'.
+        """
+        counts = {'active': 0, 'done': 0, 'failed': 0, 'cancelled': 0}
+        with self._lock:
+            self._expire()
+            for job in self._jobs.values():
+                if job.cancelled:
+                    counts['cancelled'] += 1
+                elif job.error is not None:
+                    counts['failed'] += 1
+                else:
+                    counts['done' if job.finished is not None else 'active'] += 1
+        return counts
+
+    def shutdown(self):
+        if self._board is not None and self._board is not self.shared and self.pool.kind == 'process':
+            self._manager.shutdown()
+        self._board = None
+
+    def _expire(self):
+        now = time.time()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished is not None and job.finished + self.ttl <= now]:
+            del self._jobs[job_id]
+            # the cancellation flag is kept until then, for a worker that has not yet reached its next merge
+            if self._board is not None:
+                for key in ['running', 'progress', 'cancelled', 'job', 'result']:
+                    self._board.pop((job_id, key), None)
@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from collections import Counter as _Counter, defaultdict
+from contextlib import contextmanager
+from hina.app.api import cache
+
+# Each request is logged as a JSON line with its duration per stage on the 'hina.timing' logger, unless
+# HINA_TIMING_LOG is empty or 0
+TIMING_LOG = os.environ.get('HINA_TIMING_LOG', '1') not in ['', '0']
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 600)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(12))
+COUNT_BUCKETS = tuple(10 ** i * m for i in range(1, 7) for m in (1, 3))
+
+logger = logging.getLogger('hina.timing')
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+def _labels(names, values) -> str:
+    if not names:
+        return ''
+    escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + '}'
+
+class Counter:
+    """
+    Prometheus counter with labels, rendered in the text exposition format.
+    """
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            lines += [f'{self.name}{_labels(self.labelnames, labelvalues)} {value:g}' for labelvalues, value in sorted(self._values.items())]
+        return lines
+
+class Histogram:
+    """
+    Prometheus histogram with labels and fixed buckets, rendered in the text exposition format.
+    """
+    def __init__(self, name: str, documentation: str, buckets=TIME_BUCKETS, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # per label values, the count of each bucket (the last one for +Inf), and the sum of the observations
+        self._counts = {}
+        self._sums = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.setdefault(labelvalues, [0] * (len(self.buckets) + 1))
+            counts[i] += 1
+            self._sums[labelvalues] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labelvalues, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                    lines.append(f'{self.name}_bucket{_labels(self.labelnames + ("le",), labelvalues + (le,))} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, labelvalues)} {self._sums[labelvalues]:g}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}')
+        return lines
+
+REQUESTS = Counter('hina_requests_total', 'HTTP requests by method, route and status.', ['method', 'path', 'status'])
+REQUEST_SECONDS = Histogram('hina_request_duration_seconds', 'Duration of the HTTP requests by route.', TIME_BUCKETS, ['path'])
+REQUEST_BYTES = Histogram('hina_request_bytes', 'Size of the HTTP request bodies by route.', BYTES_BUCKETS, ['path'])
+RESPONSE_BYTES = Histogram('hina_response_bytes', 'Size of the HTTP response bodies by route (before compression by a proxy).', BYTES_BUCKETS, ['path'])
+STAGE_SECONDS = Histogram('hina_stage_duration_seconds', 'Duration of the analysis stages: parse, graph, prune, clustering, layout, elements and serialize.', TIME_BUCKETS, ['stage'])
+GRAPH_SIZE = Histogram('hina_graph_size', 'Number of nodes and edges of the constructed networks.', COUNT_BUCKETS, ['kind'])
+WORKER_CACHE = Counter('hina_worker_cache_lookups_total', 'Stage cache lookups in the worker processes by stage and result.', ['stage', 'result'])
+
+_HISTOGRAMS = {'stage': STAGE_SECONDS, 'graph': GRAPH_SIZE}
+_collectors = []
+
+# Observations of the current request, for its timing log line
+_request_records = contextvars.ContextVar('hina_request_records', default=None)
+# Set in the processes of the compute pool, whose observations are sent back with the results of their tasks
+_in_worker = False
+_worker_records = None
+
+def init_worker():
+    """
+    Initializer of the worker processes of the compute pool.
+    """
+    global _in_worker
+    _in_worker = True
+
+def record(kind: str, name: str, value: float):
+    """
+    Observe `value` in the histogram of `kind` ('stage' durations or 'graph' sizes) labelled by `name`. In a
+    worker process the observation is sent back to the server with the result of the task.
+    """
+    if _worker_records is not None:
+        _worker_records.append((kind, name, value))
+        return
+    _HISTOGRAMS[kind].observe(value, name)
+    records = _request_records.get()
+    if records is not None:
+        records.append((kind, name, value))
+
+@contextmanager
+def stage(name: str):
+    """
+    Record the duration of the block as the analysis stage `name`.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record('stage', name, time.perf_counter() - start)
+
+def timed_call(func, args, kwargs):
+    """
+    Run `func(*args, **kwargs)` in the compute pool, returning its result with the observations and stage cache
+    lookups made in the worker process (empty in the server process, where they are recorded directly).
+    """
+    global _worker_records
+    if not _in_worker:
+        return func(*args, **kwargs), [], {}
+    _worker_records = []
+    hits, misses = cache.results.hits.copy(), cache.results.misses.copy()
+    try:
+        result = func(*args, **kwargs)
+    finally:
+        records, _worker_records = _worker_records, None
+    lookups = {(name, 'hit'): count for name, count in (cache.results.hits - hits).items()}
+    lookups.update({(name, 'miss'): count for name, count in (cache.results.misses - misses).items()})
+    return result, records, lookups
+
+def merge(records: list, lookups: dict):
+    """
+    Record the observations and cache lookups returned by `timed_call` from a worker process.
+    """
+    for kind, name, value in records:
+        record(kind, name, value)
+    for (name, result), count in lookups.items():
+        WORKER_CACHE.inc(name, result, amount=count)
+
+def register_collector(collect):
+    """
+    Register a function returning lines of metrics computed when scraped (e.g. gauges of the stores).
+    """
+    _collectors.append(collect)
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    for metric in [REQUESTS, REQUEST_SECONDS, REQUEST_BYTES, RESPONSE_BYTES, STAGE_SECONDS, GRAPH_SIZE, WORKER_CACHE]:
+        lines += metric.render()
+    lines += ['# HELP hina_cache_lookups_total Stage cache lookups in the server process by stage and result.',
+              '# TYPE hina_cache_lookups_total counter']
+    for result, counts in [('hit', cache.results.hits), ('miss', cache.results.misses)]:
+        lines += [f'hina_cache_lookups_total{_labels(("stage", "result"), (name, result))} {count}' for name, count in sorted(counts.items())]
+    for collect in _collectors:
+        lines += collect()
+    return '\n'.join(lines) + '\n'
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting the requests by route and status, observing their duration and body sizes, and
+    logging one JSON line per request with its duration per analysis stage. Requests to /metrics are only counted.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        records = []
+        token = _request_records.set(records)
+        sizes = {'request': 0, 'response': 0}
+        status = 500
+
+        async def receive_counted():
+            message = await receive()
+            if message['type'] == 'http.request':
+                sizes['request'] += len(message.get('body', b''))
+            return message
+
+        async def send_counted(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                sizes['response'] += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            _request_records.reset(token)
+            duration = time.perf_counter() - start
+            route = scope.get('route')
+            path = getattr(route, 'path', 'unmatched')
+            REQUESTS.inc(scope['method'], path, str(status))
+            if path != '/metrics':
+                REQUEST_SECONDS.observe(duration, path)
+                REQUEST_BYTES.observe(sizes['request'], path)
+                RESPONSE_BYTES.observe(sizes['response'], path)
+                if TIMING_LOG:
+                    stages = _Counter()
+                    for kind, name, value in records:
+                        if kind == 'stage':
+                            stages[name] += value
+                    logger.info(json.dumps({
+                        'method': scope['method'], 'path': path, 'status': status,
+                        'duration_ms': round(1000 * duration, 1),
+                        'stages_ms': {name: round(1000 * value, 1) for name, value in stages.items()},
+                        'graph': {name: int(value) for kind, name, value in records if kind == 'graph'},
+                        'request_bytes': sizes['request'], 'response_bytes': sizes['response'],
+                    }))
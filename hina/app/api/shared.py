@@ -0,0 +1,150 @@
+import os
+import stat
+import time
+import uuid
+import pickle
+import shutil
+import hashlib
+
+# Server processes share their uploads, cached results and jobs through SHARED_DIR on local disk (disabled unless
+# set), and the least recently used entries of each namespace are removed beyond SHARED_BYTES bytes
+SHARED_DIR = os.environ.get('HINA_SHARED_DIR', '')
+SHARED_BYTES = int(os.environ.get('HINA_SHARED_BYTES', 2 * 1024**3))
+EVICT_WRITES = 1000
+
+def private_directory(path: str) -> str:
+    """
+    Create the directory `path` accessible only by the current user (mode 0700), or check that an existing one
+    is, and return it. The stores unpickle the files they find there, so a directory owned by another user or
+    accessible to other users raises a PermissionError instead of being read.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if os.name != 'posix':
+        return path
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"{path} must be a directory owned by the current user and accessible only to it (mode 0700)")
+    return path
+
+class SharedStore:
+    """
+    File-backed key-value store shared by the processes of one host, e.g. the server workers started by
+    `uvicorn --workers` and their compute pools.
+
+    Each value is pickled to one file of the namespace directory, named by the hash of the repr of its key, so
+    keys must be built from strings, numbers and tuples (as the stage cache keys are). Values are written to a
+    temporary file and renamed into place, so readers never see partial values. Reading a value refreshes its
+    modification time, values older than `ttl` seconds (if given) are treated as absent and removed, and the
+    least recently used values of the namespace are removed whenever it exceeds `max_bytes`. Namespaces are
+    evicted independently, so large cached results never evict the small job records or upload mappings. The
+    store holds no open files, so it can be pickled to the worker processes.
+
+    The store is disabled if `directory` is empty (the default unless HINA_SHARED_DIR is set). Since values are
+    unpickled, `directory` and the namespace directory are created with mode 0700 and checked to belong to the
+    current user (see `private_directory`) when the store is created.
+    """
+    def __init__(self, namespace: str, directory: str = SHARED_DIR, max_bytes: int = SHARED_BYTES, ttl: float = None):
+        self.namespace = namespace
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._written = 0
+        self._writes = 0
+        if self.enabled:
+            private_directory(directory)
+            private_directory(os.path.join(directory, namespace))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _path(self, key) -> str:
+        name = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+        return os.path.join(self.directory, self.namespace, name)
+
+    def get(self, key, default=None):
+        """
+        Return the value of `key`, or `default` if it is absent, expired or unreadable.
+        """
+        if not self.enabled:
+            return default
+        path = self._path(key)
+        try:
+            if self.ttl is not None and os.stat(path).st_mtime + self.ttl <= time.time():
+                os.remove(path)
+                return default
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        return value
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, self) is not self
+
+    def __setitem__(self, key, value):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            os.replace(tmp, path)
+        except OSError:
+            # e.g. a full disk, the value is simply not shared
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        # the namespace is scanned for eviction once at least a tenth of max_bytes has been written, or every
+        # EVICT_WRITES writes so that the expired small values are removed too
+        self._written += size
+        self._writes += 1
+        if self._written * 10 >= self.max_bytes or self._writes >= EVICT_WRITES:
+            self._written, self._writes = 0, 0
+            self._evict()
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        if self.enabled:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        return value
+
+    def clear(self):
+        """
+        Remove all the values of the namespace.
+        """
+        if self.enabled:
+            shutil.rmtree(os.path.join(self.directory, self.namespace), ignore_errors=True)
+
+    def _evict(self):
+        entries = []
+        now = time.time()
+        with os.scandir(os.path.join(self.directory, self.namespace)) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if self.ttl is not None and stat.st_mtime + self.ttl <= now:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import pandas as pd
+from hina.app.api.cache import dataset_key
+
+# Parsed uploads are kept for DATASET_TTL seconds after their last use, and the least recently used ones
+# are evicted beyond DATASET_STORE_SIZE datasets or DATASET_STORE_BYTES bytes in total
+DATASET_TTL = float(os.environ.get('HINA_DATASET_TTL', 3600))
+DATASET_STORE_SIZE = int(os.environ.get('HINA_DATASET_STORE_SIZE', 32))
+DATASET_STORE_BYTES = int(os.environ.get('HINA_DATASET_STORE_BYTES', 2 * 1024**3))
+
+class DatasetStore:
+    """
+    Bounded, TTL-evicted store of the parsed DataFrames of recent uploads, keyed by their upload_id.
+
+    The content hash of each dataset is computed once when it is stored, to key the result caches.
+    Each access refreshes the time to live of a dataset. Datasets not used for `ttl` seconds are dropped,
+    and the least recently used ones are evicted whenever the store holds more than `max_items` datasets
+    or more than `max_bytes` bytes of DataFrame memory. The store is safe to use from several threads.
+    """
+    def __init__(self, ttl: float = DATASET_TTL, max_items: int = DATASET_STORE_SIZE, max_bytes: int = DATASET_STORE_BYTES):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, upload_id: str, df: pd.DataFrame, key: str = None):
+        """
+        Store the DataFrame of an upload, replacing any previous one with the same upload_id. Returns the
+        content hash of the DataFrame (`key` if it is already known).
+        """
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        key = dataset_key(df) if key is None else key
+        with self._lock:
+            self._pop(upload_id)
+            self._items[upload_id] = (df, nbytes, time.monotonic() + self.ttl, key)
+            self._nbytes += nbytes
+            self._evict()
+        return key
+
+    def get_entry(self, upload_id: str):
+        """
+        Return the DataFrame of an upload and its content hash, or None if the upload_id is unknown or has expired.
+
+        The DataFrame is a shallow copy sharing the data of the stored one, so no request pays a full copy of its
+        dataset: with copy-on-write (turned on with pandas 2 when the API is imported), the data is only copied for
+        the columns a caller modifies, so assigning or setting values never changes the stored DataFrame.
+        """
+        with self._lock:
+            self._evict()
+            if upload_id not in self._items:
+                return None
+            df, nbytes, _, key = self._items[upload_id]
+            self._items[upload_id] = (df, nbytes, time.monotonic() + self.ttl, key)
+            self._items.move_to_end(upload_id)
+        return df.copy(deep=False), key
+
+    def get(self, upload_id: str):
+        """
+        Return the DataFrame of an upload (see `get_entry`), or None if the upload_id is unknown or has expired.
+        """
+        entry = self.get_entry(upload_id)
+        return None if entry is None else entry[0]
+
+    def __contains__(self, upload_id: str):
+        with self._lock:
+            self._evict()
+            return upload_id in self._items
+
+    def __len__(self):
+        with self._lock:
+            self._evict()
+            return len(self._items)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes of DataFrame memory held by the store.
+        """
+        with self._lock:
+            self._evict()
+            return self._nbytes
+
+    def _pop(self, upload_id):
+        if upload_id in self._items:
+            self._nbytes -= self._items.pop(upload_id)[1]
+
+    def _evict(self):
+        now = time.monotonic()
+        for upload_id in [upload_id for upload_id, (_, _, expires, _) in self._items.items() if expires <= now]:
+            self._pop(upload_id)
+        # the most recent dataset is kept even if it exceeds max_bytes on its own
+        while len(self._items) > self.max_items or (len(self._items) > 1 and self._nbytes > self.max_bytes):
+            self._pop(next(iter(self._items)))
@@ -0,0 +1,172 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from hina.app.api.shared import private_directory
+
+# Parsed uploads are saved in UPLOAD_CACHE_DIR (disabled if empty, in the cache directory of the user by default),
+# keyed by the hash of the uploaded bytes, and the least recently used ones are removed beyond UPLOAD_CACHE_BYTES
+# bytes on disk
+USER_CACHE_DIR = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+UPLOAD_CACHE_DIR = os.environ.get('HINA_UPLOAD_CACHE_DIR', os.path.join(USER_CACHE_DIR, 'hina', 'uploads'))
+UPLOAD_CACHE_BYTES = int(os.environ.get('HINA_UPLOAD_CACHE_BYTES', 4 * 1024**3))
+
+def file_key(file, filename: str, chunk_size: int = 1024**2) -> str:
+    """
+    Hash of the bytes of an uploaded file object (read in chunks, then rewound) and of its format.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(os.path.splitext(filename)[1].lower().encode('utf-8'))
+    file.seek(0)
+    for chunk in iter(lambda: file.read(chunk_size), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+def _is_string_column(series: pd.Series) -> bool:
+    if isinstance(series.dtype, pd.StringDtype):
+        return True
+    return series.dtype == object and series.dropna().map(type).eq(str).all()
+
+def _is_json_name(name) -> bool:
+    # column and index names are saved in meta.json, so they must come back from JSON unchanged
+    return name is None or isinstance(name, str) or type(name) in (int, float)
+
+class UploadCache:
+    """
+    On-disk cache of parsed uploads, so that re-uploading the same file (or restarting the server) skips
+    the parsing, which is slow for .xlsx files.
+
+    Each DataFrame is saved as one file per column in a directory named by its key: numeric, boolean and
+    datetime columns as .npy arrays, string columns (object or string dtype) and categorical columns as .npy
+    integer codes and their categories (missing values as code -1), and the other object columns as JSON lists
+    of strings, numbers, booleans and nulls. Nothing is pickled, so loading an entry never runs code; DataFrames
+    with other columns (e.g. of Python objects or timezone-aware datetimes), a MultiIndex or names that JSON
+    does not preserve are simply not cached. Entries are written to a temporary directory and renamed into
+    place, so concurrent writers (e.g. several server workers) never expose partial entries. The directory is
+    created with mode 0700 and checked to belong to the current user (see `private_directory`). The
+    modification time of an entry is refreshed when it is loaded, and the least recently used entries are
+    removed whenever the cache exceeds `max_bytes`.
+    """
+    def __init__(self, directory: str = UPLOAD_CACHE_DIR, max_bytes: int = UPLOAD_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            private_directory(directory)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def load(self, key: str):
+        """
+        Return the cached DataFrame of `key` and the content hash stored with it, or None if it is not cached.
+        """
+        if not self.enabled:
+            return None
+        path = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            df = pd.DataFrame({column['name']: self._load_column(path, i, column) for i, column in enumerate(meta['columns'])},
+                              index=pd.RangeIndex(meta['rows']))
+            if 'index' in meta:
+                df.index = pd.Index(self._load_column(path, 'index', meta['index']), name=meta['index']['name'])
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return df, meta.get('dataset_key')
+
+    def save(self, key: str, df: pd.DataFrame, dataset_key: str = None):
+        """
+        Save the DataFrame of `key` with its content hash, then evict the least recently used entries.
+        """
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, key)
+        tmp = os.path.join(self.directory, f'.{key}.{uuid.uuid4().hex}')
+        os.makedirs(tmp)
+        try:
+            if not (df.columns.is_unique and all(_is_json_name(name) for name in df.columns) and _is_json_name(df.index.name)):
+                raise ValueError("The column names cannot be saved as JSON")
+            meta = {'rows': len(df), 'dataset_key': dataset_key}
+            meta['columns'] = [self._save_column(tmp, i, name, df[name]) for i, name in enumerate(df.columns)]
+            if not df.index.equals(pd.RangeIndex(len(df))):
+                if isinstance(df.index, pd.MultiIndex):
+                    raise ValueError("A MultiIndex cannot be saved")
+                meta['index'] = self._save_column(tmp, 'index', df.index.name, df.index.to_series(index=pd.RangeIndex(len(df))))
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            os.rename(tmp, path)
+        except (OSError, ValueError):
+            # an identical entry was saved concurrently, or the DataFrame cannot be saved without pickle
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._evict()
+
+    def _save_column(self, path, i, name, series):
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+            np.save(os.path.join(path, f'{i}.npy'), series.to_numpy(), allow_pickle=False)
+            return {'name': name, 'kind': 'array'}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(path, f'{i}.npy'), series.cat.codes.to_numpy(np.int32), allow_pickle=False)
+            categories = self._save_column(path, f'{i}.categories', None, series.cat.categories.to_series(index=None))
+            return {'name': name, 'kind': 'categorical', 'categories': categories, 'ordered': bool(series.cat.ordered)}
+        if _is_string_column(series):
+            codes, categories = pd.factorize(series)
+            np.save(os.path.join(path, f'{i}.npy'), codes.astype(np.int32), allow_pickle=False)
+            np.save(os.path.join(path, f'{i}.categories.npy'), np.asarray(categories, dtype=str), allow_pickle=False)
+            return {'name': name, 'kind': 'strings', 'dtype': str(series.dtype)}
+        if series.dtype == object:
+            values = series.tolist()
+            if not all(value is None or type(value) in (str, int, float, bool) for value in values):
+                raise ValueError(f"The values of column {name!r} cannot be saved as JSON")
+            with open(os.path.join(path, f'{i}.json'), 'w') as f:
+                json.dump(values, f)
+            return {'name': name, 'kind': 'json'}
+        raise ValueError(f"Column {name!r} of dtype {series.dtype} cannot be saved without pickle")
+
+    def _load_column(self, path, i, column):
+        if column['kind'] == 'array':
+            return np.load(os.path.join(path, f'{i}.npy'), allow_pickle=False)
+        if column['kind'] == 'categorical':
+            codes = np.load(os.path.join(path, f'{i}.npy'), allow_pickle=False)
+            categories = self._load_column(path, f'{i}.categories', column['categories'])
+            return pd.Series(pd.Categorical.from_codes(codes, categories=pd.Index(categories), ordered=column['ordered']))
+        if column['kind'] == 'strings':
+            codes = np.load(os.path.join(path, f'{i}.npy'), allow_pickle=False)
+            categories = np.load(os.path.join(path, f'{i}.categories.npy'), allow_pickle=False).astype(object)
+            values = categories[np.maximum(codes, 0)] if len(categories) else np.empty(len(codes), dtype=object)
+            values[codes < 0] = np.nan
+            return pd.Series(values, dtype=column['dtype'])
+        if column['kind'] == 'json':
+            with open(os.path.join(path, f'{i}.json')) as f:
+                return pd.Series(json.load(f), dtype=object)
+        # e.g. the pickled columns of entries saved by earlier versions, which are never loaded
+        raise KeyError(column['kind'])
+
+    def _evict(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_dir() and not entry.name.startswith('.'):
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                    entries.append((entry.stat().st_mtime, size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        # the most recent entry is kept even if it exceeds max_bytes on its own
+        for _, size, path in sorted(entries)[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
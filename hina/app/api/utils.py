@@ -1,27 +1,67 @@
-import base64
+import os
 import io
+import json
+import base64
 import pandas as pd
 import networkx as nx
 import numpy as np
 import matplotlib.colors as mcolors
+import itertools
+import contextvars
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from hina.app.api.cache import results, pruning_key, dataset_key
+from hina.app.api.metrics import stage, record
 from hina.dyad import prune_edges
-from hina.mesoscale import hina_communities
+from hina.mesoscale import hina_communities, CommunityResult
 from hina.construction import get_bipartite, get_tripartite
 from hina.individual import quantity, diversity
 
-def parse_contents(encoded_contents: str, filename: str) -> pd.DataFrame:
+# Uploads are parsed CSV_CHUNK_ROWS rows at a time (CSV), and the upload response previews PREVIEW_ROWS rows
+# and lists the values of the columns with at most PREVIEW_VALUES distinct values (e.g. the groups)
+CSV_CHUNK_ROWS = int(os.environ.get('HINA_CSV_CHUNK_ROWS', 100000))
+PREVIEW_ROWS = int(os.environ.get('HINA_PREVIEW_ROWS', 20))
+PREVIEW_VALUES = int(os.environ.get('HINA_PREVIEW_VALUES', 1000))
+
+def read_upload(file, filename: str) -> pd.DataFrame:
     """
-    Decode a base64-encoded file content and return a pandas DataFrame.
+    Parse an uploaded file directly from a binary file object (e.g. the spooled temporary file of the upload),
+    without holding its raw contents in memory. CSV files are parsed in chunks of CSV_CHUNK_ROWS rows.
     Supports both CSV and XLSX formats.
     """
-    decoded = base64.b64decode(encoded_contents)
     if filename.lower().endswith('.csv'):
-        return pd.read_csv(io.StringIO(decoded.decode('utf-8')))
+        return pd.concat(pd.read_csv(file, encoding='utf-8', chunksize=CSV_CHUNK_ROWS), ignore_index=True)
     elif filename.lower().endswith('.xlsx'):
-        return pd.read_excel(io.BytesIO(decoded))
+        return pd.read_excel(file)
     else:
         raise ValueError("Unsupported file format. Please upload a .csv or .xlsx file")
 
+def parse_contents(encoded_contents: str, filename: str) -> pd.DataFrame:
+    """
+    Decode a base64-encoded file content and return a pandas DataFrame.
+    Supports both CSV and XLSX formats.
+    """
+    return read_upload(io.BytesIO(base64.b64decode(encoded_contents)), filename)
+
+def upload_schema(df: pd.DataFrame, preview_rows: int = PREVIEW_ROWS, max_values: int = PREVIEW_VALUES) -> dict:
+    """
+    Summary of an uploaded dataset returned instead of the dataset itself: its number of rows, the name, dtype
+    and number of distinct values of each column (with the values themselves, as strings, for the columns
+    having at most max_values of them), and a preview of its first rows in the 'split' orientation.
+    """
+    schema = []
+    for col in df.columns:
+        values = df[col].dropna().unique()
+        column = {"name": str(col), "dtype": str(df[col].dtype), "unique": int(len(values))}
+        if len(values) <= max_values:
+            column["values"] = [str(value) for value in values]
+        schema.append(column)
+    return {
+        "rows": int(len(df)),
+        "schema": schema,
+        "preview": json.loads(df.head(preview_rows).to_json(orient="split"))
+    }
+
 def convert_numpy_scalars(obj):
     if isinstance(obj, dict):
         return {(k): convert_numpy_scalars(v) for k, v in obj.items()}
@@ -56,28 +96,89 @@ def order_edge(u, v, df: pd.DataFrame, student_col: str, object_col: str, weight
     tuple
         (student_node, object_node, weight) or sorted nodes with weight if ambiguous
     """
-    u_str = str(u)
-    v_str = str(v)
-    student_nodes = set(df[student_col].astype(str).values)
-    object_nodes = set(df[object_col].astype(str).values)
-    
-    if u_str in student_nodes and v_str in object_nodes:
-        return (u_str, v_str, weight)
-    elif u_str in object_nodes and v_str in student_nodes:
-        return (v_str, u_str, weight)
+    return _orient_edges([(str(u), str(v), weight)], set(df[student_col].astype(str)), set(df[object_col].astype(str)))[0]
+
+def _orient_edges(edges, first_labels: set, second_labels: set, other: str = 'sort'):
+    """
+    Orient (u, v, weight) edges in bulk, so that the node in first_labels comes first and the node in
+    second_labels second. The other edges are sorted lexicographically (other='sort'), kept as they are
+    (other='keep') or swapped (other='swap').
+    """
+    if len(edges) == 0:
+        return []
+    u, v, w = zip(*edges)
+    u_labels, v_labels = pd.Series(u, dtype=object), pd.Series(v, dtype=object)
+    keep = (u_labels.isin(first_labels) & v_labels.isin(second_labels)).to_numpy()
+    if other == 'swap':
+        swap = ~keep
     else:
-        # If both nodes are in the same attribute or ambiguous, sort lexicographically.
-        return tuple(sorted([u_str, v_str])) + (weight,)
-        
-def construct_network(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning):
+        swap = ~keep & (u_labels.isin(second_labels) & v_labels.isin(first_labels)).to_numpy()
+        if other == 'sort':
+            swap |= ~keep & (u_labels > v_labels).to_numpy()
+    return [(b, a, c) if s else (a, b, c) for a, b, c, s in zip(u, v, w, swap)]
+
+NODE_TYPE_COLORS = {'object1_object2': 'green', 'student': 'grey', 'object1': 'blue', 'unknown': 'black'}
+
+def _node_types(nodes, student_labels: set, object1_labels: set, object2_labels: set = None):
+    """
+    Type of each node of the network ('object1_object2' for the joint objects of a tripartite network whose
+    parts are labels of both object columns, then 'student', 'object1' or 'unknown'), classified in bulk.
+    """
+    nodes = pd.Series(list(nodes), dtype=object)
+    conditions = [nodes.isin(student_labels).to_numpy(), nodes.isin(object1_labels).to_numpy()]
+    choices = ['student', 'object1']
+    if object2_labels is not None and len(nodes):
+        parts = nodes.str.split('**', regex=False)
+        joint = (parts.str.len() == 2) & parts.str[0].isin(object1_labels) & parts.str[1].isin(object2_labels)
+        conditions.insert(0, joint.to_numpy())
+        choices.insert(0, 'object1_object2')
+    return dict(zip(nodes, np.select(conditions, choices, 'unknown').tolist()))
+
+def network_key(cache_key, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning):
+    """
+    Cache key of the network built by construct_network, or None if the dataset has no cache key.
+    """
+    if cache_key is None:
+        return None
+    return (cache_key, group_col, student_col, object1_col, object2_col, attr_col, pruning_key(pruning))
+
+def construct_network(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, cache_key=None, copy: bool = True):
+    """
+    Build the typed (and optionally pruned) network of the dataset. With a cache_key identifying the content
+    of df, the constructed graph and the network are reused from the stage caches; the network is returned
+    as a copy that the caller may modify, or with copy=False as the cached network, which must not be modified.
+    """
+    key = network_key(cache_key, group_col, student_col, object1_col, object2_col, attr_col, pruning)
+    nx_G, G_edges_ordered = results.get_or_compute('network', key, lambda: _construct_network(
+        df, group_col, student_col, object1_col, object2_col, attr_col, pruning, cache_key))
+    if not copy:
+        return nx_G, G_edges_ordered
+    return nx_G.copy(), list(G_edges_ordered)
+
+def hina_graph(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, cache_key=None) -> nx.Graph:
+    """
+    The tripartite graph of df if object2_col is given, else its bipartite graph, from the 'graph' stage cache.
+    The graph is shared by the callers and must not be modified.
+    """
+    is_tripartite = object2_col is not None and object2_col not in ['none', 'null', 'undefined', '']
+    graph_key = None if cache_key is None else (cache_key, group_col, student_col, object1_col, object2_col if is_tripartite else None, attr_col)
+
+    def build():
+        with stage('graph'):
+            if is_tripartite:
+                return get_tripartite(df, student_col, object1_col, object2_col, group_col)
+            return get_bipartite(df, student_col, object1_col, attr_col, group_col)
+
+    return results.get_or_compute('graph', graph_key, build)
+
+def _construct_network(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, cache_key=None):
     # Create the bipartite/tripartite graph
     is_tripartite = object2_col is not None and object2_col not in ['none', 'null', 'undefined', '']
+    G = hina_graph(df, group_col, student_col, object1_col, object2_col, attr_col, cache_key)
     if is_tripartite:
-        G = get_tripartite(df, student_col, object1_col, object2_col, group_col)
         print("\n=== Tripartite Graph Nodes ===")
         print("\n=== Tripartite Graph Edges ===")
     else:
-        G = get_bipartite(df, student_col, object1_col, attr_col, group_col)
         print("\n=== Bipartite Graph Nodes ===")
         print("\n=== Bipartite Graph Edges ===")
         
@@ -87,49 +188,35 @@ def construct_network(df: pd.DataFrame, group_col: str, student_col: str, object
         G_str.add_node(node_str, **attrs)
     for u, v, data in G.edges(data=True):
         G_str.add_edge(str(u), str(v), **data)
-    G = G_str        
-    G_edges_ordered = [order_edge(u, v, df, student_col, object1_col, int(w.get('weight', 1))) for u, v, w in G.edges(data=True)]
+    G = G_str
+
+    # Labels of the columns as the nodes are named, computed once for the node types and edge orientations
+    student_nodes = set(df[student_col].astype(str))
+    object1_nodes = set(df[object1_col].astype(str))
+    joint_nodes = set(node for node in G.nodes() if "**" in node)
+    object_nodes = joint_nodes if is_tripartite else object1_nodes
+    G_edges_ordered = _orient_edges([(u, v, int(w.get('weight', 1))) for u, v, w in G.edges(data=True)], student_nodes, object1_nodes)
 
     # Node type and color mapping
-    node_types = {}
-    node_colors = {}
-    student_nodes = set(df[student_col].astype(str).values)
-    object_nodes = set()
-    
-    if is_tripartite:
-        for node_str in G.nodes():
-            if "**" in str(node_str):
-                object_nodes.add(str(node_str))
-    else:
-        object_nodes = set(df[object1_col].astype(str).values)
-    
-    # Assign node types and colors
-    for node in G.nodes():
-        node_str = str(node)
-        if is_tripartite and "**" in node_str:
-            parts = node_str.split("**")
-            if len(parts) == 2:
-                obj1_val, obj2_val = parts
-                if obj1_val in df[object1_col].astype(str).values and obj2_val in df[object2_col].astype(str).values:
-                    node_types[node_str] = 'object1_object2'
-                    node_colors[node_str] = 'green'
-                    continue
-        if node_str in df[student_col].astype(str).values:
-            node_types[node_str] = 'student'
-            node_colors[node_str] = 'grey'
-        elif node_str in df[object1_col].astype(str).values:
-            node_types[node_str] = 'object1'
-            node_colors[node_str] = 'blue'
-        else:
-            node_types[node_str] = 'unknown'
-            node_colors[node_str] = 'black'
+    node_types = _node_types(G.nodes(), student_nodes, object1_nodes, set(df[object2_col].astype(str)) if is_tripartite else None)
+    node_colors = {node: NODE_TYPE_COLORS[node_type] for node, node_type in node_types.items()}
+
+    nx_G = nx.Graph()
+    for node, attrs in G.nodes(data=True):
+        new_attrs = dict(attrs)
+        if 'bipartite' in new_attrs:
+            new_attrs['bipartite'] = str(new_attrs['bipartite'])
+        new_attrs['type'] = node_types[node]
+        new_attrs['color'] = node_colors[node]
+        nx_G.add_node(node, **new_attrs)
 
     # Prune edges
     if pruning != "none":
-        if isinstance(pruning, dict):
-            significant_edges_result = prune_edges(G, **pruning)
-        else:
-            significant_edges_result = prune_edges(G)
+        with stage('prune'):
+            if isinstance(pruning, dict):
+                significant_edges_result = prune_edges(G, **pruning)
+            else:
+                significant_edges_result = prune_edges(G)
         
         # Extract significant edges
         if isinstance(significant_edges_result, dict) and "significant edges" in significant_edges_result:
@@ -137,76 +224,25 @@ def construct_network(df: pd.DataFrame, group_col: str, student_col: str, object
         else:
             significant_edges = significant_edges_result or set()
         
-        nx_G = nx.Graph()
-        for node, attrs in G.nodes(data=True):
-            node_str = str(node)
-            new_attrs = dict(attrs)
-            if 'bipartite' in new_attrs:
-                new_attrs['bipartite'] = str(new_attrs['bipartite'])                
-            if node_str in node_types:
-                new_attrs['type'] = node_types[node_str]
-                new_attrs['color'] = node_colors[node_str]
-            nx_G.add_node(node_str, **new_attrs)
-        
-        # Order edges 
-        ordered_edges = []
-        for u, v, w in significant_edges:
-            u_str = str(u)
-            v_str = str(v)
-            
-            if u_str in student_nodes and v_str in object_nodes:
-                ordered_edges.append((u_str, v_str, w))
-            else:
-                ordered_edges.append((v_str, u_str, w))
-        
-        # Add edges to the graph
-        for u, v, w in ordered_edges:
-            nx_G.add_edge(u, v, weight=w)
-        G_edges_ordered = ordered_edges
+        # Order edges, students first
+        G_edges_ordered = _orient_edges([(str(u), str(v), w) for u, v, w in significant_edges], student_nodes, object_nodes, other='swap')
+        nx_G.add_weighted_edges_from(G_edges_ordered)
 
     else:
-        # No pruning
-        nx_G = nx.Graph()        
-        for node, attrs in G.nodes(data=True):
-            node_str = str(node)
-            new_attrs = dict(attrs)
-            if 'bipartite' in new_attrs:
-                new_attrs['bipartite'] = str(new_attrs['bipartite'])                
-            if node_str in node_types:
-                new_attrs['type'] = node_types[node_str]
-                new_attrs['color'] = node_colors[node_str]
-                
-            nx_G.add_node(node_str, **new_attrs)
-
-        ordered_edges = []
-        for edge in G_edges_ordered:
-            u_str = str(edge[0])
-            v_str = str(edge[1])
-            weight = edge[2]
-            
-            if u_str in student_nodes and (v_str in object_nodes or "**" in v_str):
-                ordered_edges.append((u_str, v_str, weight))
-            elif v_str in student_nodes and (u_str in object_nodes or "**" in u_str):
-                ordered_edges.append((v_str, u_str, weight))
-            else:
-                ordered_edges.append(edge)
-        G_edges_ordered = ordered_edges
-        
-        for edge in G_edges_ordered:
-            u_str = str(edge[0])
-            v_str = str(edge[1])
-            nx_G.add_edge(u_str, v_str, weight=int(edge[2]))
+        # No pruning, order edges with students first (joint objects count as objects in both networks)
+        G_edges_ordered = _orient_edges(G_edges_ordered, student_nodes, object_nodes | joint_nodes, other='keep')
+        nx_G.add_weighted_edges_from((u, v, int(w)) for u, v, w in G_edges_ordered)
     
-    for node in list(nx_G.nodes()):
-        if nx_G.degree(node) == 0:
-            nx_G.remove_node(node)
+    nx_G.remove_nodes_from([node for node, degree in nx_G.degree() if degree == 0])
     
     for u, v, d in nx_G.edges(data=True):
         d['label'] = str(d.get('weight', ''))
+    record('graph', 'nodes', nx_G.number_of_nodes())
+    record('graph', 'edges', nx_G.number_of_edges())
     
     return nx_G, G_edges_ordered
 
-def build_hina_network(df: pd.DataFrame, group_col: str, group: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str):
+def build_hina_network(df: pd.DataFrame, group_col: str, group: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str, cache_key=None):
     """
     Build a NetworkX graph for the HINA network, supporting both bipartite and tripartite networks.
     
@@ -229,6 +265,8 @@ def build_hina_network(df: pd.DataFrame, group_col: str, group: str, student_col
         parameters for the prune_edges function.
     layout : str
         Layout for node positioning: "bipartite", "spring", or "circular".
+    cache_key : str, optional
+        The content hash of df. If provided, the constructed graph and network are reused from the stage caches.
     
     Returns:
     --------
@@ -238,21 +276,23 @@ def build_hina_network(df: pd.DataFrame, group_col: str, group: str, student_col
     # Filter by group 
     if group != 'All' and group_col in df.columns:
         df = df[df[group_col] == group]
+        cache_key = None if cache_key is None else (cache_key, group)
 
-    nx_G, G_edges_ordered = construct_network(df, group_col, student_col, object1_col, object2_col, attr_col, pruning)
+    nx_G, G_edges_ordered = construct_network(df, group_col, student_col, object1_col, object2_col, attr_col, pruning, cache_key)
     # print("G_edges_ordered_hina", nx_G.edges)
     # Set the layout
-    if layout == 'bipartite':
-        student_nodes = {n for n, d in nx_G.nodes(data=True) if d['type'] == 'student'}
-        if not nx.is_bipartite(nx_G):
-            raise ValueError("The graph is not bipartite; check the input data.")
-        pos = nx.bipartite_layout(nx_G, student_nodes, align='vertical', scale=1.5, aspect_ratio=0.7)
-    elif layout == 'spring':
-        pos = nx.spring_layout(nx_G, k=0.2)
-    elif layout == 'circular':
-        pos = nx.circular_layout(nx_G)
-    else:
-        raise ValueError(f"Unsupported layout: {layout}")
+    with stage('layout'):
+        if layout == 'bipartite':
+            student_nodes = {n for n, d in nx_G.nodes(data=True) if d['type'] == 'student'}
+            if not nx.is_bipartite(nx_G):
+                raise ValueError("The graph is not bipartite; check the input data.")
+            pos = nx.bipartite_layout(nx_G, student_nodes, align='vertical', scale=1.5, aspect_ratio=0.7)
+        elif layout == 'spring':
+            pos = nx.spring_layout(nx_G, k=0.2)
+        elif layout == 'circular':
+            pos = nx.circular_layout(nx_G)
+        else:
+            raise ValueError(f"Unsupported layout: {layout}")
     
     return nx_G, pos, G_edges_ordered
 
@@ -276,6 +316,9 @@ def cy_elements_from_graph(G: nx.Graph, pos: dict):
             },
             'position': {'x': x, 'y': y},
         })
+        # super-nodes of aggregated networks carry their number of members
+        if 'members' in data:
+            elements[-1]['data']['members'] = data['members']
     for u, v, d in G.edges(data=True):
         elements.append({
             'data': {
@@ -288,7 +331,79 @@ def cy_elements_from_graph(G: nx.Graph, pos: dict):
         })
     return elements
 
-def build_clustered_network(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str, number_cluster=None):
+ELEMENTS_FORMATS = ['elements', 'columnar', 'binary', 'ndjson']
+
+def cy_columns_from_graph(G: nx.Graph, pos: dict):
+    """
+    Columnar counterpart of `cy_elements_from_graph`: the node ids (also their labels) once, their positions
+    as float32 arrays, their types and colors as int8 codes into `node_types` and `node_colors`, and the edges
+    as int32 indices of their endpoints with their float32 weights (also their labels). The int32 `members`
+    of the nodes are added for aggregated networks.
+    """
+    nodes = list(G.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    xy = np.array([pos[node] for node in nodes], dtype=np.float64).reshape(-1, 2) * 400 + 300
+    node_types, types = np.unique([G.nodes[node].get('type', '') for node in nodes], return_inverse=True)
+    node_colors, colors = np.unique([G.nodes[node].get('color', 'black') for node in nodes], return_inverse=True)
+    edges = np.fromiter((i for u, v in G.edges for i in (index[u], index[v])), dtype=np.int32, count=2 * G.number_of_edges()).reshape(-1, 2)
+    columns = {
+        'nodes': {
+            'id': [str(node) for node in nodes],
+            'x': xy[:, 0].astype(np.float32),
+            'y': xy[:, 1].astype(np.float32),
+            'type': types.astype(np.int8),
+            'color': colors.astype(np.int8),
+        },
+        'node_types': node_types.tolist(),
+        'node_colors': node_colors.tolist(),
+        'edges': {
+            'source': edges[:, 0].copy(),
+            'target': edges[:, 1].copy(),
+            'weight': np.fromiter((d.get('weight', 0) for _, _, d in G.edges(data=True)), dtype=np.float32, count=G.number_of_edges()),
+        },
+    }
+    # super-nodes of aggregated networks carry their number of members, the other nodes 0
+    if any('members' in G.nodes[node] for node in nodes):
+        columns['nodes']['members'] = np.array([G.nodes[node].get('members', 0) for node in nodes], dtype=np.int32)
+    return columns
+
+def cy_from_graph(G: nx.Graph, pos: dict, elements_format: str = 'elements'):
+    """
+    The Cytoscape elements of G, or its columns for the 'columnar', 'binary' and 'ndjson' formats.
+    """
+    if elements_format not in ELEMENTS_FORMATS:
+        raise ValueError(f"Unsupported elements format: {elements_format}")
+    with stage('elements'):
+        return cy_elements_from_graph(G, pos) if elements_format == 'elements' else cy_columns_from_graph(G, pos)
+
+def get_cluster_result(G: nx.Graph, key=None, progress=None) -> CommunityResult:
+    """
+    Return the CommunityResult of G from the 'clustering' stage cache, so that changing number_cluster does
+    not rerun the agglomeration. The result is keyed by `key` (the cache key of the network), or by the
+    weighted edges of G when no key is given. `progress` is the merge progress callback of hina_communities.
+    """
+    if key is None:
+        tripartite = any(d.get('tripartite') == True for _, d in G.nodes(data=True))
+        key = (tripartite, tuple(G.edges(data='weight')))
+
+    def cluster():
+        with stage('clustering'):
+            return hina_communities(G, return_type='object', progress=progress)
+
+    return results.get_or_compute('clustering', key, cluster)
+
+def parse_number_cluster(number_cluster):
+    """
+    The number of clusters requested as form value, or None for the best partition.
+    """
+    if number_cluster in (None, "", "none"):
+        return None
+    try:
+        return int(number_cluster)
+    except ValueError:
+        return None
+
+def build_clustered_network(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str, number_cluster=None, cache_key=None, progress=None):
     """
     Build a clustered network using get_bipartite/get_tripartite and hina_communities.
     
@@ -296,27 +411,23 @@ def build_clustered_network(df: pd.DataFrame, group_col: str, student_col: str,
       - Nodes in student_col are colored based on their community using TABLEAU_COLORS.
       - Nodes in object1_col are fixed as blue.
       - Nodes in object2_col are fixed as green.
+
+    With a cache_key (the content hash of df), the network and the clustering result are reused from the
+    stage caches, so changing only layout or number_cluster does not rebuild or recluster the network.
+    `progress` is called with the merge progress of the clustering, see hina_communities.
     """
-    nx_G, G_edges_ordered = construct_network(df, group_col, student_col, object1_col, object2_col, attr_col, pruning)
+    nx_G, G_edges_ordered = construct_network(df, group_col, student_col, object1_col, object2_col, attr_col, pruning, cache_key)
     # print("G_edges_ordered_cluster", nx_G.edges)
-    if number_cluster not in (None, "", "none"):
-        try:
-            number_cluster = int(number_cluster)
-        except ValueError:
-            number_cluster = None
-    else:
-        number_cluster = None
+    number_cluster = parse_number_cluster(number_cluster)
     
-    # Run community detection (clustering)
-    cluster_result = hina_communities(nx_G, fix_B=number_cluster)
-    # print('cluster_result', cluster_result)
-    cluster_labels = cluster_result['node communities']
-    compression_ratio = cluster_result['community structure quality value']
+    # Run community detection (clustering), the merge sequence is shared by all values of number_cluster
+    cluster_result = get_cluster_result(nx_G, network_key(cache_key, group_col, student_col, object1_col, object2_col, attr_col, pruning), progress)
+    cluster_labels = cluster_result.labels(number_cluster)
+    compression_ratio = cluster_result.quality_value(number_cluster)
     
     object_object_graphs = {}
-    if 'object-object graphs for each community' in cluster_result:
-        object_object_graphs = cluster_result['object-object graphs for each community']
-        # print(f"Found {len(object_object_graphs)} object-object graphs for communities")
+    if cluster_result.tripartite:
+        object_object_graphs = cluster_result.object_graphs(number_cluster)
     
     for node in nx_G.nodes():
         nx_G.nodes[node]['cluster'] = str(cluster_labels.get(str(node), "-1"))
@@ -348,52 +459,365 @@ def build_clustered_network(df: pd.DataFrame, group_col: str, student_col: str,
             if '**' in str(node) or nx_G.nodes[node].get('type') == 'object1_object2':
                 combined_nodes.add(str(node))
 
-    offset = np.random.rand() * np.pi
-    radius = 1  # radius of the circle 20/3 * radius/noise_scale
-    noise_scale = 0.16 
+    with stage('layout'):
+        offset = np.random.rand() * np.pi
+        radius = 1  # radius of the circle 20/3 * radius/noise_scale
+        noise_scale = 0.16 
     
-    # For nodes in student node: position based on community label.
-    set1_pos = {}
-    for node in student_nodes.intersection(set(nx_G.nodes())):
-        comm = nx_G.nodes[node].get('cluster', "-1")
-        comm_index = communities.index(comm) if comm in communities else 0
-        angle = 2 * np.pi * comm_index / len(communities) + offset
-        x = radius * np.cos(angle) + (2 * np.random.rand() - 1) * noise_scale
-        y = radius * np.sin(angle) + (2 * np.random.rand() - 1) * noise_scale
-        set1_pos[node] = (x, y)
+        # For nodes in student node: position based on community label.
+        set1_pos = {}
+        for node in student_nodes.intersection(set(nx_G.nodes())):
+            comm = nx_G.nodes[node].get('cluster', "-1")
+            comm_index = communities.index(comm) if comm in communities else 0
+            angle = 2 * np.pi * comm_index / len(communities) + offset
+            x = radius * np.cos(angle) + (2 * np.random.rand() - 1) * noise_scale
+            y = radius * np.sin(angle) + (2 * np.random.rand() - 1) * noise_scale
+            set1_pos[node] = (x, y)
     
-    # For nodes in object1 node: arrange in a circle (half radius)
-    set2_pos = {}
-    obj_nodes = object1_nodes.intersection(set(nx_G.nodes()))
-    obj_list = sorted(list(obj_nodes))
-    num_obj = len(obj_list)
-    for i, node in enumerate(obj_list):
-        angle = 2 * np.pi * i / num_obj + offset
-        x = 0.5 * radius * np.cos(angle)
-        y = 0.5 * radius * np.sin(angle)
-        set2_pos[node] = (x, y)
+        # For nodes in object1 node: arrange in a circle (half radius)
+        set2_pos = {}
+        obj_nodes = object1_nodes.intersection(set(nx_G.nodes()))
+        obj_list = sorted(list(obj_nodes))
+        num_obj = len(obj_list)
+        for i, node in enumerate(obj_list):
+            angle = 2 * np.pi * i / num_obj + offset
+            x = 0.5 * radius * np.cos(angle)
+            y = 0.5 * radius * np.sin(angle)
+            set2_pos[node] = (x, y)
     
-    # For combined nodes in tripartite graph: arrange in a circle (0.7 radius)
-    set3_pos = {}
-    if is_tripartite:
-        combined_list = sorted(list(combined_nodes))
-        num_combined = len(combined_list)
-        for i, node in enumerate(combined_list):
-            angle = 2 * np.pi * i / num_combined + offset + np.pi/num_combined 
-            x = 0.7 * radius * np.cos(angle)
-            y = 0.7 * radius * np.sin(angle)
-            set3_pos[node] = (x, y)
+        # For combined nodes in tripartite graph: arrange in a circle (0.7 radius)
+        set3_pos = {}
+        if is_tripartite:
+            combined_list = sorted(list(combined_nodes))
+            num_combined = len(combined_list)
+            for i, node in enumerate(combined_list):
+                angle = 2 * np.pi * i / num_combined + offset + np.pi/num_combined 
+                x = 0.7 * radius * np.cos(angle)
+                y = 0.7 * radius * np.sin(angle)
+                set3_pos[node] = (x, y)
     
-    pos_custom = {**set1_pos, **set2_pos, **set3_pos}
+        pos_custom = {**set1_pos, **set2_pos, **set3_pos}
     
+        if layout == 'bipartite':
+            pos = pos_custom
+        elif layout == 'spring':
+            pos = nx.spring_layout(nx_G, k=0.2)
+        elif layout == 'circular':
+            pos = nx.circular_layout(nx_G)
+        else:
+            pos = pos_custom
+    
+    return nx_G, pos, G_edges_ordered, cluster_labels, compression_ratio, object_object_graphs
+
+AGGREGATE_LEVELS = ['community', 'group']
+
+def student_partition(nx_G: nx.Graph, df: pd.DataFrame, aggregate: str, group_col: str, student_col: str, number_cluster=None, key=None, progress=None):
+    """
+    Part (community label or group) of each student node of nx_G, with the CommunityResult when aggregating
+    by community (from the 'clustering' stage cache, keyed by `key`) or None.
+    """
+    if aggregate == 'community':
+        cluster_result = get_cluster_result(nx_G, key, progress)
+        labels = cluster_result.labels(number_cluster)
+    elif aggregate == 'group':
+        if group_col is None or group_col not in df.columns:
+            raise ValueError("Aggregating by group requires a group column")
+        cluster_result = None
+        students = df[[student_col, group_col]].drop_duplicates(student_col)
+        labels = dict(zip(students[student_col].astype(str), students[group_col].astype(str)))
+    else:
+        raise ValueError(f"Unsupported aggregate: {aggregate}")
+    partition = {node: str(labels.get(str(node), "-1")) for node, node_type in nx_G.nodes(data='type') if node_type == 'student'}
+    return partition, cluster_result
+
+def aggregate_graph(nx_G: nx.Graph, partition: dict, aggregate: str) -> nx.Graph:
+    """
+    Collapse the student nodes of each part of `partition` into a super-node '<aggregate>:<part>' (of type
+    `aggregate`, with its number of `members`), whose edges to the objects carry the summed weights of the
+    edges of its members. The other nodes keep their attributes.
+    """
+    parts = sorted(set(partition.values()))
+    colors = dict(zip(parts, itertools.cycle(mcolors.TABLEAU_COLORS.values())))
+    members = pd.Series(list(partition.values())).value_counts().to_dict() if partition else {}
+    G = nx.Graph()
+    G.add_nodes_from((f'{aggregate}:{part}', {'type': aggregate, 'part': part, 'members': int(members[part]), 'color': colors[part]})
+                     for part in parts)
+    G.add_nodes_from((node, data) for node, data in nx_G.nodes(data=True) if node not in partition)
+    weights = defaultdict(float)
+    for u, v, w in nx_G.edges(data='weight', default=1):
+        u = f'{aggregate}:{partition[u]}' if u in partition else u
+        v = f'{aggregate}:{partition[v]}' if v in partition else v
+        weights[(u, v)] += w
+    G.add_edges_from((u, v, {'weight': w, 'label': str(w)}) for (u, v), w in weights.items())
+    return G
+
+def aggregate_layout(G: nx.Graph, aggregate: str, layout: str) -> dict:
+    """
+    Layout of an aggregated network, with the super-nodes on one side for the 'bipartite' layout.
+    """
+    with stage('layout'):
+        return _aggregate_layout(G, aggregate, layout)
+
+def _aggregate_layout(G: nx.Graph, aggregate: str, layout: str) -> dict:
     if layout == 'bipartite':
-        pos = pos_custom
-    elif layout == 'spring':
-        pos = nx.spring_layout(nx_G, k=0.2)
+        super_nodes = [node for node, node_type in G.nodes(data='type') if node_type == aggregate]
+        if not nx.is_bipartite(G):
+            raise ValueError("The graph is not bipartite; check the input data.")
+        return nx.bipartite_layout(G, super_nodes, align='vertical', scale=1.5, aspect_ratio=0.7)
+    if layout == 'spring':
+        return nx.spring_layout(G, k=0.2, seed=0)
+    if layout == 'circular':
+        return nx.circular_layout(G)
+    raise ValueError(f"Unsupported layout: {layout}")
+
+def build_aggregated_network(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str, aggregate: str, number_cluster=None, cache_key=None, progress=None):
+    """
+    Level-of-detail counterpart of build_hina_network and build_clustered_network for large cohorts: the
+    network with the students of each community (aggregate='community') or group (aggregate='group')
+    collapsed into a super-node, laid out on its own.
+
+    Returns:
+    --------
+    tuple
+        (nx_G, agg_G, partition, pos, G_edges_ordered, cluster_result) - The full network, the aggregated
+        network, the part of each student, the positions of the aggregated network, the edge list of the full
+        network and the CommunityResult (None when aggregating by group). The networks and partition are
+        shared with the stage caches and must not be modified.
+    """
+    number_cluster = parse_number_cluster(number_cluster)
+    # the network is only read, and the aggregation is cached with it for the expansions of its parts
+    nx_G, G_edges_ordered = construct_network(df, group_col, student_col, object1_col, object2_col, attr_col, pruning, cache_key, copy=False)
+    key = network_key(cache_key, group_col, student_col, object1_col, object2_col, attr_col, pruning)
+
+    def aggregate_network():
+        partition, cluster_result = student_partition(nx_G, df, aggregate, group_col, student_col, number_cluster, key, progress)
+        return aggregate_graph(nx_G, partition, aggregate), partition, cluster_result
+
+    agg_G, partition, cluster_result = results.get_or_compute(
+        'network', None if key is None else ('aggregate', key, aggregate, number_cluster), aggregate_network)
+    pos = aggregate_layout(agg_G, aggregate, layout)
+    return nx_G, agg_G, partition, pos, list(G_edges_ordered), cluster_result
+
+def aggregated_network_response(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str, aggregate: str, number_cluster=None, cache_key=None, progress=None, elements_format='elements'):
+    """
+    Level-of-detail response of the network endpoints: the elements (or columns) of the aggregated network, the
+    number of members of each part and the significant edges, with the community labels, compression ratio and
+    object-object graphs when aggregating by community.
+    """
+    _, agg_G, partition, pos, significant_edges, cluster_result = build_aggregated_network(
+        df, group_col, student_col, object1_col, object2_col, attr_col, pruning, layout, aggregate, number_cluster, cache_key, progress)
+    response = {
+        "elements": cy_from_graph(agg_G, pos, elements_format),
+        "aggregate": aggregate,
+        "parts": {data['part']: data['members'] for _, data in agg_G.nodes(data=True) if data.get('type') == aggregate},
+        "significant_edges": significant_edges
+    }
+    if cluster_result is not None:
+        number_cluster = parse_number_cluster(number_cluster)
+        response["cluster_labels"] = partition
+        response["compression_ratio"] = cluster_result.quality_value(number_cluster)
+        response["object_object_graphs"] = {comm_id: nx.node_link_data(graph, edges="links")
+                                            for comm_id, graph in (cluster_result.object_graphs(number_cluster) if cluster_result.tripartite else {}).items()}
+    return response
+
+def expand_response(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str, aggregate: str, part: str, number_cluster=None, cache_key=None, elements_format='elements'):
+    """
+    Response of the /expand endpoint: the elements (or columns) of the members of one part of an aggregated
+    network, laid out on a circle around the position of its super-node, and of their edges with the objects
+    they connect to (at their positions in the aggregated network).
+    """
+    nx_G, agg_G, partition, pos, _, _ = build_aggregated_network(
+        df, group_col, student_col, object1_col, object2_col, attr_col, pruning, layout, aggregate, number_cluster, cache_key)
+    super_node = f'{aggregate}:{part}'
+    if super_node not in agg_G:
+        raise KeyError(f"Unknown {aggregate} {part}")
+    members = [node for node, node_part in partition.items() if node_part == part]
+    G = nx.Graph()
+    G.add_nodes_from((node, {**nx_G.nodes[node], 'color': agg_G.nodes[super_node]['color'], 'cluster': part}) for node in members)
+    G.add_edges_from(nx_G.edges(members, data=True))
+    nx.set_node_attributes(G, {node: nx_G.nodes[node] for node in G.nodes if node not in partition})
+    # spread the members around their super-node, within a radius growing with their number
+    radius = 0.05 * np.sqrt(len(members))
+    member_pos = nx.circular_layout(members, scale=radius, center=pos[super_node]) if len(members) > 1 else {node: pos[super_node] for node in members}
+    object_pos = {node: pos[node] for node in G.nodes if node not in partition}
+    return {
+        "elements": cy_from_graph(G, {**member_pos, **object_pos}, elements_format),
+        "aggregate": aggregate,
+        "part": part,
+        "super_node": super_node
+    }
+
+def hina_network_response(df: pd.DataFrame, group_col: str, group: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str, cache_key=None, elements_format='elements', aggregate=None):
+    """
+    Response of the /build-hina-network endpoint: the Cytoscape elements (or columns) of the HINA network and its significant edges,
+    or of its aggregation by community or group (see aggregated_network_response).
+    """
+    if aggregate is not None:
+        if group != 'All' and group_col in df.columns:
+            df = df[df[group_col] == group]
+            cache_key = None if cache_key is None else (cache_key, group)
+        return aggregated_network_response(df, group_col, student_col, object1_col, object2_col, attr_col, pruning, layout, aggregate,
+                                           cache_key=cache_key, elements_format=elements_format)
+    nx_G, pos, significant_edges = build_hina_network(df, group_col, group, student_col, object1_col, object2_col,
+                                                      attr_col, pruning, layout, cache_key)
+    return {
+        "elements": cy_from_graph(nx_G, pos, elements_format),
+        "significant_edges": significant_edges
+    }
+
+def cluster_network_response(df: pd.DataFrame, group_col: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str, number_cluster=None, cache_key=None, progress=None, elements_format='elements', aggregate=None):
+    """
+    Response of the /build-cluster-network endpoint: the Cytoscape elements (or columns) of the clustered network, the
+    community labels and compression ratio, the object-object graphs (as node-link data) and the significant edges,
+    or their level-of-detail counterparts (see aggregated_network_response).
+    """
+    if aggregate is not None:
+        return aggregated_network_response(df, group_col, student_col, object1_col, object2_col, attr_col, pruning, layout, aggregate,
+                                           number_cluster, cache_key, progress, elements_format)
+    nx_G, pos, significant_edges, cluster_labels, compression_ratio, object_object_graphs = build_clustered_network(
+        df, group_col, student_col, object1_col, object2_col, attr_col, pruning, layout, number_cluster, cache_key, progress)
+    # Convert NetworkX graphs to JSON serializable format
+    serializable_graphs = {}
+    for comm_id, graph in object_object_graphs.items():
+        serializable_graphs[comm_id] = nx.node_link_data(graph, edges="links")
+    return {
+        "elements": cy_from_graph(nx_G, pos, elements_format),
+        "cluster_labels": cluster_labels,
+        "compression_ratio": compression_ratio,
+        "object_object_graphs": serializable_graphs,
+        "significant_edges": significant_edges
+    }
+
+def object_network_response(graph_data: dict, community_id: str, object1_col: str, layout: str):
+    """
+    Response of the /build-object-network endpoint: the Cytoscape elements of the object-object graph of a
+    community, given as node-link data.
+    """
+    G = nx.node_link_graph(graph_data, edges="links")
+    if len(G.nodes()) == 0:
+        return {"elements": [], "community_id": community_id}
+
+    # Set attributes for nodes based on bipartite attribute
+    for node, attrs in G.nodes(data=True):
+        node_str = str(node)
+        bipartite_value = str(attrs.get('bipartite', ''))
+        if object1_col in bipartite_value:
+            G.nodes[node]['color'] = 'blue' if node_str != 'NA' else 'black'
+            G.nodes[node]['type'] = 'object1'
+        else:
+            G.nodes[node]['color'] = 'green' if node_str != 'NA' else 'black'
+            G.nodes[node]['type'] = 'object2'
+
+    if layout == 'spring':
+        pos = nx.spring_layout(G, k=0.3)
     elif layout == 'circular':
-        pos = nx.circular_layout(nx_G)
+        pos = nx.circular_layout(G)
+    elif layout == 'bipartite':
+        object1_nodes = [n for n, d in G.nodes(data=True) if d.get('type') == 'object1']
+        if object1_nodes:
+            pos = nx.bipartite_layout(G, object1_nodes, align='vertical', scale=1.5, aspect_ratio=0.7)
+        else:
+            pos = nx.spring_layout(G, k=0.3)
     else:
-        pos = pos_custom
-    
-    return nx_G, pos, G_edges_ordered, cluster_labels, compression_ratio, object_object_graphs
+        pos = nx.spring_layout(G, k=0.3)
+
+    elements = cy_elements_from_graph(G, pos)
+    return {
+        "elements": elements,
+        "community_id": community_id
+    }
+
+def quantity_diversity_response(df: pd.DataFrame, student_col: str, object1_col: str, object2_col: str, attr_col: str, group_col: str, cache_key=None):
+    """
+    Response of the /quantity-diversity endpoint: the quantity and diversity of the student nodes.
+    """
+    # the tripartite graph is only used without attribute column
+    B = hina_graph(df, group_col, student_col, object1_col, object2_col if attr_col is None else None, attr_col, cache_key)
+    return quantity_diversity_results(B, attr_col, group_col)
+
+def quantity_diversity_results(B: nx.Graph, attr_col: str, group_col: str):
+    """
+    Quantity and diversity of the student nodes of B, with the tuple keys converted for JSON serialization.
+    """
+    # Get all quantities
+    quantity_results, _ = quantity(B, attr=attr_col, group=group_col, return_type='all')
+    # Get diversity
+    diversity_results, _ = diversity(B, attr=attr_col)
+
+    response = {
+        "quantity": quantity_results.get('quantity', {}),
+        "normalized_quantity": quantity_results.get('normalized_quantity', {}),
+        "diversity": diversity_results
+    }
+    # Convert tuple keys to string for JSON serialization
+    if 'quantity_by_category' in quantity_results:
+        category_dict = {}
+        for (node, category), value in quantity_results['quantity_by_category'].items():
+            if node not in category_dict:
+                category_dict[node] = {}
+            category_dict[node][str(category)] = value
+        response["quantity_by_category"] = category_dict
+
+    if 'normalized_quantity_by_group' in quantity_results:
+        response["normalized_quantity_by_group"] = quantity_results['normalized_quantity_by_group']
+
+    return convert_numpy_scalars(response)
+
+ANALYSIS_OUTPUTS = ['elements', 'significant_edges', 'clusters', 'object_graphs', 'quantity', 'diversity']
+
+def analyze(df: pd.DataFrame, group_col: str, group: str, student_col: str, object1_col: str, object2_col: str, attr_col: str, pruning, layout: str, number_cluster=None, outputs=None, cache_key=None, progress=None, elements_format='elements', aggregate=None):
+    """
+    Response of the /analyze endpoint: the requested subset of ANALYSIS_OUTPUTS (all by default) from a single
+    build of the graph of df.
+
+    The network outputs are those of /build-cluster-network (on the whole dataset) when 'clusters' or 'object_graphs'
+    are requested, else those of /build-hina-network (on the selected group). The node-level outputs are those of
+    /quantity-diversity. The graph of the whole dataset is built once and reused from the 'graph' stage cache by
+    the network outputs (unless they are restricted to a group), then the network and the node-level outputs are
+    computed concurrently. With `aggregate`, the network outputs are those of the aggregated network, with its parts.
+    """
+    outputs = ANALYSIS_OUTPUTS if outputs is None else list(outputs)
+    unknown = set(outputs) - set(ANALYSIS_OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown outputs {sorted(unknown)}, expected some of {ANALYSIS_OUTPUTS}")
+    clustered = 'clusters' in outputs or 'object_graphs' in outputs
+    network_outputs = {'elements', 'significant_edges', 'clusters', 'object_graphs'} & set(outputs)
+    node_outputs = {'quantity', 'diversity'} & set(outputs)
+
+    if cache_key is None:
+        cache_key = dataset_key(df)
+    B = hina_graph(df, group_col, student_col, object1_col, object2_col if attr_col is None else None, attr_col, cache_key)
+
+    def network():
+        if clustered:
+            return cluster_network_response(df, group_col, student_col, object1_col, object2_col, attr_col, pruning, layout,
+                                            number_cluster, cache_key, progress, elements_format, aggregate)
+        return hina_network_response(df, group_col, group, student_col, object1_col, object2_col, attr_col, pruning, layout, cache_key,
+                                     elements_format, aggregate)
+
+    response = {}
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # the branch runs in the context of the request, so that its stages are recorded for it
+        network_future = executor.submit(contextvars.copy_context().run, network) if network_outputs else None
+        node_response = quantity_diversity_results(B, attr_col, group_col) if node_outputs else {}
+        network_response = network_future.result() if network_future is not None else {}
 
+    if 'elements' in outputs:
+        response["elements"] = network_response["elements"]
+        if aggregate is not None:
+            response["aggregate"] = network_response["aggregate"]
+            response["parts"] = network_response["parts"]
+    if 'significant_edges' in outputs:
+        response["significant_edges"] = network_response["significant_edges"]
+    if 'clusters' in outputs:
+        response["cluster_labels"] = network_response["cluster_labels"]
+        response["compression_ratio"] = network_response["compression_ratio"]
+    if 'object_graphs' in outputs:
+        response["object_object_graphs"] = network_response["object_object_graphs"]
+    if 'quantity' in outputs:
+        for key in ["quantity", "normalized_quantity", "quantity_by_category", "normalized_quantity_by_group"]:
+            if key in node_response:
+                response[key] = node_response[key]
+    if 'diversity' in outputs:
+        response["diversity"] = node_response["diversity"]
+    return response
@@ -0,0 +1,185 @@
+import os
+import gzip
+import json
+import zlib
+import struct
+import numpy as np
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from hina.app.api.metrics import stage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than COMPRESS_MIN_BYTES are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+# Decimals of the positions in columnar JSON responses (in pixels)
+POSITION_DECIMALS = 2
+
+# Number of nodes or edges per line of streamed responses
+STREAM_CHUNK_SIZE = int(os.environ.get('HINA_STREAM_CHUNK_SIZE', 5000))
+
+BINARY_MEDIA_TYPE = "application/vnd.hina.columns"
+
+def negotiate_encoding(accept_encoding: str, codings: list = None) -> str:
+    """
+    Content coding of a response for the Accept-Encoding header of its request: the first accepted of
+    `codings` ('br' if the brotli package is installed, then 'gzip' by default), else 'identity'. Codings
+    with q=0 are refused.
+    """
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    if codings is None:
+        codings = (["br"] if brotli is not None else []) + ["gzip"]
+    for coding in codings:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return "identity"
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+def _json_columns(value):
+    if isinstance(value, np.ndarray):
+        if value.dtype.kind == "f":
+            value = value.astype(np.float64)
+            # integer weights are written as integers
+            if np.array_equal(value, np.round(value)):
+                return value.astype(np.int64).tolist()
+            return np.round(value, POSITION_DECIMALS).tolist()
+        return value.tolist()
+    if isinstance(value, dict):
+        return {key: _json_columns(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_columns(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def encode_json(response: dict) -> bytes:
+    """
+    Compact JSON of a response whose arrays are written as lists (floats rounded to POSITION_DECIMALS).
+    """
+    return json.dumps(_json_columns(response), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def encode_binary(response: dict) -> bytes:
+    """
+    Binary form of a response: the little-endian uint32 length of a JSON header, the header (the response with
+    each array replaced by its {"dtype", "offset", "length"}), padded with spaces to a multiple of 8 bytes, then
+    the arrays, each at an offset (from the end of the header) aligned to 8 bytes so they can be viewed as typed
+    arrays without copies.
+    """
+    buffers = []
+    offset = 0
+
+    def replace(value):
+        nonlocal offset
+        if isinstance(value, np.ndarray):
+            data = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder("<")).tobytes()
+            descriptor = {"dtype": value.dtype.name, "offset": offset, "length": len(value)}
+            padding = -len(data) % 8
+            buffers.append(data + b"\0" * padding)
+            offset += len(data) + padding
+            return descriptor
+        if isinstance(value, dict):
+            return {key: replace(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [replace(item) for item in value]
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+
+    header = json.dumps(replace(response), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    header += b" " * (-(4 + len(header)) % 8)
+    return b"".join([struct.pack("<I", len(header)), header] + buffers)
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, POSITION_DECIMALS)
+
+def ndjson_lines(response: dict, chunk_size: int = None):
+    """
+    Lines of the NDJSON form of a columnar response: {"nodes": [...]} lines of at most `chunk_size` Cytoscape
+    node elements, then {"edges": [...]} lines of edge elements, and finally a {"metrics": {...}} line with the
+    other outputs. The response is complete (and cached) before the first line, but the elements of each line
+    are only generated from its arrays when the line is sent, so only one chunk of elements exists at a time.
+    """
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    columns = response["elements"]
+    nodes, edges = columns["nodes"], columns["edges"]
+    ids = nodes["id"]
+    for start in range(0, len(ids), chunk_size):
+        stop = start + chunk_size
+        chunk = [{"data": {"id": node, "label": node, "color": columns["node_colors"][color], "type": columns["node_types"][node_type]},
+                  "position": {"x": _number(x), "y": _number(y)}}
+                 for node, x, y, node_type, color in zip(ids[start:stop], nodes["x"][start:stop], nodes["y"][start:stop],
+                                                         nodes["type"][start:stop].tolist(), nodes["color"][start:stop].tolist())]
+        if "members" in nodes:
+            for element, members in zip(chunk, nodes["members"][start:stop].tolist()):
+                if members:
+                    element["data"]["members"] = members
+        yield json.dumps({"nodes": chunk}, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+    for start in range(0, len(edges["source"]), chunk_size):
+        stop = start + chunk_size
+        chunk = []
+        for source, target, weight in zip(edges["source"][start:stop].tolist(), edges["target"][start:stop].tolist(), edges["weight"][start:stop]):
+            weight = _number(weight)
+            chunk.append({"data": {"source": ids[source], "target": ids[target], "weight": weight, "label": str(weight)}})
+        yield json.dumps({"edges": chunk}, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+    metrics = {key: value for key, value in response.items() if key != "elements"}
+    yield encode_json({"metrics": metrics}) + b"\n"
+
+def _gzip_lines(lines):
+    # each line is flushed, so that the client can decode it as soon as it arrives
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    for line in lines:
+        yield compressor.compress(line) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+def columnar(response: dict) -> bool:
+    return isinstance(response, dict) and isinstance(response.get("elements"), dict)
+
+def encode_response(response, elements_format: str = "columnar", accept_encoding: str = None):
+    """
+    The HTTP response of a columnar endpoint response: compact JSON ('columnar'), binary form ('binary') or
+    streamed NDJSON ('ndjson'), compressed as negotiated with the Accept-Encoding header (streams are only
+    gzipped). Other responses are serialized as FastAPI would, so that the 'serialize' stage is timed for all.
+    """
+    if not columnar(response):
+        with stage("serialize"):
+            return JSONResponse(jsonable_encoder(response))
+    headers = {"Vary": "Accept-Encoding"}
+    if elements_format == "ndjson":
+        lines = ndjson_lines(response)
+        if negotiate_encoding(accept_encoding, ["gzip"]) == "gzip":
+            lines = _gzip_lines(lines)
+            headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(lines, media_type="application/x-ndjson", headers=headers)
+    binary = elements_format == "binary"
+    with stage("serialize"):
+        body = encode_binary(response) if binary else encode_json(response)
+        encoding = negotiate_encoding(accept_encoding) if len(body) >= COMPRESS_MIN_BYTES else "identity"
+        if encoding != "identity":
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=BINARY_MEDIA_TYPE if binary else "application/json", headers=headers)
@@ -25,11 +25,86 @@ interface ClusterLabelsData {
   	[node: string]: string;
 }
 
+interface ColumnSchema {
+	name: string;
+	dtype: string;
+	unique: number;
+	values?: string[];
+}
+
+// Schema and preview of an upload, returned by /upload instead of the whole dataset
+interface UploadSummary {
+	rows: number;
+	schema: ColumnSchema[];
+	preview: { columns: string[]; data: any[][] };
+}
+
 type SortConfig = { key: string; direction: "asc" | "desc" } | null;
 
+// Networks of more students are shown by community (or group), whose super-nodes are expanded on demand
+const LOD_STUDENTS = 2000;
+
+// Network elements as parallel arrays, returned with elements_format=columnar
+interface ElementColumns {
+	nodes: { id: string[]; x: number[]; y: number[]; type: number[]; color: number[]; members?: number[] };
+	node_types: string[];
+	node_colors: string[];
+	edges: { source: number[]; target: number[]; weight: number[] };
+}
+
+// Expand the columns into Cytoscape elements (node labels are their ids, edge labels their weights)
+const elementsFromColumns = (columns: ElementColumns) => {
+	const { nodes, edges } = columns;
+	const elements: any[] = nodes.id.map((id, i) => ({
+		data: {
+			id, label: id, color: columns.node_colors[nodes.color[i]], type: columns.node_types[nodes.type[i]],
+			// super-nodes of aggregated networks
+			...(nodes.members?.[i] ? { members: nodes.members[i] } : {}),
+		},
+		position: { x: nodes.x[i], y: nodes.y[i] },
+	}));
+	edges.source.forEach((source, i) => {
+		elements.push({
+			data: { source: nodes.id[source], target: nodes.id[edges.target[i]], weight: edges.weight[i], label: String(edges.weight[i]) },
+		});
+	});
+	return elements;
+};
+
+// Post params to an endpoint streaming NDJSON ({"nodes"}, {"edges"} then {"metrics"} lines), calling onLine
+// with each line of elements as it arrives, and return the metrics
+const streamNdjson = async (url: string, params: URLSearchParams, onLine: (line: any) => void) => {
+	const res = await fetch(`${axios.defaults.baseURL ?? ""}${url}`, { method: "POST", body: params });
+	if (!res.ok || !res.body) {
+		const detail = await res.json().then((data) => data.detail).catch(() => res.statusText);
+		throw new Error(detail);
+	}
+	const reader = res.body.pipeThrough(new TextDecoderStream()).getReader();
+	let buffer = "";
+	let metrics: any = null;
+	while (true) {
+		const { done, value } = await reader.read();
+		if (done) break;
+		buffer += value;
+		const lines = buffer.split("\n");
+		buffer = lines.pop() ?? "";
+		for (const line of lines.filter((line) => line.trim())) {
+			const parsed = JSON.parse(line);
+			if (parsed.metrics) {
+				metrics = parsed.metrics;
+			} else {
+				onLine(parsed);
+			}
+		}
+	}
+	if (metrics === null) throw new Error("Incomplete network stream");
+	return metrics;
+};
+
 export function useNetworkData() {
     // Basic state
-    const [uploadedData, setUploadedData] = useState<string | null>(null);
+    const [uploadedData, setUploadedData] = useState<UploadSummary | null>(null);
+    const [uploadId, setUploadId] = useState<string | null>(null);
     const [initialRenderDone, setInitialRenderDone] = useState(false);
     const [columns, setColumns] = useState<string[]>([]);
     const [elements, setElements] = useState<any[]>([]);
@@ -233,7 +308,11 @@ export function useNetworkData() {
 			showSuccessNotification("File Uploaded", `Successfully uploaded ${file.name}`);
 
 			const newColumns = res.data.columns;
-			const newData = res.data.data;
+			const newData: UploadSummary = {
+				rows: res.data.rows,
+				schema: res.data.schema,
+				preview: res.data.preview,
+			};
 			setElements([]);
 			setCurrentNetworkView(null);
 			setGroups(["All"]);
@@ -282,6 +361,7 @@ export function useNetworkData() {
 			setClusterSortConfig(null);
 			
 			setColumns(newColumns);
+			setUploadId(res.data.upload_id);
 			setUploadedData(newData);
 		} catch (error) {
 			console.error("Error during file upload:", error);
@@ -340,37 +420,32 @@ export function useNetworkData() {
 		}
 	};
 
-    const updateGroups = (data: string, groupColumn: string) => {
+    const updateGroups = (data: UploadSummary, groupColumn: string) => {
         if (!data || groupColumn === "none") {
             setGroups(["All"]);
             return;
         }
-        try {
-            const df = JSON.parse(data);
-            const columnValues = df.data.map((row: any, index: number) => {
-                const colIndex = df.columns.indexOf(groupColumn);
-                return colIndex >= 0 ? String(row[colIndex]) : undefined;
-            }).filter((value: any) => {
-                if (value === undefined) return false;                
-                if (value === "" || 
-                    value === "null" || 
-                    value === "undefined" || 
-                    value === "NA" ||
-                    value === "na" ||
-                    value === "N/A" ||
-                    value === "n/a") {
-                    return false;
-                }
-                
-                return true;
-            });
-            const uniqueValues = [...new Set(columnValues)];
-            const groupOptions: string[] = ["All", ...uniqueValues.filter((g: string) => g !== "All")];
-            setGroups(groupOptions);
-        } catch (error) {
-            console.error("Error updating groups:", error);
+        // The values are listed in the schema for the columns with few distinct values
+        const column = data.schema.find((col) => col.name === groupColumn);
+        if (!column || !column.values) {
             setGroups(["All"]);
+            return;
         }
+        const columnValues = column.values.filter((value: string) => {
+            if (value === "" || 
+                value === "null" || 
+                value === "undefined" || 
+                value === "NA" ||
+                value === "na" ||
+                value === "N/A" ||
+                value === "n/a") {
+                return false;
+            }
+            return true;
+        });
+        const uniqueValues = [...new Set(columnValues)];
+        const groupOptions: string[] = ["All", ...uniqueValues.filter((g: string) => g !== "All")];
+        setGroups(groupOptions);
     };
 
 	// Save network visualization
@@ -385,6 +460,47 @@ export function useNetworkData() {
 		document.body.removeChild(link);
 	};
 
+	// Submit a long analysis as a job and poll it until its result is ready, so it outlives the proxy and browser timeouts
+	const runJob = async (url: string, params: URLSearchParams) => {
+		const job = await axios.post(url, params);
+		while (true) {
+			const status = await axios.get(`/jobs/${job.data.job_id}`);
+			if (status.data.status === "done") {
+				return axios.get(`/jobs/${job.data.job_id}/result`);
+			}
+			if (status.data.status === "failed" || status.data.status === "cancelled") {
+				throw new Error(status.data.error ?? `Job ${status.data.status}`);
+			}
+			await new Promise((resolve) => setTimeout(resolve, 1000));
+		}
+	};
+
+	// Parameters of the last aggregated network, to expand its super-nodes
+	const lodParamsRef = useRef<URLSearchParams | null>(null);
+
+	const studentCount = () => uploadedData?.schema.find((column) => column.name === student)?.unique ?? 0;
+
+	// Replace a super-node of an aggregated network by its members and their edges
+	const expandPart = async (superNodeId: string) => {
+		if (!lodParamsRef.current) return;
+		const params = new URLSearchParams(lodParamsRef.current);
+		params.set("part", superNodeId.slice(superNodeId.indexOf(":") + 1));
+		params.set("elements_format", "columnar");
+		try {
+			const res = await axios.post("/expand", params);
+			const expanded = elementsFromColumns(res.data.elements);
+			setElements((current) => {
+				const ids = new Set(current.filter((el) => !el.data.source).map((el) => el.data.id));
+				return current
+					.filter((el) => el.data.id !== superNodeId && el.data.source !== superNodeId && el.data.target !== superNodeId)
+					.concat(expanded.filter((el) => el.data.source || !ids.has(el.data.id)));
+			});
+		} catch (error) {
+			console.error("Error expanding super-node:", error);
+			showAPIErrorNotification("Network Error", `Failed to expand ${superNodeId}: ${error.response?.data?.detail || error.message}`);
+		}
+	};
+
 	// Get the fixDeg value based on the selected option
 	const getFixDegValue = () => {
 		let fixDegValue = fixDeg;
@@ -407,7 +523,7 @@ export function useNetworkData() {
 		const params = new URLSearchParams();
 		const fixDegValue = getFixDegValue();
 
-		params.append("data", uploadedData);
+		params.append("upload_id", uploadId ?? "");
 		params.append("group_col", groupCol); 
 		params.append("group", group);
 		params.append("student_col", student);  
@@ -418,22 +534,34 @@ export function useNetworkData() {
 		params.append("alpha", alpha.toString());
 		params.append("fix_deg", fixDegValue);
 		params.append("layout", layout);  
+		// The network and the node-level metrics come from a single graph build
+		params.append("outputs", "elements,significant_edges,quantity,diversity");
+		// Streamed so that the nodes are rendered before the edges and the metrics arrive
+		params.append("elements_format", "ndjson");
+		const aggregate = studentCount() > LOD_STUDENTS && groupCol !== "none" ? "group" : "";
+		params.append("aggregate", aggregate);
+		lodParamsRef.current = aggregate ? new URLSearchParams(params) : null;
 
 		try {
             setLoading(true);
             setNodeLevelLoading(true); 
             setDyadicLoading(true); 
             
-            const res = await axios.post("/build-hina-network", params);
-            setElements(res.data.elements);
+            let streamedElements: any[] = [];
             setCurrentNetworkView('hina');
-            if (res.data.significant_edges) {
-                setDyadicAnalysis(res.data.significant_edges);
-                showSuccessNotification("Dyadic Analysis", `Identified ${res.data.significant_edges.length} significant edges in the network`);
+            const metrics = await streamNdjson("/analyze", params, (line) => {
+                streamedElements = streamedElements.concat(line.nodes ?? line.edges ?? []);
+                setElements(streamedElements);
+            });
+            if (metrics.significant_edges) {
+                setDyadicAnalysis(metrics.significant_edges);
+                showSuccessNotification("Dyadic Analysis", `Identified ${metrics.significant_edges.length} significant edges in the network`);
             } else {
                 setDyadicAnalysis(null);
             }
-            fetchQuantityAndDiversity();
+            const { significant_edges, ...nodeLevel } = metrics;
+            setQdData(nodeLevel);
+            showSuccessNotification("Node-Level", "Quantity and diversity metrics calculated successfully");
             showSuccessNotification("Network Updated", "HINA network has been successfully built");
             setLoading(false);
             setNodeLevelLoading(false); 
@@ -465,7 +593,7 @@ export function useNetworkData() {
 		const params = new URLSearchParams();
 		const fixDegValue = getFixDegValue();
 
-		params.append("data", uploadedData);
+		params.append("upload_id", uploadId ?? "");
 		params.append("group", group);
 		params.append("student_col", student);  
 		params.append("object1_col", object1);  
@@ -475,14 +603,25 @@ export function useNetworkData() {
 		params.append("alpha", alpha.toString());
 		params.append("fix_deg", fixDegValue);
 		params.append("layout", layout);
+		params.append("elements_format", "columnar");
+		const aggregate = studentCount() > LOD_STUDENTS ? "community" : "";
+		params.append("aggregate", aggregate);
+		if (aggregate) {
+			// the clustered network is built on all groups
+			lodParamsRef.current = new URLSearchParams(params);
+			lodParamsRef.current.set("group", "All");
+		} else {
+			lodParamsRef.current = null;
+		}
 		try {
             setLoading(true);
             setNodeLevelLoading(true);
             setDyadicLoading(true);
             setClusterLoading(true);
-            const res = await axios.post("/build-cluster-network", params);
-            originalElementsRef.current = [...res.data.elements];
-            setElements(res.data.elements);
+            const res = await runJob("/jobs/cluster-network", params);
+            const clusteredElements = elementsFromColumns(res.data.elements);
+            originalElementsRef.current = [...clusteredElements];
+            setElements(clusteredElements);
             setCurrentNetworkView('cluster');
 		if (res.data.cluster_labels) {
 			setClusterLabels(res.data.cluster_labels);
@@ -542,7 +681,7 @@ export function useNetworkData() {
             const params = new URLSearchParams();
             const fixDegValue = getFixDegValue();
 
-            params.append("data", uploadedData);
+            params.append("upload_id", uploadId ?? "");
             params.append("group", group);
             params.append("student_col", student);  
             params.append("object1_col", object1);  
@@ -692,7 +831,7 @@ export function useNetworkData() {
 	const fetchQuantityAndDiversity = async () => {
 		if (!uploadedData) return;
 		const params = new URLSearchParams();
-		params.append("data", uploadedData);
+		params.append("upload_id", uploadId ?? "");
 		params.append("student_col", student);
 		params.append("object1_col", object1);
 		params.append("object2_col", object2);
@@ -831,7 +970,7 @@ export function useNetworkData() {
 		if (uploadedData) {
             const isTripartite = object2 !== "none" && object2 !== "";
             const params = new URLSearchParams();
-            params.append("data", uploadedData);
+            params.append("upload_id", uploadId ?? "");
             params.append("group_col", groupCol); 
             params.append("group", newValue);  
             params.append("student_col", student);  
@@ -1165,6 +1304,17 @@ export function useNetworkData() {
     }, [elements, highlightedNodeId, studentNodeSize, objectNodeSize, object1NodeSize, object2NodeSize]);
 
 
+	// Expand the super-nodes of aggregated networks on double tap
+	useEffect(() => {
+		if (!cyRef.current) return;
+		const cy = cyRef.current;
+		const handleExpand = (evt: any) => expandPart(evt.target.id());
+		cy.on("dbltap", "node[members]", handleExpand);
+		return () => {
+			cy.removeListener("dbltap", "node[members]", handleExpand);
+		};
+	}, [elements]);
+
 	// Node highlighting animation
 	useEffect(() => {
 		if (!cyRef.current || highlightedNodeId === null) return;
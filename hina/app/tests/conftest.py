@@ -4,7 +4,14 @@ import networkx as nx
 import base64
 import io
 import os
+import tempfile
 from fastapi.testclient import TestClient
+# Run the analysis in threads, so that the tests can inspect the stage caches of the server
+os.environ.setdefault("HINA_EXECUTOR", "thread")
+# and keep the parsed uploads of the tests out of the shared upload cache
+os.environ.setdefault("HINA_UPLOAD_CACHE_DIR", tempfile.mkdtemp(prefix="hina-test-uploads-"))
+# and out of the store shared by the server workers
+os.environ.setdefault("HINA_SHARED_DIR", tempfile.mkdtemp(prefix="hina-test-shared-"))
 from hina.app.api.api import app
 
 # Define paths to sample datasets
@@ -36,6 +43,11 @@ def sample_df():
     sample = sample[list(column_mapping.keys())].rename(columns=column_mapping)
     return sample
 
+@pytest.fixture
+def synthetic_df():
+    # The whole synthetic dataset, for the tests comparing implementations on more than a few rows
+    return pd.read_csv(SYNTHETIC_CSV_PATH)
+
 @pytest.fixture
 def sample_csv():
     # Read from synthetic data and convert to CSV in memory
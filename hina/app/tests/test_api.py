@@ -13,7 +13,7 @@ def test_upload_file(client, sample_csv):
     assert response.status_code == 200
     data = response.json()
     assert "columns" in data
-    assert "data" in data
+    assert "data" not in data
     assert "upload_id" in data
     assert "timestamp" in data
     assert "filename" in data
@@ -21,6 +21,25 @@ def test_upload_file(client, sample_csv):
     # Check columns names
     assert set(data["columns"]) >= {"student", "object1", "object2", "group", "attr"}, "Expected columns missing"
 
+    # Check the schema and preview returned instead of the dataset
+    assert data["rows"] == 4
+    assert [column["name"] for column in data["schema"]] == data["columns"]
+    group = next(column for column in data["schema"] if column["name"] == "group")
+    assert group["unique"] == len(group["values"])
+    assert data["preview"]["columns"] == data["columns"]
+    assert len(data["preview"]["data"]) == 4
+
+def test_upload_limits(client, sample_csv, sample_xlsx, monkeypatch):
+    # Test that xlsx files are parsed, and that files over the size limit or in other formats are refused
+    response = client.post("/upload", files={"file": ("test.xlsx", sample_xlsx, "application/octet-stream")})
+    assert response.status_code == 200
+    assert response.json()["rows"] == 4
+
+    from hina.app.api import api
+    monkeypatch.setattr(api, "UPLOAD_MAX_BYTES", 10)
+    response = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")})
+    assert response.status_code == 413
+
 def test_build_hina_network_endpoint(client, sample_csv):
     # Test building HINA network endpoint
     # Upload the file
@@ -35,7 +54,7 @@ def test_build_hina_network_endpoint(client, sample_csv):
         response = client.post(
             "/build-hina-network",
             data={
-                "data": upload_data["data"],
+                "upload_id": upload_data["upload_id"],
                 "group_col": "group",
                 "group": "Group 1",
                 "student_col": "student",
@@ -56,7 +75,7 @@ def test_build_hina_network_endpoint(client, sample_csv):
     response = client.post(
         "/build-hina-network",
         data={
-            "data": upload_data["data"],
+            "upload_id": upload_data["upload_id"],
             "group_col": "group",
             "group": "Group 1",
             "student_col": "student",
@@ -69,7 +88,7 @@ def test_build_hina_network_endpoint(client, sample_csv):
             "layout": 'test'  # Invalid layout
         }
     )
-    assert response.status_code == 200
+    assert response.status_code == 422
 
 def test_build_cluster_network_endpoint(client, sample_csv):
     # Test building clustered network endpoint
@@ -85,7 +104,7 @@ def test_build_cluster_network_endpoint(client, sample_csv):
         response = client.post(
             "/build-cluster-network",
             data={
-                "data": upload_data["data"],
+                "upload_id": upload_data["upload_id"],
                 "group_col": "group",
                 "student_col": "student",
                 "object1_col": "object1",
@@ -119,7 +138,7 @@ def test_build_object_network_endpoint(client, sample_csv):
     cluster_response = client.post(
         "/build-cluster-network",
         data={
-            "data": upload_data["data"],
+            "upload_id": upload_data["upload_id"],
             "group_col": "group",
             "student_col": "student",
             "object1_col": "object1",
@@ -160,6 +179,46 @@ def test_build_object_network_endpoint(client, sample_csv):
         assert "elements" in data
         assert "community_id" in data
 
+def test_endpoints_with_upload_id(client, sample_csv):
+    # Test that the endpoints accept the upload_id of a stored dataset in place of the data
+    upload_data = client.post(
+        "/upload",
+        files={"file": ("test.csv", sample_csv, "text/csv")}
+    ).json()
+    params = {
+        "group_col": "group",
+        "group": "All",
+        "student_col": "student",
+        "object1_col": "object1",
+        "object2_col": "",
+        "attr_col": "attr",
+        "pruning": "none",
+        "layout": "bipartite",
+        "number_cluster": "2"
+    }
+    sample_csv.seek(0)
+    by_data = client.post("/build-hina-network", data={**params, "data": pd.read_csv(sample_csv).to_json(orient="split")}).json()
+    by_id = client.post("/build-hina-network", data={**params, "upload_id": upload_data["upload_id"]}).json()
+    assert by_id["significant_edges"] == by_data["significant_edges"]
+    assert len(by_id["elements"]) == len(by_data["elements"])
+
+    response = client.post("/build-cluster-network", data={**params, "upload_id": upload_data["upload_id"]})
+    assert response.status_code == 200
+    assert "cluster_labels" in response.json()
+
+    response = client.post("/quantity-diversity", data={**params, "object2_col": "object2", "upload_id": upload_data["upload_id"]})
+    assert response.status_code == 200
+    assert "quantity" in response.json()
+
+    response = client.post("/build-hina-network", data={**params, "upload_id": "expired"})
+    assert response.status_code == 404
+    response = client.post("/build-hina-network", data=params)
+    assert response.status_code == 422
+    # a failing analysis is answered with an error rather than a null body
+    for path in ["/build-hina-network", "/build-cluster-network", "/quantity-diversity"]:
+        response = client.post(path, data={**params, "object2_col": "object2", "student_col": "missing", "upload_id": upload_data["upload_id"]})
+        assert response.status_code == 500 and response.json()["detail"]
+
 def test_quantity_diversity_endpoint(client, sample_csv):
     # Test quantity and diversity endpoint
     # Upload the file
@@ -169,16 +228,11 @@ def test_quantity_diversity_endpoint(client, sample_csv):
     )
     upload_data = upload_response.json()
     
-    # Parse data from upload response
-    data_list = upload_data["data"]
-    if isinstance(data_list, str):
-        data_list = json.loads(data_list)
-    
     # Now get quantity and diversity
     response = client.post(
         "/quantity-diversity",
         data={
-            "data": upload_data["data"],
+            "upload_id": upload_data["upload_id"],
             "student_col": "student",
             "object1_col": "object1",
             "object2_col": "object2",
@@ -196,7 +250,7 @@ def test_quantity_diversity_endpoint(client, sample_csv):
     response = client.post(
         "/quantity-diversity",
         data={
-            "data": upload_data["data"],
+            "upload_id": upload_data["upload_id"],
             "student_col": "student",
             "object1_col": "object1",
             "object2_col": "object2",
@@ -210,5 +264,81 @@ def test_quantity_diversity_endpoint(client, sample_csv):
     assert "normalized_quantity" in data
     assert "diversity" in data
 
+def test_analyze_endpoint(client, sample_csv):
+    # The combined endpoint answers as the separate ones, from a single graph build
+    from hina.app.api.cache import results
+    upload_id = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")}).json()["upload_id"]
+    params = {
+        "upload_id": upload_id,
+        "group_col": "group",
+        "group": "All",
+        "student_col": "student",
+        "object1_col": "object1",
+        "object2_col": "none",
+        "attr_col": "none",
+        "pruning": "none",
+        "layout": "bipartite"
+    }
+    results.clear()
+    response = client.post("/analyze", data={**params, "outputs": "elements,significant_edges,quantity,diversity"})
+    assert response.status_code == 200
+    data = response.json()
+    assert results.misses['graph'] == 1
+    assert set(data) == {"elements", "significant_edges", "quantity", "normalized_quantity", "normalized_quantity_by_group", "diversity"}
+    network = client.post("/build-hina-network", data=params).json()
+    assert data["elements"] == network["elements"]
+    assert data["significant_edges"] == network["significant_edges"]
+    node_level = client.post("/quantity-diversity", data={key: params[key] for key in ["upload_id", "student_col", "object1_col", "object2_col", "attr_col", "group_col"]}).json()
+    assert {key: data[key] for key in node_level} == node_level
+
+    # Clusters and object graphs come with the clustered network
+    response = client.post("/analyze", data=params)
+    assert response.status_code == 200
+    data = response.json()
+    clustered = client.post("/build-cluster-network", data=params).json()
+    # the positions of the clustered layout are random
+    assert [element["data"] for element in data["elements"]] == [element["data"] for element in clustered["elements"]]
+    for key in ["cluster_labels", "compression_ratio", "object_object_graphs", "significant_edges"]:
+        assert data[key] == clustered[key]
+    assert "diversity" in data
+
+    response = client.post("/analyze", data={**params, "outputs": "elements,centrality"})
+    assert response.status_code == 422
+
+def test_aggregated_network_endpoints(client, sample_csv):
+    # Level-of-detail networks collapse the students of each community into a super-node, expanded on demand
+    upload_id = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")}).json()["upload_id"]
+    params = {
+        "upload_id": upload_id,
+        "group_col": "group",
+        "group": "All",
+        "student_col": "student",
+        "object1_col": "object1",
+        "object2_col": "none",
+        "pruning": "none",
+        "layout": "bipartite",
+        "aggregate": "community"
+    }
+    response = client.post("/build-cluster-network", data=params)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["aggregate"] == "community"
+    super_nodes = [e["data"] for e in data["elements"] if e["data"].get("type") == "community"]
+    assert {node["id"]: node["members"] for node in super_nodes} == {f"community:{part}": members for part, members in data["parts"].items()}
+    assert sum(data["parts"].values()) == len(data["cluster_labels"])
+    assert not any(e["data"].get("type") == "student" for e in data["elements"])
+
+    part = super_nodes[0]["id"].split(":", 1)[1]
+    response = client.post("/expand", data={**params, "part": part})
+    assert response.status_code == 200
+    members = [e["data"]["id"] for e in response.json()["elements"] if e["data"].get("type") == "student"]
+    assert sorted(members) == sorted(node for node, label in data["cluster_labels"].items() if label == part)
+    assert client.post("/expand", data={**params, "part": "no such community"}).status_code == 404
+    assert client.post("/build-hina-network", data={**params, "aggregate": "school"}).status_code == 422
+
+    response = client.post("/build-hina-network", data={**params, "aggregate": "group"})
+    assert response.status_code == 200
+    assert response.json()["aggregate"] == "group"
+
 if __name__ == "__main__":
     pytest.main()
\ No newline at end of file
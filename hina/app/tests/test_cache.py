@@ -0,0 +1,54 @@
+import pytest
+from hina.app.api.cache import ResultCache, dataset_key, pruning_key
+from hina.app.api import utils
+
+def test_result_cache_lru():
+    # Test that each stage is bounded and None keys bypass the cache
+    cache = ResultCache({'graph': 2})
+    calls = []
+    def compute(value):
+        calls.append(value)
+        return value
+    assert cache.get_or_compute('graph', 'a', lambda: compute(1)) == 1
+    assert cache.get_or_compute('graph', 'a', lambda: compute(2)) == 1
+    cache.get_or_compute('graph', 'b', lambda: compute(3))
+    cache.get_or_compute('graph', 'c', lambda: compute(4))
+    assert cache.size('graph') == 2
+    assert cache.get_or_compute('graph', 'a', lambda: compute(5)) == 5
+    assert cache.get_or_compute('graph', None, lambda: compute(6)) == 6
+    assert calls == [1, 3, 4, 5, 6]
+    assert cache.hits['graph'] == 1 and cache.misses['graph'] == 4
+    cache.clear()
+    assert cache.size('graph') == 0
+
+def test_cache_keys(sample_df):
+    # Test that equal datasets and equivalent parameters share their keys
+    assert dataset_key(sample_df) == dataset_key(sample_df.copy())
+    assert dataset_key(sample_df) != dataset_key(sample_df.iloc[::-1])
+    assert pruning_key({'fix_deg': '', 'alpha': '0.05'}) == pruning_key({'fix_deg': None, 'alpha': 0.05})
+    assert pruning_key('none') != pruning_key('default')
+
+def test_response_cache(client, sample_csv):
+    # Test that an identical request is answered from the response cache
+    utils.results.clear()
+    upload_id = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")}).json()["upload_id"]
+    params = {
+        "upload_id": upload_id,
+        "group_col": "group",
+        "student_col": "student",
+        "object1_col": "object1",
+        "object2_col": "",
+        "attr_col": "attr",
+        "pruning": "none",
+        "layout": "bipartite",
+        "number_cluster": "2"
+    }
+    first = client.post("/build-cluster-network", data=params).json()
+    second = client.post("/build-cluster-network", data=params).json()
+    assert first == second
+    assert utils.results.hits['response'] == 1
+    assert utils.results.misses['clustering'] == 1
+
+    client.post("/build-cluster-network", data={**params, "layout": "circular"})
+    assert utils.results.misses['response'] == 2
+    assert utils.results.hits['clustering'] == 1
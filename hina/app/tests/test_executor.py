@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import textwrap
+import subprocess
+import pytest
+from fastapi import HTTPException
+from hina.app.api import utils
+from hina.app.api.executor import ComputePool
+
+def test_compute_pool_kinds(sample_df):
+    # Test that every kind of pool returns the result of the function
+    args = (sample_df, 'student', 'object1', 'object2', None, 'group')
+    expected = utils.quantity_diversity_response(*args)
+    for kind in ['inline', 'thread', 'process']:
+        pool = ComputePool(kind, workers=1)
+        try:
+            assert asyncio.run(pool.run(utils.quantity_diversity_response, *args)) == expected
+        finally:
+            pool.shutdown()
+    with pytest.raises(ValueError):
+        ComputePool('gpu')
+
+def dataset_worker(df, label):
+    return os.getpid(), len(df), label
+
+def test_compute_pool_datasets(sample_df):
+    # Test that the calls on a dataset run in the same worker process, which reuses the DataFrame it holds
+    pool = ComputePool('process', workers=2)
+    async def main():
+        first = await pool.run(dataset_worker, df=sample_df, label=1, dataset='a')
+        second = await pool.run(dataset_worker, df=sample_df.head(0), label=2, dataset='a')
+        # a worker which no longer holds the dataset is sent the DataFrame again
+        index = hash('b') % pool.workers
+        pool._held[index]['b'] = True
+        third = await pool.run(dataset_worker, df=sample_df, label=3, dataset='b')
+        return first, second, third
+    try:
+        first, second, third = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert first == (second[0], len(sample_df), 1)
+    # the held DataFrame is used, not the one passed again
+    assert second[1:] == (len(sample_df), 2)
+    assert third[1:] == (len(sample_df), 3)
+
+def test_compute_pool_timeout():
+    # Test that a request exceeding its timeout is answered with a 504 without blocking the event loop
+    pool = ComputePool('thread', workers=1, timeout=0.1)
+    async def light():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        return time.perf_counter() - start
+    async def main():
+        return await asyncio.gather(pool.run(time.sleep, 1), light(), return_exceptions=True)
+    try:
+        error, latency = asyncio.run(main())
+    finally:
+        pool.shutdown(wait=False)
+    assert isinstance(error, HTTPException) and error.status_code == 504
+    assert latency < 0.5
+
+def test_compute_pool_timeout_cancels_queued():
+    # Test that a call still queued when its request times out is cancelled, while the running one completes
+    pool = ComputePool('thread', workers=1)
+    calls = []
+    async def main():
+        running = asyncio.ensure_future(pool.run(time.sleep, 0.3))
+        await asyncio.sleep(0.05)
+        with pytest.raises(HTTPException):
+            await pool.run(calls.append, 'queued', timeout=0.05)
+        await running
+    try:
+        asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert calls == []
+
+def test_api_with_process_pool(sample_csv, tmp_path):
+    # Test that a server started with HINA_EXECUTOR=process gives the same responses as with the thread pool
+    params = {
+        "group_col": "group",
+        "group": "All",
+        "student_col": "student",
+        "object1_col": "object1",
+        "object2_col": "object2",
+        "attr_col": "attr",
+        "pruning": "none",
+        "layout": "bipartite",
+        "number_cluster": "2"
+    }
+    script = textwrap.dedent("""
+        import os, sys, json
+        from fastapi.testclient import TestClient
+        from hina.app.api.api import app, pool
+        assert pool.kind == os.environ["HINA_EXECUTOR"]
+        params = json.loads(sys.argv[1])
+        with TestClient(app) as client:
+            params["upload_id"] = client.post("/upload", files={"file": ("test.csv", sys.stdin.buffer.read(), "text/csv")}).json()["upload_id"]
+            print(json.dumps([client.post(path, data=params).json() for path in ["/build-hina-network", "/build-cluster-network"]]))
+    """)
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    outputs = []
+    for kind in ["process", "thread"]:
+        # the servers share a hash seed, so that both order the nodes of the graphs alike
+        env = {**os.environ, "HINA_EXECUTOR": kind, "HINA_WORKERS": "1", "PYTHONHASHSEED": "0",
+               "PYTHONPATH": os.pathsep.join([root, os.environ.get("PYTHONPATH", "")]),
+               "HINA_UPLOAD_CACHE_DIR": str(tmp_path / kind / "uploads"), "HINA_SHARED_DIR": str(tmp_path / kind / "shared")}
+        process = subprocess.run([sys.executable, "-c", script, json.dumps(params)], input=sample_csv.getvalue(), env=env,
+                                 capture_output=True, timeout=300)
+        assert process.returncode == 0, process.stderr.decode()
+        # the last line, after the output printed by the pipeline
+        outputs.append(json.loads(process.stdout.splitlines()[-1]))
+    (network, clusters), (expected_network, expected_clusters) = outputs
+    assert network == expected_network
+    # the layout of the clustered network is not seeded
+    assert [element["data"] for element in clusters.pop("elements")] == [element["data"] for element in expected_clusters.pop("elements")]
+    assert "cluster_labels" in clusters and clusters == expected_clusters
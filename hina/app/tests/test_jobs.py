@@ -0,0 +1,66 @@
+import time
+import asyncio
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from hina.app.api.api import app
+from hina.app.api.executor import ComputePool
+from hina.app.api.jobs import JobManager
+
+def slow_clustering(n_merges, delay, progress=None):
+    for B in range(n_merges, 0, -1):
+        time.sleep(delay)
+        progress(B, n_merges + 1)
+    return {"merges": n_merges}
+
+def test_cluster_network_job(sample_csv):
+    # Test that a submitted job reports its progress and returns the same result as the blocking endpoint
+    with TestClient(app) as client:
+        upload_id = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")}).json()["upload_id"]
+        params = {
+            "upload_id": upload_id,
+            "group_col": "group",
+            "student_col": "student",
+            "object1_col": "object1",
+            "object2_col": "",
+            "attr_col": "attr",
+            "pruning": "none",
+            "layout": "circular",
+            "number_cluster": "2"
+        }
+        job = client.post("/jobs/cluster-network", data=params).json()
+        assert job["status"] in ["queued", "running", "done"]
+        for _ in range(100):
+            status = client.get(f"/jobs/{job['job_id']}").json()
+            if status["status"] not in ["queued", "running"]:
+                break
+            time.sleep(0.05)
+        assert status["status"] == "done" and status["progress"] == 1.0
+        result = client.get(f"/jobs/{job['job_id']}/result").json()
+        assert result == client.post("/build-cluster-network", data=params).json()
+
+        # the result is now cached, so a new job is done right away
+        assert client.post("/jobs/cluster-network", data=params).json()["status"] == "done"
+        assert client.get("/jobs/unknown").status_code == 404
+
+def test_job_cancellation_and_queue_size():
+    # Test that a running job stops at its next merge once cancelled, and that the queue is bounded
+    async def main():
+        jobs = JobManager(ComputePool('thread', workers=1), max_jobs=2)
+        running = await jobs.submit('test', slow_clustering, n_merges=200, delay=0.01)
+        queued = await jobs.submit('test', slow_clustering, n_merges=1, delay=0)
+        with pytest.raises(HTTPException) as error:
+            await jobs.submit('test', slow_clustering, n_merges=1, delay=0)
+        assert error.value.status_code == 429
+        await asyncio.sleep(0.2)
+        status = jobs.status(running.job_id)
+        assert status["status"] == "running" and 0 < status["progress"] < 1
+        assert jobs.cancel(running.job_id)["status"] == "cancelled"
+        with pytest.raises(HTTPException) as error:
+            jobs.result(running.job_id)
+        assert error.value.status_code == 409
+        await asyncio.sleep(0.2)
+        assert jobs.status(queued.job_id)["status"] == "done"
+        assert jobs.result(queued.job_id) == {"merges": 1}
+        jobs.pool.shutdown()
+    asyncio.run(main())
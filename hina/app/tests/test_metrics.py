@@ -0,0 +1,74 @@
+import json
+import re
+import pytest
+from hina.app.api import metrics
+from hina.app.api.cache import results
+from hina.app.api.metrics import Histogram, stage
+
+def sample(text, name, **labels):
+    # Value of a sample in the text exposition format, or None if it is absent
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = "^" + re.escape(name + (f"{{{label_text}}}" if labels else "")) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return None if match is None else float(match.group(1))
+
+def test_histogram_render():
+    # Test that the buckets are cumulative and end with +Inf, with the sum and count of the observations
+    histogram = Histogram("test_seconds", "Test durations.", (0.1, 1), ["stage"])
+    for value in [0.05, 0.5, 5]:
+        histogram.observe(value, "graph")
+    text = "\n".join(histogram.render())
+    assert "# TYPE test_seconds histogram" in text
+    assert sample(text, "test_seconds_bucket", stage="graph", le="0.1") == 1
+    assert sample(text, "test_seconds_bucket", stage="graph", le="1") == 2
+    assert sample(text, "test_seconds_bucket", stage="graph", le="+Inf") == 3
+    assert sample(text, "test_seconds_sum", stage="graph") == pytest.approx(5.55)
+    assert sample(text, "test_seconds_count", stage="graph") == 3
+
+def test_stage_records_request():
+    # Test that a stage is observed and recorded for the current request, also when it raises
+    records = []
+    token = metrics._request_records.set(records)
+    try:
+        with pytest.raises(ValueError):
+            with stage("layout"):
+                raise ValueError
+    finally:
+        metrics._request_records.reset(token)
+    assert [(kind, name) for kind, name, _ in records] == [("stage", "layout")]
+
+def test_metrics_endpoint(client, sample_csv, monkeypatch):
+    # Test that a build request is counted, timed per stage and logged, and exposed on /metrics
+    lines = []
+    monkeypatch.setattr(metrics.logger, "info", lines.append)
+    results.clear()
+    upload_id = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")}).json()["upload_id"]
+    before = sample(client.get("/metrics").text, "hina_requests_total", method="POST", path="/build-hina-network", status="200") or 0
+    response = client.post("/build-hina-network", data={
+        "upload_id": upload_id,
+        "group_col": "group",
+        "group": "All",
+        "student_col": "student",
+        "object1_col": "object1",
+        "object2_col": "object2",
+        "pruning": "none",
+        "layout": "spring"
+    })
+    assert response.status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert sample(text, "hina_requests_total", method="POST", path="/build-hina-network", status="200") == before + 1
+    for name in ["graph", "layout", "elements", "serialize"]:
+        assert sample(text, "hina_stage_duration_seconds_count", stage=name) >= 1
+    assert sample(text, "hina_graph_size_count", kind="nodes") >= 1
+    assert sample(text, "hina_cache_lookups_total", stage="graph", result="miss") >= 1
+    assert sample(text, "hina_datasets") >= 1
+    assert sample(text, "hina_jobs", state="active") is not None
+
+    log = json.loads(lines[-1])
+    assert log["path"] == "/build-hina-network" and log["status"] == 200
+    assert {"graph", "layout", "elements", "serialize"} <= set(log["stages_ms"])
+    assert log["graph"]["nodes"] > 0 and log["response_bytes"] > 0
@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import pytest
+from fastapi import HTTPException
+from hina.app.api import api
+from hina.app.api.cache import ResultCache
+from hina.app.api.executor import ComputePool
+from hina.app.api.jobs import JobManager
+from hina.app.api.shared import SharedStore, private_directory
+from hina.app.api.store import DatasetStore
+
+def slow_clustering(n_merges, delay, progress=None):
+    for B in range(n_merges, 0, -1):
+        time.sleep(delay)
+        progress(B, n_merges + 1)
+    return {"merges": n_merges}
+
+def test_shared_store(tmp_path):
+    # Test that values are shared between instances, expire after their ttl and are evicted beyond max_bytes
+    store = SharedStore('test', str(tmp_path))
+    store[("cluster", "abc", 2)] = {"labels": [1, 2]}
+    assert SharedStore('test', str(tmp_path)).get(("cluster", "abc", 2)) == {"labels": [1, 2]}
+    assert ("cluster", "abc", 3) not in store and SharedStore('other', str(tmp_path)).get(("cluster", "abc", 2)) is None
+    assert store.pop(("cluster", "abc", 2)) == {"labels": [1, 2]} and ("cluster", "abc", 2) not in store
+
+    expiring = SharedStore('test', str(tmp_path), ttl=60)
+    expiring['old'] = 1
+    path = expiring._path('old')
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    assert expiring.get('old') is None and not os.path.exists(path)
+
+    small = SharedStore('test', str(tmp_path), max_bytes=2000)
+    for i in range(5):
+        small[i] = b"x" * 500
+        os.utime(small._path(i), (time.time() - 10 + i, time.time() - 10 + i))
+    assert 0 not in small and 4 in small
+    # a full namespace only evicts its own values
+    jobs = SharedStore('jobs', str(tmp_path), max_bytes=2000)
+    jobs['job'] = {"status": "running"}
+    for i in range(5):
+        small[i] = b"x" * 500
+    assert jobs.get('job') == {"status": "running"}
+    assert SharedStore('test', '').get(4) is None
+
+def test_shared_store_private_directory(tmp_path):
+    # Test that the store creates its directory for the current user only, and refuses a directory others can access
+    store = SharedStore('test', str(tmp_path / 'shared'))
+    store['key'] = 1
+    assert os.stat(tmp_path / 'shared').st_mode & 0o777 == 0o700
+    assert os.stat(os.path.dirname(store._path('key'))).st_mode & 0o777 == 0o700
+    os.chmod(tmp_path / 'shared', 0o777)
+    with pytest.raises(PermissionError):
+        SharedStore('test', str(tmp_path / 'shared'))
+    if os.getuid() == 0:
+        os.chmod(tmp_path / 'shared', 0o700)
+        os.chown(tmp_path / 'shared', 12345, -1)
+        with pytest.raises(PermissionError):
+            private_directory(str(tmp_path / 'shared'))
+
+def test_result_cache_shared_between_workers(tmp_path):
+    # Test that a worker reuses the responses of another, but not the stages kept in memory
+    first = ResultCache(shared_stages=['response'], shared_dir=str(tmp_path))
+    second = ResultCache(shared_stages=['response'], shared_dir=str(tmp_path))
+    first.put('response', ('hina', 'abc'), {"elements": []})
+    first.put('graph', 'abc', 'graph')
+    assert second.lookup('response', ('hina', 'abc')) == (True, {"elements": []})
+    assert second.lookup('graph', 'abc') == (False, None)
+    assert second.hits['response'] == 1 and second.size('response') == 1
+    first.clear('response')
+    assert ResultCache(shared_stages=['response'], shared_dir=str(tmp_path)).lookup('response', ('hina', 'abc')) == (False, None)
+
+def test_jobs_shared_between_workers(tmp_path):
+    # Test that a job submitted to one worker can be polled, cancelled and fetched from another
+    async def main():
+        store = SharedStore('jobs', str(tmp_path))
+        owner = JobManager(ComputePool('thread', workers=1), shared=store)
+        other = JobManager(ComputePool('thread', workers=1), shared=SharedStore('jobs', str(tmp_path)))
+        done = await owner.submit('test', slow_clustering, n_merges=2, delay=0)
+        running = await owner.submit('test', slow_clustering, n_merges=200, delay=0.01)
+        await asyncio.sleep(0.3)
+        assert other.status(done.job_id)["status"] == "done"
+        assert other.result(done.job_id) == {"merges": 2}
+        status = other.status(running.job_id)
+        assert status["status"] == "running" and 0 < status["progress"] < 1
+        assert other.cancel(running.job_id)["status"] == "cancelled"
+        await asyncio.sleep(0.1)
+        assert running.cancelled and other.status(running.job_id)["status"] == "cancelled"
+
+        # the records of expired jobs are removed by the worker reading them
+        expired = JobManager(ComputePool('thread', workers=1), ttl=0, shared=SharedStore('jobs', str(tmp_path)))
+        with pytest.raises(HTTPException) as error:
+            expired.status(done.job_id)
+        assert error.value.status_code == 404
+        assert (done.job_id, 'job') not in store and (done.job_id, 'result') not in store
+        owner.shutdown()
+        other.shutdown()
+    asyncio.run(main())
+
+def test_upload_from_another_worker(client, sample_csv, monkeypatch):
+    # Test that an upload_id received by another worker is loaded from the upload cache
+    upload_id = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")}).json()["upload_id"]
+    params = {
+        "upload_id": upload_id,
+        "group_col": "group",
+        "group": "All",
+        "student_col": "student",
+        "object1_col": "object1",
+        "object2_col": "object2",
+        "pruning": "none",
+        "layout": "bipartite"
+    }
+    expected = client.post("/build-hina-network", data=params).json()
+    monkeypatch.setattr(api, "datasets", DatasetStore())
+    response = client.post("/build-hina-network", data=params)
+    assert response.status_code == 200
+    assert response.json() == expected
+    assert upload_id in api.datasets
+    monkeypatch.setattr(api, "datasets", DatasetStore())
+    monkeypatch.setattr(api, "uploads", SharedStore('uploads', ''))
+    assert client.post("/build-hina-network", data=params).status_code == 404
@@ -0,0 +1,60 @@
+import pytest
+import time
+import numpy as np
+import pandas as pd
+from hina.construction import get_bipartite
+from hina.app.api.store import DatasetStore
+
+def test_dataset_store_get_returns_copy():
+	# Test that callers cannot modify the stored dataset
+	store = DatasetStore()
+	store.put('a', pd.DataFrame({'student': ['Alice', 'Bob']}))
+	df = store.get('a')
+	df['student'] = 'Charlie'
+	assert store.get('a')['student'].tolist() == ['Alice', 'Bob']
+	assert store.get('missing') is None
+
+def test_dataset_store_get_shares_data():
+	# Test that the dataset is not copied on each access, and that building a network leaves it untouched
+	store = DatasetStore()
+	store.put('a', pd.DataFrame({'student': ['Alice', 'Bob', 'Bob'], 'object': ['ask', None, 'answer'], 'x': [1.0, 2.0, 3.0]}))
+	assert np.shares_memory(store.get('a')['x'].to_numpy(), store.get('a')['x'].to_numpy())
+	get_bipartite(store.get('a'), 'student', 'object')
+	assert store.get('a')['object'].isna().tolist() == [False, True, False]
+
+	# modifying a returned DataFrame in place copies the modified columns only
+	df = store.get('a')
+	df['x'] = 0.0
+	df.loc[0, 'student'] = 'Eve'
+	df.iloc[1, 1] = 'ask'
+	df['x'] += 1
+	pd.testing.assert_frame_equal(store.get('a'), pd.DataFrame({'student': ['Alice', 'Bob', 'Bob'], 'object': ['ask', None, 'answer'], 'x': [1.0, 2.0, 3.0]}))
+	assert int(pd.__version__.split('.')[0]) >= 3 or pd.options.mode.copy_on_write
+
+def test_dataset_store_eviction():
+	# Test the least recently used eviction beyond the size bound
+	store = DatasetStore(max_items=2)
+	for upload_id in ['a', 'b']:
+		store.put(upload_id, pd.DataFrame({'x': [1]}))
+	store.get('a')
+	store.put('c', pd.DataFrame({'x': [1]}))
+	assert 'a' in store and 'c' in store and 'b' not in store
+	assert len(store) == 2
+
+	# The byte bound always keeps the most recent dataset
+	store = DatasetStore(max_bytes=1)
+	store.put('a', pd.DataFrame({'x': [1]}))
+	store.put('b', pd.DataFrame({'x': [1]}))
+	assert 'b' in store and 'a' not in store
+
+def test_dataset_store_ttl():
+	# Test that datasets expire when unused for longer than the time to live
+	store = DatasetStore(ttl=0.05)
+	store.put('a', pd.DataFrame({'x': [1]}))
+	assert 'a' in store
+	time.sleep(0.1)
+	assert 'a' not in store
+	assert store.get('a') is None
+
+if __name__ == "__main__":
+	pytest.main()
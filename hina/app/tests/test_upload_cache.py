@@ -0,0 +1,71 @@
+import os
+import json
+import pytest
+import numpy as np
+import pandas as pd
+from hina.app.api import api
+from hina.app.api.upload_cache import UploadCache, file_key
+
+def test_upload_cache_round_trip(tmp_path, sample_df):
+    # Test that every kind of column is restored identically
+    df = sample_df.copy()
+    df['count'] = np.arange(len(df))
+    df['score'] = [0.5, np.nan, 1.5, 2.0]
+    df['flag'] = [True, False, True, False]
+    df['date'] = pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-03', '2024-01-04'])
+    df['note'] = pd.Series(['a', np.nan, 'b', 'a'], dtype=object)
+    df['mixed'] = pd.Series([1, 'x', 2.5, 'y'], dtype=object)
+    df['level'] = df['attr'].astype('category')
+    cache = UploadCache(str(tmp_path))
+    assert cache.load('key') is None
+    cache.save('key', df, 'content')
+    loaded, content = cache.load('key')
+    pd.testing.assert_frame_equal(loaded, df)
+    assert content == 'content'
+
+    # other indexes are saved as a column too, and nothing is pickled
+    cache.save('other', df.set_index('student'))
+    pd.testing.assert_frame_equal(cache.load('other')[0], df.set_index('student'))
+    assert cache.hits == 2 and cache.misses == 1
+    assert not [name for name in os.listdir(tmp_path / 'key') + os.listdir(tmp_path / 'other') if name.endswith('.pkl')]
+    assert os.stat(tmp_path).st_mode & 0o777 == 0o700
+
+def test_upload_cache_never_unpickles(tmp_path, sample_df):
+    # Test that DataFrames which cannot be saved without pickle are not cached, and pickled entries are not loaded
+    cache = UploadCache(str(tmp_path))
+    df = sample_df.copy()
+    df['objects'] = pd.Series([{'a': 1}, None, [1], 'b'], dtype=object)
+    cache.save('objects', df)
+    assert cache.load('objects') is None and not os.path.exists(tmp_path / 'objects')
+
+    os.makedirs(tmp_path / 'planted')
+    sample_df.to_pickle(tmp_path / 'planted' / 'frame.pkl')
+    with open(tmp_path / 'planted' / 'meta.json', 'w') as f:
+        json.dump({'rows': len(sample_df), 'format': 'pickle'}, f)
+    assert cache.load('planted') is None
+    os.chmod(tmp_path, 0o755)
+    with pytest.raises(PermissionError):
+        UploadCache(str(tmp_path))
+
+def test_upload_cache_eviction(tmp_path, sample_df):
+    # Test that the least recently used entries are removed beyond the size limit
+    cache = UploadCache(str(tmp_path), max_bytes=1)
+    cache.save('first', sample_df)
+    os.utime(tmp_path / 'first', (0, 0))
+    cache.save('second', sample_df)
+    assert cache.load('first') is None
+    assert cache.load('second') is not None
+    assert UploadCache('').load('second') is None
+
+def test_upload_reuses_parsed_file(client, sample_csv):
+    # Test that uploading the same bytes again loads the parsed DataFrame from the cache
+    key = file_key(sample_csv, "test.csv")
+    assert file_key(sample_csv, "test.xlsx") != key
+    hits = api.upload_cache.hits
+    first = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")}).json()
+    sample_csv.seek(0)
+    second = client.post("/upload", files={"file": ("again.csv", sample_csv, "text/csv")}).json()
+    assert api.upload_cache.hits >= hits + 1
+    assert second["schema"] == first["schema"]
+    assert second["preview"] == first["preview"]
+    pd.testing.assert_frame_equal(api.datasets.get(first["upload_id"]), api.datasets.get(second["upload_id"]))
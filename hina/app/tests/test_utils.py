@@ -22,6 +22,14 @@ def test_parse_excel_contents(sample_xlsx):
 	assert len(df) > 0
 	assert len(df.columns) > 0
 
+def test_read_upload(sample_csv, sample_df, monkeypatch):
+	# Test that parsing a CSV file in chunks gives the same DataFrame
+	monkeypatch.setattr(utils, 'CSV_CHUNK_ROWS', 3)
+	df = utils.read_upload(sample_csv, "test.csv")
+	pd.testing.assert_frame_equal(df, sample_df)
+	with pytest.raises(ValueError):
+		utils.read_upload(sample_csv, "test.txt")
+
 
 def test_build_hina_network(sample_df):
 	# Test building a HINA network
@@ -110,6 +118,85 @@ def test_build_clustered_network(sample_df):
 	assert isinstance(compression_ratio, float)
 	assert isinstance(object_object_graphs, dict)
 
+def test_build_clustered_network_reuses_clustering(sample_df):
+	# Test that changing only number_cluster or the layout reuses the cached stages
+	utils.results.clear()
+	kwargs = dict(df=sample_df, group_col='group', student_col='student', object1_col='object1',
+				  object2_col=None, attr_col='attr', pruning='none', cache_key='sample')
+	_, _, _, labels_best, ratio_best, _ = utils.build_clustered_network(**kwargs, layout='bipartite', number_cluster=None)
+	assert utils.results.size('clustering') == 1
+	assert utils.results.misses['clustering'] == 1
+
+	_, _, _, labels_one, ratio_one, _ = utils.build_clustered_network(**kwargs, layout='spring', number_cluster="1")
+	assert utils.results.size('clustering') == 1
+	assert utils.results.hits['clustering'] == 1
+	assert utils.results.hits['network'] == 1
+	assert len(set(labels_one.values())) == 1
+
+	# a different pruning builds a new network but reuses the constructed graph
+	utils.build_clustered_network(**{**kwargs, 'pruning': {'fix_deg': 'student', 'alpha': 0.05}}, layout='bipartite')
+	assert utils.results.size('network') == 2
+	assert utils.results.hits['graph'] == 1
+
+def reference_node_type(node, df, student_col, object1_col, object2_col):
+	# Node classification of the former per-node implementation
+	parts = node.split("**")
+	if object2_col is not None and len(parts) == 2 and parts[0] in df[object1_col].astype(str).values and parts[1] in df[object2_col].astype(str).values:
+		return 'object1_object2'
+	if node in df[student_col].astype(str).values:
+		return 'student'
+	if node in df[object1_col].astype(str).values:
+		return 'object1'
+	return 'unknown'
+
+def reference_order_edge(u, v, df, student_col, object_col):
+	# Copy of the former utils.order_edge, which ordered each edge on its own
+	u_str = str(u)
+	v_str = str(v)
+	student_nodes = set(df[student_col].astype(str).values)
+	object_nodes = set(df[object_col].astype(str).values)
+	if u_str in student_nodes and v_str in object_nodes:
+		return (u_str, v_str)
+	elif u_str in object_nodes and v_str in student_nodes:
+		return (v_str, u_str)
+	else:
+		return tuple(sorted([u_str, v_str]))
+
+def reference_orientation(u, v, df, student_col, object1_col, tripartite, joint_nodes):
+	# Edge orientation of the former per-edge implementation without pruning
+	students = set(df[student_col].astype(str))
+	objects = joint_nodes if tripartite else set(df[object1_col].astype(str))
+	u, v = reference_order_edge(u, v, df, student_col, object1_col)
+	if u in students and (v in objects or "**" in v):
+		return (u, v)
+	if v in students and (u in objects or "**" in u):
+		return (v, u)
+	return (u, v)
+
+@pytest.mark.parametrize("object2_col, attr_col", [(None, None), (None, 'task'), ('code 3', None)])
+def test_construct_network_matches_reference(synthetic_df, object2_col, attr_col):
+	# Test that the bulk node classification and edge orientation give the same network as the former per-node scans
+	df = synthetic_df
+	for pruning in ['none', {'fix_deg': 'student id', 'alpha': 0.05}]:
+		G, edges = utils.construct_network(df, 'group', 'student id', 'code 2', object2_col, attr_col, pruning)
+		joint_nodes = set(node for node in G.nodes() if "**" in node)
+		for node, attrs in G.nodes(data=True):
+			assert attrs['type'] == reference_node_type(node, df, 'student id', 'code 2', object2_col)
+			assert attrs['color'] == utils.NODE_TYPE_COLORS[attrs['type']]
+		if pruning == 'none':
+			assert [edge[:2] for edge in edges] == [reference_orientation(u, v, df, 'student id', 'code 2', object2_col is not None, joint_nodes) for u, v, _ in edges]
+		assert all(G.nodes[u]['type'] == 'student' for u, _, _ in edges)
+		assert set((u, v) for u, v, _ in edges) == set(G.edges())
+		assert all(G[u][v]['weight'] == w for u, v, w in edges)
+
+def test_orient_edges():
+	# Test the three ways of orienting the edges matching neither orientation
+	edges = [('s1', 'o1', 1), ('o2', 's2', 2), ('b', 'a', 3)]
+	assert utils._orient_edges(edges, {'s1', 's2'}, {'o1', 'o2'}) == [('s1', 'o1', 1), ('s2', 'o2', 2), ('a', 'b', 3)]
+	assert utils._orient_edges(edges, {'s1', 's2'}, {'o1', 'o2'}, other='keep')[2] == ('b', 'a', 3)
+	assert utils._orient_edges(edges, {'s1', 's2'}, {'o1', 'o2'}, other='swap') == [('s1', 'o1', 1), ('s2', 'o2', 2), ('a', 'b', 3)]
+	assert utils._orient_edges([], set(), set()) == []
+
 def test_cy_elements_from_graph(sample_graph_pos):
 	# Test converting NetworkX graph to Cytoscape elements
 	G, pos = sample_graph_pos
@@ -176,5 +263,27 @@ def test_get_tripartite(sample_df):
 	combined_nodes = [n for n in T.nodes() if isinstance(n, str) and '**' in n]
 	assert len(combined_nodes) > 0
 
+def test_aggregated_network(synthetic_df):
+	# Test that the super-nodes carry the members and edge weights of their parts, and expand into them
+	df = synthetic_df.rename(columns={'student id': 'student', 'code 2': 'object1'})
+	nx_G, agg_G, partition, pos, _, _ = utils.build_aggregated_network(
+		df, 'group', 'student', 'object1', None, None, 'none', 'bipartite', 'group')
+	assert set(pos) == set(agg_G.nodes)
+	super_nodes = {n: d for n, d in agg_G.nodes(data=True) if d['type'] == 'group'}
+	assert len(super_nodes) == df['group'].nunique()
+	assert sum(d['members'] for d in super_nodes.values()) == len(partition) == df['student'].nunique()
+	assert agg_G.size(weight='weight') == nx_G.size(weight='weight')
+	for obj in set(agg_G.nodes) - set(super_nodes):
+		assert agg_G.degree(obj, weight='weight') == nx_G.degree(obj, weight='weight')
+
+	part = next(iter(super_nodes.values()))['part']
+	expanded = utils.expand_response(df, 'group', 'student', 'object1', None, None, 'none', 'bipartite', 'group', part)
+	members = [e['data']['id'] for e in expanded['elements'] if e['data'].get('type') == 'student']
+	assert sorted(members) == sorted(n for n, p in partition.items() if p == part)
+	edges = [e for e in expanded['elements'] if 'source' in e['data']]
+	assert len(edges) == len(nx_G.edges(members))
+	with pytest.raises(KeyError):
+		utils.expand_response(df, 'group', 'student', 'object1', None, None, 'none', 'bipartite', 'group', 'no such group')
+
 if __name__ == "__main__":
 	pytest.main()
\ No newline at end of file
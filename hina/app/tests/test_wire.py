@@ -0,0 +1,130 @@
+import json
+import struct
+import numpy as np
+import pytest
+from hina.app.api import utils
+from hina.app.api import wire
+from hina.app.api.wire import negotiate_encoding, encode_binary, encode_json
+
+def decode_binary(body):
+    # Decode the binary form as the frontend does, replacing the array descriptors with the arrays
+    length, = struct.unpack_from("<I", body)
+    header = json.loads(body[4:4 + length])
+    start = 4 + length
+    assert start % 8 == 0
+    def replace(value):
+        if isinstance(value, dict) and set(value) == {"dtype", "offset", "length"}:
+            assert value["offset"] % 8 == 0
+            return np.frombuffer(body, dtype=np.dtype(value["dtype"]).newbyteorder("<"), count=value["length"], offset=start + value["offset"])
+        if isinstance(value, dict):
+            return {key: replace(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [replace(item) for item in value]
+        return value
+    return replace(header)
+
+def elements_from_columns(columns):
+    # Expand the columns into Cytoscape elements, as the frontend does
+    nodes = columns["nodes"]
+    ids = nodes["id"]
+    elements = [{"data": {"id": node, "label": node, "color": columns["node_colors"][color], "type": columns["node_types"][node_type]},
+                 "position": {"x": float(x), "y": float(y)}}
+                for node, x, y, node_type, color in zip(ids, nodes["x"], nodes["y"], nodes["type"], nodes["color"])]
+    edges = columns["edges"]
+    elements += [{"data": {"source": ids[source], "target": ids[target], "weight": float(weight)}}
+                 for source, target, weight in zip(edges["source"], edges["target"], edges["weight"])]
+    return elements
+
+def without_positions(elements):
+    return [{key: value for key, value in element["data"].items() if key in ["id", "color", "source", "target", "weight"]}
+            for element in elements]
+
+def test_negotiate_encoding():
+    # Test that gzip is chosen when brotli is unavailable or refused, and that q=0 refuses a coding
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, deflate") == "identity"
+    assert negotiate_encoding("br;q=0, gzip;q=0.5") == "gzip"
+    assert negotiate_encoding("*") in ["br", "gzip"]
+    assert negotiate_encoding(None) == "identity"
+
+def test_columns_match_elements(sample_df):
+    # Test that the columns carry the elements of the network
+    nx_G, pos, _ = utils.build_hina_network(sample_df, "group", "All", "student", "object1", None, None, "none", "bipartite")
+    elements = utils.cy_elements_from_graph(nx_G, pos)
+    columns = utils.cy_columns_from_graph(nx_G, pos)
+    assert columns["edges"]["source"].dtype == np.int32 and columns["nodes"]["x"].dtype == np.float32
+    assert without_positions(elements_from_columns(columns)) == without_positions(elements)
+    for decoded in [decode_binary(encode_binary({"elements": columns})), json.loads(encode_json({"elements": columns}))]:
+        expanded = elements_from_columns(decoded["elements"])
+        assert without_positions(expanded) == without_positions(elements)
+        for element, expected in zip(expanded, elements):
+            if "position" in expected:
+                assert element["position"]["x"] == pytest.approx(expected["position"]["x"], abs=0.01)
+                assert element["position"]["y"] == pytest.approx(expected["position"]["y"], abs=0.01)
+
+def test_elements_formats(client, sample_csv, monkeypatch):
+    # Test the columnar and binary responses of the endpoints against their default elements
+    monkeypatch.setattr(wire, "COMPRESS_MIN_BYTES", 0)
+    upload_id = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")}).json()["upload_id"]
+    params = {
+        "upload_id": upload_id,
+        "group_col": "group",
+        "group": "All",
+        "student_col": "student",
+        "object1_col": "object1",
+        "object2_col": "object2",
+        "pruning": "none",
+        "layout": "spring"
+    }
+    elements = client.post("/build-hina-network", data=params).json()["elements"]
+    response = client.post("/build-hina-network", data={**params, "elements_format": "columnar"})
+    assert response.status_code == 200
+    assert without_positions(elements_from_columns(response.json()["elements"])) == without_positions(elements)
+    response = client.post("/build-hina-network", data={**params, "elements_format": "binary"}, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"] == "application/vnd.hina.columns"
+    assert without_positions(elements_from_columns(decode_binary(response.content)["elements"])) == without_positions(elements)
+    assert client.post("/build-hina-network", data={**params, "elements_format": "protobuf"}).status_code == 422
+
+def test_ndjson_lines_lazy(sample_df):
+    # Test that the elements of a chunk are only built when its line is requested
+    class Columns(dict):
+        accessed = []
+        def __getitem__(self, key):
+            self.accessed.append(key)
+            return super().__getitem__(key)
+    nx_G, pos, _ = utils.build_hina_network(sample_df, "group", "All", "student", "object1", None, None, "none", "bipartite")
+    columns = utils.cy_columns_from_graph(nx_G, pos)
+    columns["edges"] = Columns(columns["edges"])
+    lines = wire.ndjson_lines({"elements": columns}, chunk_size=2)
+    assert len(json.loads(next(lines))["nodes"]) == 2
+    assert Columns.accessed == []
+    assert any("edges" in json.loads(line) for line in lines)
+    assert "weight" in Columns.accessed
+
+def test_ndjson_stream(client, sample_csv, monkeypatch):
+    # Test that the stream carries the nodes, then the edges, then the other outputs in chunks
+    monkeypatch.setattr(wire, "STREAM_CHUNK_SIZE", 3)
+    upload_id = client.post("/upload", files={"file": ("test.csv", sample_csv, "text/csv")}).json()["upload_id"]
+    params = {
+        "upload_id": upload_id,
+        "group_col": "group",
+        "student_col": "student",
+        "object1_col": "object1",
+        "object2_col": "none",
+        "pruning": "none",
+        "layout": "bipartite",
+        "outputs": "elements,significant_edges,quantity,diversity"
+    }
+    expected = client.post("/analyze", data=params).json()
+    for accept_encoding in ["identity", "gzip"]:
+        response = client.post("/analyze", data={**params, "elements_format": "ndjson"}, headers={"Accept-Encoding": accept_encoding})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        kinds = [next(iter(line)) for line in lines]
+        assert kinds == sorted(kinds, key=["nodes", "edges", "metrics"].index) and kinds[-1] == "metrics"
+        assert all(len(line.get("nodes", line.get("edges", []))) <= 3 for line in lines)
+        elements = [element for line in lines for element in line.get("nodes", []) + line.get("edges", [])]
+        assert without_positions(elements) == without_positions(expected["elements"])
+        assert lines[-1]["metrics"] == {key: value for key, value in expected.items() if key != "elements"}
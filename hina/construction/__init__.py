@@ -1,3 +1,3 @@
-from .network_construct import get_bipartite, get_tripartite
+from .network_construct import get_bipartite, get_tripartite, get_projection
 
-__all__ = ['get_bipartite', 'get_tripartite']
\ No newline at end of file
+__all__ = ['get_bipartite', 'get_tripartite', 'get_projection']
\ No newline at end of file
@@ -1,5 +1,8 @@
 import networkx as nx 
 import pandas as pd 
+import numpy as np
+import scipy.sparse as sp
+import scipy.stats as stats
 from collections import Counter
 import warnings 
 
@@ -167,3 +170,112 @@ def get_tripartite(df,student_col,object1_col,object2_col,group_col = None):
         nx.set_node_attributes(T, {n: {group_col: student_groups[n]} for n in T.nodes if n in student_groups})
     
     return T
+
+
+
+def _top_k_mask(M, top_k):
+    """
+    Boolean sparse mask of the top_k largest entries of each row of the csr matrix M.
+    """
+    M = M.tocsr()
+    row = np.repeat(np.arange(M.shape[0]), np.diff(M.indptr))
+    order = np.lexsort((-M.data, row))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - M.indptr[row[order]]
+    keep = rank < top_k
+    return sp.csr_matrix((np.ones(keep.sum(), dtype=bool), (row[keep], M.indices[keep])), shape=M.shape)
+
+
+def get_projection(B, node_set, weighted=True, top_k=None, alpha=None, return_type='graph'):
+
+    """
+    Constructs the one-mode projection of a bipartite graph onto one of its node sets.
+
+    This function links two nodes of `node_set` (e.g. students) whenever they share a node of the other set (e.g. objects),
+    giving the weighted co-participation network of students or the co-occurrence network of objects. The projection
+    is computed as the sparse matrix product X·Xᵀ of the weighted biadjacency matrix X, which scales to graphs where
+    the networkx bipartite projection is too slow. The projection can be made sparser by keeping only the strongest
+    links of each node (`top_k`) and by a significance filter (`alpha`).
+
+    Parameters:
+    -----------
+    B : networkx.Graph
+        A bipartite graph with weighted edges, such as the output of `get_bipartite` or `get_tripartite`. Nodes are
+        expected to have a 'bipartite' attribute indicating their partition.
+    node_set : str
+        The 'bipartite' attribute of the nodes to project onto, e.g. the `student_col` or `object_col` of `get_bipartite`.
+    weighted : bool, optional
+        If True, the weight of a link between two nodes is the sum over their shared neighbors of the product of their
+        edge weights. If False, it is the number of shared neighbors. Default is True.
+    top_k : int, optional
+        If provided, only the `top_k` strongest links of each node are kept (a link is kept if it is among the
+        strongest of either of its nodes), which bounds the density of the projection. Default is None.
+    alpha : float, optional
+        If provided, only the links that are statistically significant at this level are kept. As in `prune_edges`,
+        the null model preserves the degrees of the nodes: the number of shared neighbors of two nodes with d_i and d_j
+        neighbors among the N nodes of the other set follows a hypergeometric distribution, and the link is kept if
+        the probability of observing at least as many shared neighbors is at most `alpha`. Default is None.
+    return_type : str, optional
+        'graph' to return a networkx.Graph, or 'sparse' to return the projection as a sparse matrix. Default is 'graph'.
+
+    Returns:
+    --------
+    networkx.Graph
+        If `return_type='graph'`, a weighted graph over the nodes of `node_set` (with their attributes), with an edge
+        between every pair of nodes sharing a neighbor that passes the filters.
+    dict
+        If `return_type='sparse'`, a dictionary containing the following keys:
+        - 'nodes': The list of projected nodes, in the order of the matrix rows.
+        - 'projection matrix': A symmetric scipy.sparse.csr_matrix of link weights, with a zero diagonal.
+
+    Example:
+    --------
+    >>> B = get_bipartite(df, student_col='student', object_col='object')
+    >>> S = get_projection(B, 'student', top_k=5, alpha=0.05)
+    """
+    if return_type not in ['graph', 'sparse']:
+        raise ValueError("return_type must be 'graph' or 'sparse'")
+
+    nodes = [i for i, attr in B.nodes(data=True) if attr.get('bipartite') == node_set]
+    others = [i for i, attr in B.nodes(data=True) if attr.get('bipartite') != node_set]
+    if not nodes:
+        raise ValueError(f"No nodes with bipartite attribute '{node_set}'")
+    index = {node: ind for ind, node in enumerate(nodes)}
+    index_other = {node: ind for ind, node in enumerate(others)}
+
+    # orient each edge from the projected node set to the other one
+    edges = [(i, j, w) if i in index else (j, i, w) for i, j, w in B.edges(data='weight', default=1)]
+    rows = np.array([index[e[0]] for e in edges], dtype=np.int64)
+    cols = np.array([index_other[e[1]] for e in edges], dtype=np.int64)
+    weights = np.array([e[2] for e in edges])
+    X = sp.csr_matrix((weights if weighted else np.ones(len(edges), dtype=np.int64), (rows, cols)),
+                      shape=(len(nodes), len(others)))
+
+    P = (X @ X.T).tocsr()
+    P = (sp.triu(P, k=1) + sp.tril(P, k=-1)).tocsr()
+
+    if alpha is not None:
+        X_binary = X.copy()
+        X_binary.data = np.ones_like(X_binary.data, dtype=np.int64)
+        shared = (X_binary @ X_binary.T).tocoo()
+        degs = np.asarray(X_binary.sum(axis=1)).ravel()
+        off_diagonal = shared.row != shared.col
+        i, j, s = shared.row[off_diagonal], shared.col[off_diagonal], shared.data[off_diagonal]
+        p_values = stats.hypergeom.sf(s - 1, len(others), degs[i], degs[j])
+        significant = p_values <= alpha
+        mask = sp.csr_matrix((np.ones(significant.sum(), dtype=bool), (i[significant], j[significant])), shape=P.shape)
+        P = P.multiply(mask).tocsr()
+
+    if top_k is not None:
+        mask = _top_k_mask(P, top_k)
+        P = P.multiply((mask + mask.T) > 0).tocsr()
+    P.eliminate_zeros()
+
+    if return_type == 'sparse':
+        return {'nodes': nodes, 'projection matrix': P}
+
+    G = nx.Graph()
+    G.add_nodes_from((i, B.nodes[i]) for i in nodes)
+    upper = sp.triu(P).tocoo()
+    G.add_weighted_edges_from(zip([nodes[i] for i in upper.row], [nodes[j] for j in upper.col], upper.data.tolist()))
+    return G
@@ -3,7 +3,7 @@ import pandas as pd
 import numpy as np
 import networkx as nx
 import warnings 
-from hina.construction import get_bipartite, get_tripartite
+from hina.construction import get_bipartite, get_tripartite, get_projection
 
 def test_get_bipartite():
     
@@ -122,6 +122,41 @@ def test_tripartite_edges():
 	assert (2, '123**shake') in T.edges
 	assert ('Alice', 'evaluate**NA') in T.edges  
 
+def test_get_projection():
+
+    df = pd.DataFrame({
+        'student': ['Alice', 'Alice', 'Bob', 'Bob', 'Charlie', 'Charlie', 'Dana'],
+        'object': ['ask', 'ask', 'ask', 'evaluate', 'evaluate', 'monitor', 'plan']
+    })
+    B = get_bipartite(df, 'student', 'object')
+
+    # Students linked by shared objects, weighted by the product of their edge weights
+    S = get_projection(B, 'student')
+    assert set(S.nodes) == {'Alice', 'Bob', 'Charlie', 'Dana'}
+    assert S.nodes['Alice'] == {'bipartite': 'student'}
+    assert S['Alice']['Bob']['weight'] == 2
+    assert S['Bob']['Charlie']['weight'] == 1
+    assert not S.has_edge('Alice', 'Charlie') and S.degree('Dana') == 0
+
+    # Objects linked by shared students, agreeing with the networkx projection when unweighted
+    O = get_projection(B, 'object', weighted=False)
+    expected = nx.bipartite.projected_graph(B, ['ask', 'evaluate', 'monitor', 'plan'])
+    assert set(map(frozenset, O.edges)) == set(map(frozenset, expected.edges))
+
+    # Top-k keeps the strongest link of each node
+    K = get_projection(B, 'student', top_k=1, return_type='sparse')
+    nodes, P = K['nodes'], K['projection matrix']
+    assert (P != P.T).nnz == 0
+    assert P[nodes.index('Alice'), nodes.index('Bob')] == 2
+    assert P[nodes.index('Charlie'), nodes.index('Bob')] == 1
+
+    # No pair of students shares enough objects to be significant in such a small graph
+    assert get_projection(B, 'student', alpha=0.05).number_of_edges() == 0
+    assert get_projection(B, 'student', alpha=1).number_of_edges() == S.number_of_edges()
+
+    with pytest.raises(ValueError):
+        get_projection(B, 'teacher')
+
 if __name__ == "__main__":
     pytest.main()
 
@@ -1,3 +1,5 @@
-from .clustering import hina_communities
+from .clustering import hina_communities, cut_dendrogram, CommunityResult, description_length, description_length_batch, hina_coclusters
+from .stability import community_stability, co_assignment_frequency
+from .groups import group_communities
 
-__all__ = ['hina_communities']
\ No newline at end of file
+__all__ = ['hina_communities', 'cut_dendrogram', 'CommunityResult', 'description_length', 'description_length_batch', 'hina_coclusters', 'community_stability', 'co_assignment_frequency', 'group_communities']
\ No newline at end of file
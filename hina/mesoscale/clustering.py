@@ -1,62 +1,305 @@
 import numpy as np
 from scipy.special import loggamma
+import scipy.sparse as sp
 import heapq
+import time
 import networkx as nx
 from collections import Counter
 from collections import defaultdict
+from collections.abc import Mapping
 
-def hina_communities(G,fix_B=None):
+def _logchoose(n,k):
 	"""
-	Identifies bipartite communities in a graph by optimizing a Minimum Description Length (MDL) objective.
+	log binomial coefficient, vectorized over numpy arrays
+	"""
+	return loggamma(n+1) - loggamma(k+1) - loggamma(n-k+1)
 
-	This function partitions the nodes of a bipartite graph into communities by minimizing the MDL objective,
-	which balances the complexity of the community structure with the accuracy of representing the graph.
-	The function supports fixing the number of communities (`fix_B`) and can handle tripartite networks.
+def _logmultiset(n,k):
+	"""
+	log multiset coefficient, vectorized over numpy arrays
+	"""
+	return _logchoose(n+k-1,k)
+
+def _C(B,N1,N2,W):
+	"""
+	constants in the description length (only depend on size B of partition)
+	"""
+	return np.log(N1) + _logchoose(N1-1,B-1) + loggamma(N1) + _logmultiset(N2*B,W)
+
+def _F(n,M):
+	"""
+	cluster-level terms in the description length for cluster sizes n (B,) and cluster weights M (B,N2),
+	empty clusters contribute nothing
+	"""
+	n = np.asarray(n,dtype=float)
+	M = np.asarray(M,dtype=float)
+	out = np.zeros(n.shape)
+	full = n > 0
+	nf = n[full]
+	out[full] = -loggamma(nf) + _logmultiset(nf[:,None],M[full]).sum(axis=1)
+	return out
+
+def _oriented_edges(G,node_set=None):
+	"""
+	Weighted edges (i,j,w) of G, with i in the node set clustered: the first node of each edge by default,
+	or the nodes whose 'bipartite' attribute is node_set
+	"""
+	if node_set is None:
+		return [(i,j,w['weight']) for i,j,w in G.edges(data=True)]
+	if not any(data.get('bipartite') == node_set for n,data in G.nodes(data=True)):
+		raise ValueError(f"No nodes with bipartite attribute '{node_set}'")
+	return [(i,j,w['weight']) if G.nodes[i].get('bipartite') == node_set else (j,i,w['weight']) \
+		 for i,j,w in G.edges(data=True)]
+
+def _changed_communities(G,init_partition,init_graph=None,node_set=None):
+	"""
+	Labels of the communities of init_partition that changed in G: those that lost nodes and, given the graph
+	init_graph the partition was computed on, those with a node whose edges or edge weights differ in G
+	"""
+	def profiles(graph):
+		weights = defaultdict(dict)
+		for i,j,w in _oriented_edges(graph,node_set):
+			weights[str(i)][str(j)] = w
+		return weights
+	current = profiles(G)
+	changed = set(label for i,label in init_partition.items() if str(i) not in current)
+	if init_graph is not None:
+		previous = profiles(init_graph)
+		changed |= set(label for i,label in init_partition.items() if current.get(str(i)) != previous.get(str(i)))
+	return changed
+
+def _edge_arrays(G,nodes1=None,node_set=None):
+	"""
+	Weighted edges of G as index arrays over the first (rows) and second (columns) node sets
+	"""
+	edges = [(str(i),str(j),w) for i,j,w in _oriented_edges(G,node_set)]
+	if nodes1 is None:
+		nodes1 = list(dict.fromkeys(e[0] for e in edges))
+	nodes2 = list(dict.fromkeys(e[1] for e in edges))
+	index1 = {node:ind for ind,node in enumerate(nodes1)}
+	index2 = {node:ind for ind,node in enumerate(nodes2)}
+	rows = np.array([index1[e[0]] for e in edges],dtype=np.int64)
+	cols = np.array([index2[e[1]] for e in edges],dtype=np.int64)
+	weights = np.array([e[2] for e in edges],dtype=float)
+	return list(nodes1),nodes2,rows,cols,weights
+
+def _refine_partition(X,labels,fix_B=False,max_iter=20,time_limit=None,movable=None):
+	"""
+	Kernighan-Lin style single-node moves between clusters that lower the description length.
+
+	X is the (N1,N2) sparse weight matrix and labels the initial cluster of each row. Each sweep visits every node
+	(or only the rows in movable) and moves it to the cluster with the largest decrease of the description length,
+	evaluated for all clusters at once from the cluster weight matrix. Clusters are never emptied when fix_B is True.
+	Returns the new labels, the description lengths before and after, the number of moves and of sweeps.
+	"""
+	X = sp.csr_matrix(X,dtype=float)
+	N1,N2 = X.shape
+	W = X.sum()
+	labels = np.asarray(labels,dtype=np.int64).copy()
+	B0 = int(labels.max()) + 1
+	n = np.bincount(labels,minlength=B0).astype(float)
+	P = sp.csr_matrix((np.ones(N1),(labels,np.arange(N1))),shape=(B0,N1))
+	M = (P @ X).toarray()
+
+	def add_base(r):
+		# change of F(r) when adding an empty row to cluster r, the nonzero columns are corrected per node
+		if n[r] == 0:
+			return np.inf
+		return -loggamma(n[r]+1) + loggamma(n[r]) + (_logmultiset(n[r]+1,M[r]) - _logmultiset(n[r],M[r])).sum()
+
+	B = int((n > 0).sum())
+	Fs = _F(n,M)
+	H_before = _C(B,N1,N2,W) + Fs.sum()
+	bases = np.array([add_base(r) for r in range(B0)])
+
+	start = time.perf_counter()
+	moves,sweeps,timed_out = 0,0,False
+	while sweeps < max_iter and not timed_out:
+		sweeps += 1
+		moved = 0
+		for i in (range(N1) if movable is None else movable):
+			if time_limit is not None and time.perf_counter() - start > time_limit:
+				timed_out = True
+				break
+			r = labels[i]
+			if n[r] == 1 and (fix_B or B == 1):
+				continue
+			cols = X.indices[X.indptr[i]:X.indptr[i+1]]
+			x = X.data[X.indptr[i]:X.indptr[i+1]]
+
+			# removing i from r
+			if n[r] == 1:
+				d_remove = -Fs[r] + _C(B-1,N1,N2,W) - _C(B,N1,N2,W)
+			else:
+				Mr = M[r].copy()
+				Mr[cols] -= x
+				d_remove = _F([n[r]-1],Mr[None,:])[0] - Fs[r]
+
+			# adding i to every other cluster
+			Ms = M[:,cols]
+			ns = np.maximum(n,1)[:,None]
+			d_add = bases + (_logmultiset(ns+1,Ms+x) - _logmultiset(ns+1,Ms)).sum(axis=1)
+			d_add[r] = np.inf
+			s = int(np.argmin(d_add))
+			if d_add[s] + d_remove >= -1e-10:
+				continue
+
+			M[r,cols] -= x
+			M[s,cols] += x
+			n[r] -= 1
+			n[s] += 1
+			labels[i] = s
+			if n[r] == 0:
+				B -= 1
+			Fs[[r,s]] = _F(n[[r,s]],M[[r,s]])
+			bases[r],bases[s] = add_base(r),add_base(s)
+			moved += 1
+		moves += moved
+		if moved == 0:
+			break
+
+	H_after = _C(B,N1,N2,W) + _F(n,M).sum()
+	return labels,H_before,H_after,moves,sweeps
+
+def _description_length(N1,N2,rows,cols,weights,labels):
+	"""
+	description length of the partition labels (N1,) of the first node set, from the edge index arrays
+	"""
+	_,labels = np.unique(labels,return_inverse=True)
+	B = int(labels.max()) + 1
+	n = np.bincount(labels,minlength=B)
+	M = sp.coo_matrix((weights,(labels[rows],cols)),shape=(B,N2)).toarray()
+	return B, _C(B,N1,N2,weights.sum()) + _F(n,M).sum()
+
+def description_length_batch(G,partitions):
+	"""
+	Computes the MDL objective of `hina_communities` for many partitions of the same graph.
+
+	The edge arrays of `G` are extracted once and shared by all partitions, each of which is then scored
+	in O(E + B*N2) time, where E is the number of edges, B the number of communities and N2 the size of
+	the second node set.
 
 	Parameters:
 	-----------
 	G : networkx.Graph
-		A bipartite or tripartite graph with weighted edges. Nodes must have a 'bipartite' attribute
-		indicating their partition (e.g., 'student', 'coded behaviors'). If the graph is tripartite, nodes should
-		have a 'tripartite' attribute set to `True`.
-	fix_B : int or str, optional
-		If specified, fixes the number of communities to this value. If `None`, the function automatically
-		determines the optimal number of communities. Default is `None`.
+		A bipartite or tripartite graph with weighted edges, as accepted by `hina_communities`.
+	partitions : list of dict
+		Partitions of the nodes of the first node set, each a dictionary mapping every node to a community
+		label, such as the 'node communities' returned by `hina_communities` or instructor-assigned groups.
+
+	Returns:
+	--------
+	list of dict
+		One dictionary per partition containing the following keys:
+		- 'number of communities': The number of communities in the partition.
+		- 'description length': The description length of the graph under the partition, in nats.
+		- 'naive description length': The description length with every node in its own community.
+		- 'compression ratio': The description length divided by the naive description length.
+	"""
+	nodes1,nodes2,rows,cols,weights = _edge_arrays(G)
+	N1,N2 = len(nodes1),len(nodes2)
+	H0 = _C(N1,N1,N2,weights.sum())
+
+	results = []
+	for partition in partitions:
+		partition = {str(node):label for node,label in partition.items()}
+		missing = [node for node in nodes1 if node not in partition]
+		if missing:
+			raise ValueError(f"The partition does not assign a community to {len(missing)} nodes, e.g. {missing[0]}")
+		labels = np.array([str(partition[node]) for node in nodes1])
+		B,H = _description_length(N1,N2,rows,cols,weights,labels)
+		results.append({'number of communities': B, 'description length': float(H), \
+				  'naive description length': float(H0), 'compression ratio': float(H/H0)})
+	return results
+
+def description_length(G,partition):
+	"""
+	Computes the MDL objective of `hina_communities` for an arbitrary partition of the first node set.
+
+	This allows partitions produced elsewhere, e.g. instructor-assigned groups or other clustering algorithms,
+	to be compared with the communities inferred by `hina_communities` on the same scale. The objective is
+	evaluated in O(E + B*N2) time.
+
+	Parameters:
+	-----------
+	G : networkx.Graph
+		A bipartite or tripartite graph with weighted edges, as accepted by `hina_communities`.
+	partition : dict
+		A dictionary mapping every node of the first node set to a community label.
 
 	Returns:
 	--------
 	dict
 		A dictionary containing the following keys:
-		- 'number of communities': The number of communities identified.
-		- 'node communities': A dictionary mapping each node to its community label.
-		- 'community structure quality value': A measure of how well the inferred communities compress
-		  the network structure, calculated as the compression ratio (description length / naive description length).
-		- 'updated graph object': The input graph with an added 'communities' attribute for each node.
-		- 'sub graphs for each community': A dictionary where keys are community labels and values are subgraphs of nodes
-		  belonging to that community.
-		- 'object-object graphs for each community' (only for tripartite networks): A dictionary where keys
-		  are community labels and values are projected graphs representing relationships between objects
-		  within each community. 
+		- 'number of communities': The number of communities in the partition.
+		- 'description length': The description length of the graph under the partition, in nats.
+		- 'naive description length': The description length with every node in its own community.
+		- 'compression ratio': The description length divided by the naive description length.
+	"""
+	return description_length_batch(G,[partition])[0]
+
+def cut_dendrogram(dendrogram,B):
 	"""
-	G_info = set([(i,j,w['weight'])for i,j,w in G.edges(data=True)])
-
-	v = set()
-	node_bipartite_list = [x for x in [data['bipartite'] for n, data in G.nodes(data=True)]\
-					 if not (x in v or v.add(x))]
-	# if fix_B == None:
-	#     set1,set2 = set([e[0] for e in G_info]),set([e[1] for e in G_info])
-	#     print('set1,set2',set1,set2)
-	# elif fix_B == node_bipartite_list[0]:
-	#     set1,set2 = set([e[0] for e in G_info]),set([e[1] for e in G_info])
-	# elif fix_B == node_bipartite_list[1]:
-	#     set2,set1 = set([e[0] for e in G_info]),set([e[1] for e in G_info])
+	Cuts the merge sequence returned by `hina_communities` at a given number of communities.
+
+	Parameters:
+	-----------
+	dendrogram : dict
+		The 'dendrogram' entry of the `hina_communities` results, containing the 'linkage' array, the clustered
+		'nodes' and, if they were coarsened, the index of the super-node ('leaves') of each of them.
+	B : int
+		The number of communities to keep, between 1 and the number of leaves.
+
+	Returns:
+	--------
+	dict
+		A dictionary mapping each node (as a string) to its community label. Labels are consecutive integers
+		starting from 0, numbered in order of first appearance among the leaf nodes.
+	"""
+	linkage,nodes = dendrogram['linkage'],dendrogram['nodes']
+	N = len(linkage) + 1
+	leaves = dendrogram.get('leaves',np.arange(len(nodes)))
+	B = int(B)
+	if B < 1 or B > N:
+		raise ValueError(f"B must be between 1 and {N}, got {B}")
+
+	parent = np.arange(2*N-1)
+	for step in range(N-B):
+		c1,c2 = int(linkage[step,0]),int(linkage[step,1])
+		parent[c1] = parent[c2] = N + step
+	# clusters are created in increasing id order, so one backward pass resolves every root
+	for c in range(N+(N-B)-2,-1,-1):
+		parent[c] = parent[parent[c]]
+
+	labelmap = {}
+	return {node:labelmap.setdefault(parent[leaves[ind]],len(labelmap)) for ind,node in enumerate(nodes)}
+
+def _agglomerate(G,coarsen=None,init_partition=None,node_set=None,progress=None,init_graph=None):
+	"""
+	Greedy agglomeration of the MDL objective over the nodes of the first set, recording the merge sequence
+	and the description length after each merge.
+	With coarsen='identical' (or 'support'), nodes with identical weighted (or unweighted) object profiles are
+	first collapsed into super-nodes, which become the leaves of the agglomeration. With an init_partition
+	(node -> label), the clusters that did not change (see _changed_communities, with the init_graph the
+	partition was computed on) are leaves too, while the nodes of the clusters that changed and the new nodes
+	start on their own. With a node_set, the nodes whose 'bipartite' attribute is
+	node_set are clustered instead of the first set. A progress callback is called as progress(B,B0) after
+	each merge, with the current number of clusters B and the number of leaves B0
+	"""
+	G_info = set(_oriented_edges(G,node_set))
+	if not G_info:
+		# an empty graph has no nodes to cluster and nothing to describe
+		return {'linkage':np.zeros((0,4)), 'nodes':[], 'leaves':np.zeros(0,dtype=np.int64), \
+			 'description lengths':np.zeros(1), 'naive description length':0.0}
+
 	set1,set2 = set([e[0] for e in G_info]),set([e[1] for e in G_info])
 
 	
 	N1,N2 = len(set1),len(set2)
 	W = sum([e[2] for e in G_info])
 
-	cluster2nodes = {i:set([i]) for i in set1}
+	leaves = list(set1)
+	cluster2nodes = {i:set([i]) for i in leaves}
 	node2cluster = {i:i for i in set1}
 	cluster2weights = {}
 	for e in G_info:
@@ -64,32 +307,12 @@ def hina_communities(G,fix_B=None):
 		c = node2cluster[i]
 		if not(c in cluster2weights): cluster2weights[c] = Counter({k:0 for k in set2})
 		cluster2weights[c][j] += w
-		# if fix_B != node_bipartite_list[1]:
-		# 	c = node2cluster[i]
-		# 	if not(c in cluster2weights): cluster2weights[c] = Counter({k:0 for k in set2})
-		# 	cluster2weights[c][j] += w
-		# else: 
-		# 	c = node2cluster[j]
-		# 	if not(c in cluster2weights): cluster2weights[c] = Counter({k:0 for k in set1})
-		# 	cluster2weights[c][i] += w
-
-	def logchoose(n,k):
-		"""
-		log binomial coefficient
-		"""
-		return loggamma(n+1) - loggamma(k+1) - loggamma(n-k+1)
-
-	def logmultiset(n,k):
-		"""
-		log multiset coefficient
-		"""
-		return logchoose(n+k-1,k)
 
 	def C(B):
 		"""
 		constants in the description length (only depend on size B of partition)
 		"""
-		return np.log(N1) + logchoose(N1-1,B-1) + loggamma(N1) + logmultiset(N2*B,W)
+		return _C(B,N1,N2,W)
 
 	def F(r):
 		"""
@@ -98,7 +321,7 @@ def hina_communities(G,fix_B=None):
 		"""
 		nr = len(cluster2nodes[r])
 		weights = cluster2weights[r]
-		return -loggamma(nr) + sum(logmultiset(nr,w) for w in weights.values())
+		return -loggamma(nr) + sum(_logmultiset(nr,w) for w in weights.values())
 
 	def merge_dF(r,s):
 		"""
@@ -107,9 +330,48 @@ def hina_communities(G,fix_B=None):
 		bef = F(r) + F(s)
 		nrs = len(cluster2nodes[r]) + len(cluster2nodes[s])
 		weights = cluster2weights[r] + cluster2weights[s]
-		aft = -loggamma(nrs) + sum(logmultiset(nrs,w) for w in weights.values())
+		aft = -loggamma(nrs) + sum(_logmultiset(nrs,w) for w in weights.values())
 		return aft - bef
 
+	nodes = leaves
+	H_naive = C(N1) + sum(F(r) for r in cluster2nodes)
+	if coarsen is not None or init_partition is not None:
+		# hash the sparse object profile of each node, nodes sharing a profile start in the same cluster
+		if coarsen is None:
+			profile = lambda weights: None
+		elif coarsen == 'identical':
+			profile = lambda weights: tuple(sorted((k,w) for k,w in weights.items() if w > 0))
+		elif coarsen == 'support':
+			profile = lambda weights: frozenset(k for k,w in weights.items() if w > 0)
+		else:
+			raise ValueError(f"Unsupported coarsening: {coarsen}")
+		clean = set()
+		if init_partition is not None:
+			clean = set(init_partition.values()) - _changed_communities(G,init_partition,init_graph,node_set)
+			init_partition = {str(i):label for i,label in init_partition.items()}
+		groups = defaultdict(list)
+		for i in nodes:
+			label = init_partition.get(str(i)) if init_partition is not None else None
+			if label is not None and label in clean:
+				groups[('cluster',label)].append(i)
+			elif coarsen is not None:
+				groups[('profile',profile(cluster2weights[i]))].append(i)
+			else:
+				groups[('node',i)].append(i)
+		leaves = ['Coarse_'+str(ind) for ind in range(len(groups))]
+		node2leaf = {}
+		for ind,members in enumerate(groups.values()):
+			c = leaves[ind]
+			cluster2nodes[c] = set(members)
+			cluster2weights[c] = sum((cluster2weights[i] for i in members),Counter())
+			for i in members:
+				node2leaf[i] = ind
+				del cluster2nodes[i],cluster2weights[i]
+		leaf_index = np.array([node2leaf[i] for i in nodes],dtype=np.int64)
+	else:
+		leaf_index = np.arange(N1)
+	B0 = len(leaves)
+
 	past_merges = []
 	for c1 in cluster2nodes:
 		for c2 in cluster2nodes:
@@ -117,12 +379,15 @@ def hina_communities(G,fix_B=None):
 				dF = merge_dF(c1,c2)
 				heapq.heappush(past_merges,(dF,(c1,c2)))
 
-	H0 = C(N1) + sum(F(r) for r in cluster2nodes)
-	Hs,past_partitions = [],[]
-	Hs.append(H0)
-	past_partitions.append(node2cluster.copy())
+	H0 = C(B0) + sum(F(r) for r in cluster2nodes)
+	Hs = [H0]
+
+	# only the merge sequence is recorded (scipy linkage layout), partitions are rebuilt at the end
+	cluster2id = {c:ind for ind,c in enumerate(leaves)}
+	id2size = [1]*B0
+	linkage = np.zeros((max(B0-1,0),4))
 
-	B,H = N1,H0
+	B,H = B0,H0
 	while B > 1:
 
 		dF,pair = heapq.heappop(past_merges)
@@ -133,10 +398,12 @@ def hina_communities(G,fix_B=None):
 		c12 = 'Merge_at_Beq_'+str(B)
 		cluster2weights[c12] = cluster2weights[c1] + cluster2weights[c2]
 		cluster2nodes[c12] = cluster2nodes[c1].union(cluster2nodes[c2])
-		for i in cluster2nodes[c12]:
-			node2cluster[i] = c12
+		step = B0 - B
+		id1,id2 = sorted((cluster2id.pop(c1),cluster2id.pop(c2)))
+		id2size.append(id2size[id1] + id2size[id2])
+		linkage[step] = [id1,id2,step+1,id2size[-1]]
+		cluster2id[c12] = B0 + step
 		del cluster2weights[c1],cluster2weights[c2],cluster2nodes[c1],cluster2nodes[c2]
-		past_partitions.append(node2cluster.copy())
 
 		H += dF + C(B-1) - C(B)
 
@@ -147,89 +414,586 @@ def hina_communities(G,fix_B=None):
 
 		Hs.append(H)
 		B -= 1
+		if progress is not None:
+			progress(B,B0)
 
-	if fix_B is None:
-		best_ind = np.argmin(Hs)
-	else:
-		best_ind = len(Hs)-fix_B
-	Hmdl = Hs[best_ind]
-	community_labels = past_partitions[best_ind]
-	old_labels = list(set(community_labels.values()))
-	labelmap = dict(zip(old_labels,range(len(old_labels))))
-	community_labels = {str(i[0]):labelmap[str(i[1])] for i in community_labels.items()}
-
-	nx.set_node_attributes(G, community_labels, 'communities')
-
-	grouped_nodes = defaultdict(list)
-	for node, community in community_labels.items():
-		grouped_nodes[community].append(node)
-
-# Create subgraphs for each community
-	sub_Gs = {}
-	for community, u_nodes in grouped_nodes.items():
-		G_sub = nx.Graph()
-		for u_node in u_nodes:
-			G_sub.add_node(u_node, **G.nodes[u_node])
-		v_nodes = set()
-		for u_node in u_nodes:
-			for v_node in G.neighbors(u_node):
-				v_nodes.add(v_node)
-				G_sub.add_node(v_node, **G.nodes[v_node])
-		for u_node in u_nodes:
-			for v_node in G.neighbors(u_node):
-				if G.has_edge(u_node, v_node):
-					G_sub.add_edge(u_node, v_node, **G.edges[u_node, v_node])
-		sub_Gs[community] = G_sub
-
-# Create the projected subgraphs for each community for tripartite network
-	
-	if any(j.get('tripartite') == True for i, j in G.nodes(data=True)):
-		sub_Gs_object = {}
-		for i, g in sub_Gs.items():
-			objects_objects = [[j,w['weight']] for i,j,w in g.edges(data=True)]
-			bipartite_attrs = list(set([j['bipartite'] for i, j in g.nodes(data=True)]))
-			combined_attr = None
-			student_attr = None
-			attr1, attr2 = "object1", "object2"
-			for attr in bipartite_attrs:
-				if isinstance(attr, str) and '(' in attr and ')' in attr and ',' in attr:
-					combined_attr = attr
-				else:
-					student_attr = attr
-			try:
-				attr1, attr2 = combined_attr.strip("()").split(",")
-				attr1 = attr1.strip()
-				attr2 = attr2.strip()
-				pair_count = defaultdict(int)
-				for n in objects_objects:
-					if '**' in n[0]:
-						parts = n[0].split('**')
-						if len(parts) == 2:
-							pair = (parts[0].strip(), parts[1].strip())
-							pair_count[pair] += n[1]
-				w_edges = [(object1, object2, {'weight': count}) 
-						  for (object1, object2), count in pair_count.items() 
-						  if object1 != 'NA' and object2 != 'NA']
-				G_ = nx.Graph()
-				G_.add_edges_from(w_edges)
-				for node in G_.nodes():
-					if node in [edge[0] for edge in w_edges]:
-						G_.nodes[node]['bipartite'] = attr1
-					else:
-						G_.nodes[node]['bipartite'] = attr2
-						
-				sub_Gs_object[i] = G_
-			except Exception as e:
-				print(f"Error processing community {i}: {str(e)}")
-				sub_Gs_object[i] = nx.Graph()
-		
-	if any(j.get('tripartite') == True for i, j in G.nodes(data=True)):
-			results = {'number of communities': len(set(community_labels.values())), \
-			   "node communities": community_labels, "community structure quality value":1-Hmdl/H0,\
-			   'updated graph object':G, 'sub graphs for each community':sub_Gs, 'object-object graphs for each community': sub_Gs_object}
-	else:
+	return {'linkage':linkage, 'nodes':[str(i) for i in nodes], 'leaves':leaf_index, \
+		 'description lengths':np.array(Hs), 'naive description length':H_naive}
+
+class _LazyCommunityMapping(Mapping):
+	"""
+	read-only mapping from community labels to values that are only built, by factory(community), on first access
+	"""
+	def __init__(self,communities,factory):
+		self._communities = list(communities)
+		self._keys = set(self._communities)
+		self._factory = factory
+		self._values = {}
+
+	def __getitem__(self,community):
+		if community not in self._values:
+			if community not in self._keys:
+				raise KeyError(community)
+			self._values[community] = self._factory(community)
+		return self._values[community]
+
+	def __iter__(self):
+		return iter(self._communities)
+
+	def __len__(self):
+		return len(self._communities)
+
+def _object_matrices(G,labels):
+	"""
+	object1 x object2 co-occurrence matrices of every community of a tripartite network, computed at once.
+
+	The community indicator P (B,N1) times the student x joint-object weight matrix X (N1,J) gives the weight of
+	each joint object in each community. Joint object j = 'o1**o2' then adds its weight to entry (o1,o2) of its
+	community, which is a single sparse matrix of shape (B*n1,n2) whose row blocks are the community matrices.
+	Pairs involving 'NA' are left out. Returns the object1 and object2 names, the community labels and the matrices.
+	"""
+	nodes1,nodes2,rows,cols,weights = _edge_arrays(G,nodes1=list(labels))
+	# keep integer counts as integers, as in the input graph
+	if np.all(np.mod(weights,1) == 0):
+		weights = weights.astype(np.int64)
+	communities,membership = np.unique(np.array([labels[node] for node in nodes1]),return_inverse=True)
+
+	parts = [node.split('**') for node in nodes2]
+	joint = np.array([len(part) == 2 and part[0].strip() != 'NA' and part[1].strip() != 'NA' for part in parts],dtype=bool)
+	objects1 = list(dict.fromkeys(parts[j][0].strip() for j in np.flatnonzero(joint)))
+	objects2 = list(dict.fromkeys(parts[j][1].strip() for j in np.flatnonzero(joint)))
+	index1 = {node:ind for ind,node in enumerate(objects1)}
+	index2 = {node:ind for ind,node in enumerate(objects2)}
+	object1_of = np.array([index1[part[0].strip()] if keep else -1 for part,keep in zip(parts,joint)],dtype=np.int64)
+	object2_of = np.array([index2[part[1].strip()] if keep else -1 for part,keep in zip(parts,joint)],dtype=np.int64)
+
+	B,N1,J,n1,n2 = len(communities),len(nodes1),len(nodes2),len(objects1),len(objects2)
+	X = sp.csr_matrix((weights,(rows,cols)),shape=(N1,J))
+	P = sp.csr_matrix((np.ones(N1,dtype=weights.dtype),(membership,np.arange(N1))),shape=(B,N1))
+	Y = (P @ X).tocoo()
+	keep = joint[Y.col]
+	stacked = sp.csr_matrix((Y.data[keep],(Y.row[keep]*n1 + object1_of[Y.col[keep]],object2_of[Y.col[keep]])),shape=(B*n1,n2))
+	matrices = {community.item():stacked[r*n1:(r+1)*n1] for r,community in enumerate(communities)}
+	return objects1,objects2,matrices
+
+def _object_graph(M,objects1,objects2,attr1="object1",attr2="object2"):
+	"""
+	networkx object-object graph of the co-occurrence matrix M of one community
+	"""
+	M = M.tocoo()
+	G_ = nx.Graph()
+	G_.add_nodes_from((objects1[i] for i in np.unique(M.row)),bipartite=attr1)
+	# an object named in both sets keeps the object1 attribute
+	G_.add_nodes_from([objects2[j] for j in np.unique(M.col) if objects2[j] not in G_],bipartite=attr2)
+	G_.add_weighted_edges_from(zip([objects1[i] for i in M.row],[objects2[j] for j in M.col],M.data.tolist()))
+	return G_
+
+class CommunityResult:
+	"""
+	Reusable result of the MDL community detection in `hina_communities`.
+
+	The greedy merge sequence does not depend on the number of communities, so this object runs the
+	agglomeration once and derives the community labels, compression ratio and per-community subgraphs
+	for any number of communities `B` lazily, caching each of them on first use. Methods taking `B`
+	use the MDL-optimal number of communities when `B` is `None`.
+
+	Parameters:
+	-----------
+	G : networkx.Graph
+		A bipartite or tripartite graph with weighted edges, as accepted by `hina_communities`.
+	dendrogram : dict, optional
+		A precomputed 'dendrogram' for `G`, as returned by `hina_communities`. If `None`, the agglomeration
+		is run on `G`. Default is `None`.
+	coarsen : str, optional
+		The coarsening of the multilevel mode, see `hina_communities`. Default is `None` (exact mode).
+	init_partition : dict, optional
+		A previous partition to warm start from, see `hina_communities`. Default is `None`.
+	node_set : str, optional
+		The 'bipartite' attribute of the nodes to cluster, see `hina_communities`. Default is `None`.
+	progress : callable, optional
+		The merge progress callback of the agglomeration, see `hina_communities`. Default is `None`.
+	init_graph : networkx.Graph, optional
+		The graph `init_partition` was computed on, see `hina_communities`. Default is `None`.
+
+	Attributes:
+	-----------
+	G : networkx.Graph
+		The clustered graph.
+	dendrogram : dict
+		The merge sequence, see `cut_dendrogram`.
+	description_lengths : numpy.ndarray
+		The description length after each merge, from the initial partition (singletons, or super-nodes in the
+		multilevel mode) to a single community.
+	naive_description_length : float
+		The description length with every node in its own community.
+	best_B : int
+		The number of communities minimizing the description length.
+	warm_nodes : list or None
+		With an `init_partition`, the nodes of the communities that changed (that lost nodes or, given the
+		`init_graph`, with a node whose edges changed) and the new nodes, which are the only nodes moved by the
+		refinement of `hina_communities`. `None` otherwise.
+	"""
+	def __init__(self,G,dendrogram=None,coarsen=None,init_partition=None,node_set=None,progress=None,init_graph=None):
+		self.G = G
+		self.node_set = node_set
+		self.dendrogram = _agglomerate(G,coarsen,init_partition,node_set,progress,init_graph) if dendrogram is None else dendrogram
+		self.tripartite = any(j.get('tripartite') == True for i, j in G.nodes(data=True))
+		# object-object graphs only exist when the students (not the joint objects) are clustered
+		self._clusters_objects = node_set is not None and \
+			any(j.get('bipartite') == node_set and j.get('tripartite') == True for i, j in G.nodes(data=True))
+		self.refinement = None
+		self.warm_nodes = None
+		if init_partition is not None:
+			# the nodes of the communities that changed and the new nodes, the others keep their community
+			previous = {str(i):label for i,label in init_partition.items()}
+			changed = _changed_communities(G,init_partition,init_graph,node_set)
+			self.warm_nodes = [node for node in self.dendrogram['nodes'] if previous.get(str(node)) is None or previous[str(node)] in changed]
+		self._labels,self._subgraphs,self._object_graphs,self._object_matrices = {},{},{},{}
+		# object1 and object2 attributes of the object-object graphs, read from the graph when first needed
+		self._object_attrs = None
+		self._refined_Hs = {}
+
+	@property
+	def description_lengths(self):
+		Hs = self.dendrogram['description lengths']
+		if self._refined_Hs:
+			Hs = Hs.copy()
+			for B,H in self._refined_Hs.items():
+				Hs[len(Hs)-B] = H
+		return Hs
+
+	@property
+	def naive_description_length(self):
+		return self.dendrogram.get('naive description length',self.dendrogram['description lengths'][0])
+
+	@property
+	def best_B(self):
+		Hs = self.description_lengths
+		return len(Hs) - int(np.argmin(Hs))
+
+	def refine(self,B=None,max_iter=20,time_limit=None,movable=None):
+		"""
+		Lowers the description length of the partition with `B` communities by moving single nodes between
+		communities, revisiting merges the greedy agglomeration cannot undo. When `B` is `None`, communities
+		may be emptied so the number of communities can decrease; otherwise it is kept fixed. The refined
+		partition replaces the greedy one for its number of communities.
+
+		Parameters:
+		-----------
+		B : int, optional
+			The number of communities of the partition to refine. Default is the MDL-optimal number.
+		max_iter : int, optional
+			The maximum number of sweeps over all nodes. Default is 20.
+		time_limit : float, optional
+			The maximum running time in seconds. Default is `None` (no limit).
+		movable : iterable, optional
+			The nodes that may move, e.g. `warm_nodes` to only update the communities that changed since a warm
+			start. Default is `None` (all nodes).
+
+		Returns:
+		--------
+		dict
+			A dictionary containing the following keys:
+			- 'number of communities': The number of communities after refinement.
+			- 'compression ratio before': The compression ratio of the greedy partition.
+			- 'compression ratio after': The compression ratio of the refined partition.
+			- 'compression ratio improvement': The decrease of the compression ratio.
+			- 'number of moves': The number of node moves performed.
+			- 'number of sweeps': The number of sweeps over all nodes.
+			- 'runtime': The running time in seconds.
+		"""
+		start = time.perf_counter()
+		fix_B = B is not None
+		B = self._get_B(B)
+		nodes = self.dendrogram['nodes']
+		if not nodes:
+			# an empty graph has no nodes to move
+			self.refinement = {'number of communities': 0, 'compression ratio before': 1.0, 'compression ratio after': 1.0,\
+				'compression ratio improvement': 0.0, 'number of moves': 0, 'number of sweeps': 0, 'runtime': time.perf_counter()-start}
+			return self.refinement
+		_,_,rows,cols,weights = _edge_arrays(self.G,nodes,self.node_set)
+		X = sp.csr_matrix((weights,(rows,cols)),shape=(len(nodes),cols.max()+1))
+		labels = self.labels(B)
+		init = np.array([labels[node] for node in nodes])
+		if movable is not None:
+			movable = set(movable)
+			movable = [ind for ind,node in enumerate(nodes) if node in movable]
+
+		new,H_before,H_after,moves,sweeps = _refine_partition(X,init,fix_B=fix_B,max_iter=max_iter,time_limit=time_limit,movable=movable)
+		H0 = self.naive_description_length
+		labelmap = {}
+		new_labels = {node:labelmap.setdefault(new[ind],len(labelmap)) for ind,node in enumerate(nodes)}
+		B_new = len(labelmap)
+		Hs = self.description_lengths
+		if moves > 0 and H_after < Hs[len(Hs)-B_new]:
+			self._labels[B_new] = new_labels
+			self._refined_Hs[B_new] = H_after
+			self._subgraphs.pop(B_new,None)
+			self._object_graphs.pop(B_new,None)
+			self._object_matrices.pop(B_new,None)
+
+		self.refinement = {'number of communities': B_new, 'compression ratio before': float(H_before/H0),\
+			'compression ratio after': float(H_after/H0), 'compression ratio improvement': float((H_before-H_after)/H0),\
+			'number of moves': moves, 'number of sweeps': sweeps, 'runtime': time.perf_counter()-start}
+		return self.refinement
+
+	def _get_B(self,B):
+		return self.best_B if B is None else int(B)
+
+	def labels(self,B=None):
+		"""
+		Returns a dictionary mapping each node (as a string) to its community label for `B` communities.
+		"""
+		B = self._get_B(B)
+		if B not in self._labels:
+			self._labels[B] = cut_dendrogram(self.dendrogram,B)
+		return self._labels[B]
+
+	def compression_ratio(self,B=None):
+		"""
+		Returns the description length with `B` communities divided by the naive description length, or 1.0
+		for a graph without edges.
+		"""
+		B = self._get_B(B)
+		Hs = self.description_lengths
+		if B < 1 or B > len(Hs):
+			raise ValueError(f"B must be between 1 and {len(Hs)}, got {B}")
+		if not self.dendrogram['nodes']:
+			# an empty graph, which no partition compresses
+			return 1.0
+		return float(Hs[len(Hs)-B]/self.naive_description_length)
+
+	def quality_value(self,B=None):
+		"""
+		Returns the 'community structure quality value' reported by `hina_communities` for `B` communities.
+		"""
+		ratio = self.compression_ratio(B)
+		return 1-ratio if self.tripartite else ratio
+
+	def members(self,B=None):
+		"""
+		Returns a dictionary mapping each community label to the list of its nodes for `B` communities.
+		"""
+		grouped_nodes = defaultdict(list)
+		for node, community in self.labels(B).items():
+			grouped_nodes[community].append(node)
+		return dict(grouped_nodes)
+
+	def subgraph_views(self,B=None):
+		"""
+		Returns a lazy mapping from each community label to a read-only view of the subgraph of its nodes and
+		their neighbors. Nothing is copied: each view is only created when its community is accessed.
+		"""
+		grouped_nodes = self.members(B)
+		def view(community):
+			u_nodes = grouped_nodes[community]
+			v_nodes = set().union(*(self.G[u_node] for u_node in u_nodes))
+			return self.G.subgraph(list(u_nodes) + list(v_nodes))
+		return _LazyCommunityMapping(grouped_nodes,view)
+
+	def subgraphs(self,B=None):
+		"""
+		Returns a dictionary mapping each community label to the subgraph of its nodes and their neighbors.
+		"""
+		B = self._get_B(B)
+		if B not in self._subgraphs:
+			# Create subgraphs for each community
+			self._subgraphs[B] = {community:g.copy() for community,g in self.subgraph_views(B).items()}
+		return self._subgraphs[B]
+
+	def object_matrices(self,B=None):
+		"""
+		Returns the object1 x object2 co-occurrence matrix of each community (tripartite networks only), as a
+		dictionary with the 'object1 nodes' and 'object2 nodes' indexing the rows and columns and the 'matrices'
+		mapping each community label to a scipy.sparse.csr_matrix.
+		"""
+		if not self.tripartite or self._clusters_objects:
+			raise ValueError("Object-object graphs are only available for tripartite networks clustered by students")
+		B = self._get_B(B)
+		if B not in self._object_matrices:
+			objects1,objects2,matrices = _object_matrices(self.G,self.labels(B))
+			self._object_matrices[B] = {'object1 nodes':objects1,'object2 nodes':objects2,'matrices':matrices}
+		return self._object_matrices[B]
+
+	def _object_graph_factory(self,B):
+		"""
+		function building the networkx object-object graph of a community from the co-occurrence matrices, which
+		are only computed (once for all communities) when the first graph is built
+		"""
+		def object_graph(community):
+			object_matrices = self.object_matrices(B)
+			if self._object_attrs is None:
+				combined_attr = next(j['bipartite'] for i,j in self.G.nodes(data=True) if j.get('tripartite') == True)
+				self._object_attrs = [attr.strip() for attr in combined_attr.strip("()").split(",")]
+			return _object_graph(object_matrices['matrices'][community],object_matrices['object1 nodes'], \
+				object_matrices['object2 nodes'],*self._object_attrs)
+		return object_graph
+
+	def object_graphs(self,B=None):
+		"""
+		Returns a dictionary mapping each community label to its object-object graph (tripartite networks only).
+		"""
+		if not self.tripartite or self._clusters_objects:
+			raise ValueError("Object-object graphs are only available for tripartite networks clustered by students")
+		B = self._get_B(B)
+		if B not in self._object_graphs:
+			object_graph = self._object_graph_factory(B)
+			self._object_graphs[B] = {i:object_graph(i) for i in self.object_matrices(B)['matrices']}
+		return self._object_graphs[B]
+
+	def to_dict(self,B=None,lightweight=False):
+		"""
+		Returns the results dictionary of `hina_communities` for `B` communities. Unless `lightweight` is `True`,
+		the community labels are written to the 'communities' node attribute of the graph.
+		"""
+		community_labels = self.labels(B)
 		results = {'number of communities': len(set(community_labels.values())), \
-			   "node communities": community_labels, "community structure quality value":Hmdl/H0,\
-			   'updated graph object':G, 'sub graphs for each community':sub_Gs}
-	
-	return results
\ No newline at end of file
+			   "node communities": community_labels, "community structure quality value":self.quality_value(B)}
+		if lightweight:
+			views = self.subgraph_views(B)
+			results['sub graphs for each community'] = views
+			if self.tripartite and not self._clusters_objects:
+				results['object-object graphs for each community'] = \
+					_LazyCommunityMapping(views,self._object_graph_factory(B))
+		else:
+			nx.set_node_attributes(self.G, community_labels, 'communities')
+			results['updated graph object'] = self.G
+			results['sub graphs for each community'] = self.subgraphs(B)
+			if self.tripartite and not self._clusters_objects:
+				results['object-object graphs for each community'] = self.object_graphs(B)
+		results['dendrogram'] = self.dendrogram
+		if self.refinement is not None:
+			results['refinement'] = self.refinement
+		return results
+
+def hina_communities(G,fix_B=None,return_type='dict',refine=False,max_iter=20,time_limit=None,coarsen=None,init_partition=None,lightweight=False,node_set=None,progress=None,init_graph=None):
+	"""
+	Identifies bipartite communities in a graph by optimizing a Minimum Description Length (MDL) objective.
+
+	This function partitions the nodes of a bipartite graph into communities by minimizing the MDL objective,
+	which balances the complexity of the community structure with the accuracy of representing the graph.
+	The function supports fixing the number of communities (`fix_B`) and can handle tripartite networks.
+
+	Parameters:
+	-----------
+	G : networkx.Graph
+		A bipartite or tripartite graph with weighted edges. Nodes must have a 'bipartite' attribute
+		indicating their partition (e.g., 'student', 'coded behaviors'). If the graph is tripartite, nodes should
+		have a 'tripartite' attribute set to `True`.
+	fix_B : int or str, optional
+		If specified, fixes the number of communities to this value. If `None`, the function automatically
+		determines the optimal number of communities. Default is `None`.
+	return_type : str, optional
+		'dict' to return the results dictionary (default), or 'object' to return a `CommunityResult` that
+		can produce the labels, compression ratio and subgraphs for any number of communities without
+		re-running the agglomeration.
+	refine : bool, optional
+		If `True`, the greedy partition is refined with single-node moves between communities that further
+		lower the MDL objective (see `CommunityResult.refine`). Default is `False`.
+	max_iter : int, optional
+		The maximum number of refinement sweeps over all nodes. Default is 20.
+	time_limit : float, optional
+		The maximum refinement time in seconds. Default is `None` (no limit).
+	coarsen : str, optional
+		Enables the multilevel mode for large node sets. Nodes are first collapsed into weighted super-nodes by
+		hashing their object profiles, and the agglomeration starts from these super-nodes instead of singletons:
+		- 'identical': Nodes with identical weighted profiles are collapsed.
+		- 'support': Nodes interacting with exactly the same objects, whatever the weights, are collapsed.
+		Combine with `refine=True` to then refine the partition node by node on the original graph. The number of
+		communities can be at most the number of super-nodes. Default is `None` (exact mode).
+	init_partition : dict, optional
+		A previous partition of the nodes to warm start from, e.g. the 'node communities' of the last run when a
+		new week of data arrives. Communities that did not change are kept as super-nodes, while the nodes of
+		the communities that changed and the new nodes start on their own. A community changed if it lost nodes
+		or, given the `init_graph`, if the edges or edge weights of one of its nodes differ in `G`. Only these are merged
+		by the agglomeration, which splits the communities that changed, and only these may then move to another
+		community in the refinement (`refine` is implied), so the update costs little more than the changed part
+		of the cohort. Default is `None`.
+	lightweight : bool, optional
+		If `True`, the input graph is left untouched (no 'communities' attribute, no 'updated graph object'),
+		which makes concurrent calls on a shared graph safe. The subgraphs are then returned as a lazy mapping of
+		read-only `networkx` subgraph views, and the object-object graphs are only built for the communities
+		that are accessed. Default is `False`.
+	node_set : str, optional
+		The 'bipartite' attribute of the nodes to cluster, e.g. 'coded behaviors' to find communities of objects
+		that are used by the same students. Default is `None` (the first node set of the edges, e.g. the students).
+	progress : callable, optional
+		Called as `progress(B, B0)` after each merge of the agglomeration, with the current number of communities `B`
+		and the number of leaves `B0` (the number of nodes in the exact mode), e.g. to report the progress of long runs.
+		An exception raised by the callback aborts the run. Default is `None`.
+	init_graph : networkx.Graph, optional
+		The graph `init_partition` was computed on, e.g. the graph of the last week. Without it, only the nodes
+		that left are detected, and the communities of nodes whose edges changed are kept as they were.
+		Default is `None`.
+
+	Returns:
+	--------
+	dict or CommunityResult
+		A dictionary containing the following keys:
+		- 'number of communities': The number of communities identified.
+		- 'node communities': A dictionary mapping each node to its community label.
+		- 'community structure quality value': A measure of how well the inferred communities compress
+		  the network structure, calculated as the compression ratio (description length / naive description length).
+		- 'updated graph object' (not in `lightweight` mode): The input graph with an added 'communities' attribute for each node.
+		- 'sub graphs for each community': A dictionary where keys are community labels and values are subgraphs of nodes
+		  belonging to that community (read-only views created on access in `lightweight` mode).
+		- 'object-object graphs for each community' (only for tripartite networks clustered by students): A dictionary where keys
+		  are community labels and values are projected graphs representing relationships between objects
+		  within each community. 
+		- 'dendrogram': The greedy merge sequence, stored as a dictionary with a scipy-style 'linkage' array
+		  (one row [cluster1, cluster2, merge step, size] per merge), the clustered 'nodes', the index of the leaf
+		  of each node in the linkage ('leaves', super-nodes in the multilevel mode), the 'description lengths'
+		  after each merge and the 'naive description length'. It can be cut at any number of communities with
+		  `cut_dendrogram`.
+		- 'refinement' (only if `refine` is `True` or `init_partition` is given): Statistics of the refinement, including the compression
+		  ratio before and after it (see `CommunityResult.refine`).
+	"""
+	result = CommunityResult(G,coarsen=coarsen,init_partition=init_partition,node_set=node_set,progress=progress,init_graph=init_graph)
+	if refine or init_partition is not None:
+		result.refine(fix_B,max_iter=max_iter,time_limit=time_limit,movable=result.warm_nodes)
+	if return_type == 'object':
+		return result
+	elif return_type == 'dict':
+		return result.to_dict(fix_B,lightweight=lightweight)
+	else:
+		raise ValueError(f"Unsupported return_type: {return_type}")
+
+def _C_joint(B1,B2,N1,N2,W):
+	"""
+	constants in the description length of a co-clustering into B1 x B2 blocks
+	"""
+	return np.log(N1) + _logchoose(N1-1,B1-1) + loggamma(N1) + np.log(N2) + _logchoose(N2-1,B2-1) + loggamma(N2) \
+		+ _logmultiset(B1*B2,W)
+
+def _joint_description_length(n1,n2,M,W):
+	"""
+	description length of a co-clustering with cluster sizes n1 (B1,) and n2 (B2,) and block weights M (B1,B2):
+	the block matrix is encoded first, then the weight of each block among its n1_r * n2_c node pairs
+	"""
+	N1,N2 = n1.sum(),n2.sum()
+	return _C_joint(len(n1),len(n2),N1,N2,W) - loggamma(n1).sum() - loggamma(n2).sum() \
+		+ _logmultiset(np.outer(n1,n2),M).sum()
+
+def _cocluster_sweep(X,labels,n,m,M,time_limit=None,start=None):
+	"""
+	One sweep of single-node moves over the rows of X for a co-clustering, the columns being clustered as well.
+
+	X is the (N,N_other) sparse weight matrix already aggregated over the column clusters (N,B_other), labels the
+	cluster of each row, n (B,) and m (B_other,) the cluster sizes of both sides and M (B,B_other) the block matrix.
+	n and M are updated in place after each move, so the move costs of every node are evaluated for all target
+	clusters at once from these sufficient statistics. Clusters are never emptied. Returns the number of moves.
+	"""
+	X = sp.csr_matrix(X,dtype=float)
+	moves = 0
+	for i in range(X.shape[0]):
+		if time_limit is not None and time.perf_counter() - start > time_limit:
+			break
+		r = labels[i]
+		if n[r] <= 1:
+			continue
+		x = np.zeros(M.shape[1])
+		x[X.indices[X.indptr[i]:X.indptr[i+1]]] = X.data[X.indptr[i]:X.indptr[i+1]]
+
+		# removing i from r
+		remove = -loggamma(n[r]-1) + loggamma(n[r]) \
+			+ (_logmultiset((n[r]-1)*m,M[r]-x) - _logmultiset(n[r]*m,M[r])).sum()
+		# adding i to every cluster
+		add = -loggamma(n+1) + loggamma(n) \
+			+ (_logmultiset(np.outer(n+1,m),M+x) - _logmultiset(np.outer(n,m),M)).sum(axis=1)
+		delta = remove + add
+		delta[r] = 0.
+		s = int(np.argmin(delta))
+		if delta[s] < -1e-10:
+			labels[i] = s
+			n[r] -= 1
+			n[s] += 1
+			M[r] -= x
+			M[s] += x
+			moves += 1
+	return moves
+
+def hina_coclusters(G,fix_B=None,max_iter=20,time_limit=None,coarsen=None):
+	"""
+	Identifies communities of both node sets of a bipartite graph jointly, by co-clustering students and objects.
+
+	Each node set is first clustered on its own with `hina_communities`. The two partitions are then improved in
+	turn by single-node moves that lower a joint Minimum Description Length (MDL) objective, in which the weights
+	are described by the block matrix between the communities of both sets and the distribution of each block's
+	weight among its node pairs. The block matrix is kept up to date after each move, so that the move costs of
+	one side never require recomputing the marginals over the whole graph. The alternation stops when a round
+	over both sides moves no node.
+
+	Parameters:
+	-----------
+	G : networkx.Graph
+		A bipartite or tripartite graph with weighted edges, as accepted by `hina_communities`.
+	fix_B : tuple of int, optional
+		If specified, the number of communities of the first and second node sets. Default is `None`
+		(the MDL-optimal number of each set clustered on its own).
+	max_iter : int, optional
+		The maximum number of rounds over both node sets. Default is 20.
+	time_limit : float, optional
+		The maximum running time of the alternation in seconds. Default is `None` (no limit).
+	coarsen : str, optional
+		The coarsening of the multilevel mode used for the initial partitions (see `hina_communities`).
+		Default is `None`.
+
+	Returns:
+	--------
+	dict
+		A dictionary containing the following keys:
+		- 'number of communities': The numbers of communities of the first and second node sets.
+		- 'node communities': A dictionary mapping each node of the first set to its community label.
+		- 'object communities': A dictionary mapping each node of the second set to its community label.
+		- 'block matrix': A numpy.ndarray whose entry (r, c) is the total weight between the node community r
+		  and the object community c.
+		- 'community structure quality value': The compression ratio of the joint description length
+		  (description length / naive description length, with every node in its own community on both sides).
+		- 'compression ratio before': The compression ratio of the initial partitions.
+		- 'number of moves': The number of node moves performed.
+		- 'number of rounds': The number of rounds over both node sets.
+		- 'runtime': The running time of the alternation in seconds.
+	"""
+	start = time.perf_counter()
+	nodes1,nodes2,rows,cols,weights = _edge_arrays(G)
+	N1,N2,W = len(nodes1),len(nodes2),weights.sum()
+	X = sp.csr_matrix((weights,(rows,cols)),shape=(N1,N2))
+
+	B1,B2 = (None,None) if fix_B is None else fix_B
+	# cluster the second set by its own 'bipartite' attribute, read from the first edge
+	node_set2 = G.nodes[next(j for i,j,w in _oriented_edges(G))].get('bipartite')
+	labels1 = CommunityResult(G,coarsen=coarsen).labels(B1)
+	labels2 = CommunityResult(G,coarsen=coarsen,node_set=node_set2).labels(B2)
+	labels1 = np.array([labels1[node] for node in nodes1],dtype=np.int64)
+	labels2 = np.array([labels2[node] for node in nodes2],dtype=np.int64)
+
+	n1 = np.bincount(labels1).astype(float)
+	n2 = np.bincount(labels2).astype(float)
+	Q1 = sp.csr_matrix((np.ones(N1),(np.arange(N1),labels1)),shape=(N1,len(n1)))
+	Q2 = sp.csr_matrix((np.ones(N2),(np.arange(N2),labels2)),shape=(N2,len(n2)))
+	M = (Q1.T @ X @ Q2).toarray()
+	# with every node on its own, each block holds a single edge and costs nothing
+	H0 = _C_joint(N1,N2,N1,N2,W)
+	H_before = _joint_description_length(n1,n2,M,W)
+
+	moves,rounds = 0,0
+	while rounds < max_iter:
+		if time_limit is not None and time.perf_counter() - start > time_limit:
+			break
+		rounds += 1
+		# the rows of each side are aggregated over the current clusters of the other side, M.T is a view of M
+		moved = _cocluster_sweep(X @ Q2,labels1,n1,n2,M,time_limit,start)
+		Q1 = sp.csr_matrix((np.ones(N1),(np.arange(N1),labels1)),shape=(N1,len(n1)))
+		moved += _cocluster_sweep(X.T @ Q1,labels2,n2,n1,M.T,time_limit,start)
+		Q2 = sp.csr_matrix((np.ones(N2),(np.arange(N2),labels2)),shape=(N2,len(n2)))
+		moves += moved
+		if moved == 0:
+			break
+
+	H_after = _joint_description_length(n1,n2,M,W)
+	return {'number of communities':(len(n1),len(n2)), \
+		 'node communities':{node:int(labels1[ind]) for ind,node in enumerate(nodes1)}, \
+		 'object communities':{node:int(labels2[ind]) for ind,node in enumerate(nodes2)}, \
+		 'block matrix':M, 'community structure quality value':float(H_after/H0), \
+		 'compression ratio before':float(H_before/H0), 'number of moves':moves, 'number of rounds':rounds, \
+		 'runtime':time.perf_counter()-start}
@@ -0,0 +1,90 @@
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from hina.construction import get_bipartite
+from .clustering import CommunityResult
+
+def _cluster_group(group,df,student_col,object_col,fix_B=None,refine=False,coarsen=None):
+	"""
+	builds the bipartite graph of one group and clusters it, returns only the labels and statistics
+	"""
+	start = time.perf_counter()
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore')
+		G = get_bipartite(df,student_col,object_col)
+	result = CommunityResult(G,coarsen=coarsen,node_set=student_col)
+	B = None if fix_B is None else min(int(fix_B),len(result.description_lengths))
+	if refine:
+		result.refine(B)
+	labels = result.labels(B)
+	stats = {'number of communities':len(set(labels.values())), 'compression ratio':float(result.compression_ratio(B)), \
+		  'number of students':len(labels), 'runtime':time.perf_counter()-start}
+	return group,labels,stats
+
+def group_communities(df,student_col,object_col,group_col,fix_B=None,refine=False,coarsen=None,n_jobs=None):
+	"""
+	Identifies the communities of each group of a cohort separately, running the groups in parallel.
+
+	The rows of each group in `df` are turned into a bipartite graph with `get_bipartite` and clustered with
+	`hina_communities`. Groups are processed concurrently in a process pool, largest first. Only the rows of a
+	group are sent to a worker process and only its labels and statistics are sent back, and at most two groups
+	per worker are queued at any time, so that memory stays bounded however many groups the cohort has.
+
+	Parameters:
+	-----------
+	df : pandas.DataFrame
+		The input DataFrame containing the data of all groups.
+	student_col : str
+		The column name in the DataFrame representing student nodes.
+	object_col : str
+		The column name in the DataFrame representing the studied object nodes.
+	group_col : str
+		The column name in the DataFrame representing the group of each row.
+	fix_B : int, optional
+		If specified, fixes the number of communities in each group (at most the number of its students).
+		Default is `None`.
+	refine : bool, optional
+		If `True`, the partition of each group is refined with single-node moves (see `hina_communities`).
+		Default is `False`.
+	coarsen : str, optional
+		The coarsening of the multilevel mode (see `hina_communities`). Default is `None`.
+	n_jobs : int, optional
+		The number of worker processes. If `None`, all available CPUs are used. With 1, the groups run in
+		the current process. Default is `None`.
+
+	Returns:
+	--------
+	dict
+		A dictionary containing the following keys:
+		- 'node communities': A dictionary mapping each (group, student) pair to the community label of the student
+		  within its group.
+		- 'groups': A dictionary mapping each group to its 'number of communities', 'compression ratio',
+		  'number of students' and clustering 'runtime' in seconds (including the graph construction).
+		- 'runtime': The total running time in seconds.
+	"""
+	start = time.perf_counter()
+	df = df.dropna(subset=[group_col])
+	groups = sorted(df.groupby(group_col,sort=False)[[student_col,object_col]],key=lambda item: -len(item[1]))
+	kwargs = {'fix_B':fix_B,'refine':refine,'coarsen':coarsen}
+
+	if n_jobs is None:
+		n_jobs = os.cpu_count() or 1
+	if n_jobs == 1:
+		outputs = [_cluster_group(group,rows,student_col,object_col,**kwargs) for group,rows in groups]
+	else:
+		outputs = []
+		with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+			pending = set()
+			for group,rows in groups:
+				if len(pending) >= 2*n_jobs:
+					done,pending = wait(pending,return_when=FIRST_COMPLETED)
+					outputs.extend(future.result() for future in done)
+				pending.add(executor.submit(_cluster_group,group,rows,student_col,object_col,**kwargs))
+			outputs.extend(future.result() for future in pending)
+
+	node_communities,group_stats = {},{}
+	for group,labels,stats in sorted(outputs,key=lambda output: str(output[0])):
+		node_communities.update({(group,student):community for student,community in labels.items()})
+		group_stats[group] = stats
+	return {'node communities':node_communities, 'groups':group_stats, 'runtime':time.perf_counter()-start}
@@ -0,0 +1,171 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+import networkx as nx
+from scipy.sparse.csgraph import connected_components
+from concurrent.futures import ProcessPoolExecutor
+from .clustering import CommunityResult, _edge_arrays
+
+# edge arrays shared by all replicates of a worker process, set once by the pool initializer
+_shared = {}
+
+def _init_worker(nodes1,nodes2,rows,cols,weights):
+	"""
+	stores the edge arrays in the worker process so that only seeds are sent with each replicate
+	"""
+	_shared.update(nodes1=nodes1,nodes2=nodes2,rows=rows,cols=cols,weights=weights)
+
+def _bootstrap_replicate(seed,fix_B=None,refine=False,coarsen=None):
+	"""
+	clusters one multinomial resampling of the edge weights, returns the community of each node (-1 if absent)
+	"""
+	nodes1,nodes2 = _shared['nodes1'],_shared['nodes2']
+	rows,cols,weights = _shared['rows'],_shared['cols'],_shared['weights']
+	rng = np.random.default_rng(seed)
+	W = int(round(weights.sum()))
+	resampled = rng.multinomial(W,weights/weights.sum())
+	keep = resampled > 0
+
+	# first node set added first so that edges are oriented from it, as in get_bipartite
+	G = nx.Graph()
+	G.add_nodes_from((nodes1[i] for i in np.unique(rows[keep])),bipartite=0)
+	G.add_nodes_from((nodes2[j] for j in np.unique(cols[keep])),bipartite=1)
+	G.add_weighted_edges_from(zip([nodes1[i] for i in rows[keep]],[nodes2[j] for j in cols[keep]],resampled[keep]))
+
+	labels = np.full(len(nodes1),-1,dtype=np.int64)
+	result = CommunityResult(G,coarsen=coarsen)
+	if fix_B is not None:
+		fix_B = min(int(fix_B),len(result.description_lengths))
+	if refine:
+		result.refine(fix_B)
+	index1 = {node:ind for ind,node in enumerate(nodes1)}
+	for node,community in result.labels(fix_B).items():
+		labels[index1[node]] = community
+	return labels
+
+def co_assignment_frequency(replicates,rows=None):
+	"""
+	Computes the fraction of bootstrap replicates in which nodes were assigned to the same community.
+
+	The full matrix of a graph with N nodes takes N^2 floats, so only the given rows are computed: pass the
+	nodes of interest for large graphs.
+
+	Parameters:
+	-----------
+	replicates : numpy.ndarray
+		The 'replicate communities' returned by `community_stability`.
+	rows : array-like of int, optional
+		The indices (in the order of 'nodes') of the nodes whose frequencies are computed. If `None`, all nodes.
+		Default is `None`.
+
+	Returns:
+	--------
+	numpy.ndarray
+		An array of shape (len(rows), N) whose entry (i, j) is the fraction of replicates in which node rows[i]
+		and node j were assigned to the same community.
+	"""
+	replicates = np.asarray(replicates)
+	rows = np.arange(replicates.shape[0]) if rows is None else np.asarray(rows,dtype=np.int64)
+	counts = np.zeros((len(rows),replicates.shape[0]))
+	for labels in replicates.T:
+		counts += (labels[rows,None] == labels[None,:]) & (labels[rows,None] >= 0)
+	return counts/replicates.shape[1]
+
+def community_stability(G,n_boot=100,fix_B=None,refine=False,coarsen=None,threshold=0.5,n_jobs=None,seed=None,block_size=None):
+	"""
+	Assesses the stability of the communities found by `hina_communities` with a bootstrap over interactions.
+
+	Each replicate redistributes the total edge weight over the edges of the graph with a multinomial draw
+	proportional to the observed weights, and is clustered with `hina_communities`. Replicates run in a process
+	pool; the edge arrays are sent once to each worker process, so only a random seed is passed per replicate
+	instead of a pickled graph. The frequency with which each pair of nodes is assigned to the same community
+	summarizes the stability, and a consensus partition groups nodes that are co-assigned in at least a
+	`threshold` fraction of the replicates.
+
+	The pairwise frequencies are not stored: the consensus partition is built from blocks of `block_size` rows
+	of the frequency matrix, and the node stability from the counts of each pair of consensus and replicate
+	communities, so memory grows with the number of nodes times `n_boot` (see `co_assignment_frequency` for
+	the frequencies of given nodes).
+
+	Parameters:
+	-----------
+	G : networkx.Graph
+		A bipartite or tripartite graph with weighted edges, as accepted by `hina_communities`.
+	n_boot : int, optional
+		The number of bootstrap replicates. Default is 100.
+	fix_B : int, optional
+		If specified, fixes the number of communities in each replicate. Default is `None`.
+	refine : bool, optional
+		If `True`, each replicate is refined with single-node moves (see `hina_communities`). Default is `False`.
+	coarsen : str, optional
+		The coarsening of the multilevel mode used in each replicate (see `hina_communities`). Default is `None`.
+	threshold : float, optional
+		The minimum co-assignment frequency linking two nodes in the consensus partition. Default is 0.5.
+	n_jobs : int, optional
+		The number of worker processes. If `None`, all available CPUs are used. With 1, the replicates run in
+		the current process. Default is `None`.
+	seed : int, optional
+		The seed of the random number generator, for reproducible replicates. Default is `None`.
+	block_size : int, optional
+		The number of rows of the frequency matrix computed at a time. If `None`, about 4 million entries per
+		block. Default is `None`.
+
+	Returns:
+	--------
+	dict
+		A dictionary containing the following keys:
+		- 'nodes': The list of nodes of the first node set (as strings), in the order of the array rows.
+		- 'replicate communities': An integer array of shape (number of nodes, n_boot) whose column r gives the
+		  community of each node in replicate r (-1 if the node has no edge in the replicate).
+		- 'consensus communities': A dictionary mapping each node to its community label in the consensus partition.
+		- 'node stability': A dictionary mapping each node to its mean co-assignment frequency with the other
+		  members of its consensus community (1.0 for nodes alone in their community).
+		- 'number of replicates': The number of bootstrap replicates.
+	"""
+	nodes1,nodes2,rows,cols,weights = _edge_arrays(G)
+	N1 = len(nodes1)
+	seeds = np.random.SeedSequence(seed).spawn(n_boot)
+	shared = (nodes1,nodes2,rows,cols,weights)
+	kwargs = {'fix_B':fix_B,'refine':refine,'coarsen':coarsen}
+
+	if n_jobs is None:
+		n_jobs = os.cpu_count() or 1
+	if n_jobs == 1:
+		_init_worker(*shared)
+		replicates = [_bootstrap_replicate(s,**kwargs) for s in seeds]
+	else:
+		with ProcessPoolExecutor(max_workers=n_jobs,initializer=_init_worker,initargs=shared) as executor:
+			futures = [executor.submit(_bootstrap_replicate,s,**kwargs) for s in seeds]
+			replicates = [future.result() for future in futures]
+	replicates = np.stack(replicates,axis=1)
+
+	# consensus components grown block by block: the edges of each block of strong pairs are added to one
+	# edge from each node to the first node of its current component
+	if block_size is None:
+		block_size = max(1,2**22//max(N1,1))
+	consensus = np.arange(N1)
+	for start in range(0,N1,block_size):
+		block = np.arange(start,min(start+block_size,N1))
+		i,j = np.nonzero(co_assignment_frequency(replicates,block) >= threshold)
+		first = np.full(N1,N1,dtype=np.int64)
+		np.minimum.at(first,consensus,np.arange(N1))
+		links = sp.csr_matrix((np.ones(N1+len(i)),(np.concatenate([np.arange(N1),block[i]]), \
+			np.concatenate([first[consensus],j]))),shape=(N1,N1))
+		_,consensus = connected_components(links,directed=False)
+
+	# mean co-assignment with the other members of the consensus community, from the number of members of each
+	# consensus community in each community of each replicate
+	within = np.zeros(N1)
+	for labels in replicates.T:
+		present = np.flatnonzero(labels >= 0)
+		if len(present) == 0:
+			continue
+		pairs = consensus[present]*(labels.max()+1) + labels[present]
+		within[present] += np.bincount(pairs)[pairs] - 1
+	within = within/n_boot
+	others = np.bincount(consensus)[consensus] - 1
+	stability = np.where(others > 0,within/np.maximum(others,1),1.0)
+
+	return {'nodes':nodes1, 'replicate communities':replicates, \
+		 'consensus communities':{node:int(consensus[ind]) for ind,node in enumerate(nodes1)}, \
+		 'node stability':{node:float(stability[ind]) for ind,node in enumerate(nodes1)}, 'number of replicates':n_boot}
@@ -1,7 +1,8 @@
+import warnings
 import pytest
 import networkx as nx
 import pandas as pd
-from hina.mesoscale import hina_communities
+from hina.mesoscale import hina_communities, cut_dendrogram, CommunityResult, description_length, description_length_batch, hina_coclusters
 from hina.construction import get_bipartite, get_tripartite
 
 def create_test_graph():
@@ -151,5 +152,332 @@ def test_hina_communities_tripartite():
 	assert bob_community == charlie_community  
 	assert alice_community != bob_community    
 
+def test_hina_communities_dendrogram():
+	# Test that the recorded merge sequence reproduces the partition for any number of communities
+	from scipy.cluster.hierarchy import fcluster
+	B = create_test_graph_from_df()
+	results = hina_communities(B)
+	dendrogram = results['dendrogram']
+	N1 = len(dendrogram['nodes'])
+
+	assert dendrogram['linkage'].shape == (N1-1, 4)
+	assert len(dendrogram['description lengths']) == N1
+	assert cut_dendrogram(dendrogram, results['number of communities']) == results['node communities']
+	assert cut_dendrogram(dendrogram, 2) == hina_communities(B, fix_B=2)['node communities']
+
+	for n in range(1, N1+1):
+		labels = cut_dendrogram(dendrogram, n)
+		assert len(set(labels.values())) == n
+		scipy_labels = fcluster(dendrogram['linkage'], n, criterion='maxclust')
+		for i, node in enumerate(dendrogram['nodes']):
+			for j, other in enumerate(dendrogram['nodes']):
+				assert (labels[node] == labels[other]) == (scipy_labels[i] == scipy_labels[j])
+
+	with pytest.raises(ValueError):
+		cut_dendrogram(dendrogram, N1+1)
+
+def test_hina_communities_result_object():
+	# Test that one result object answers any number of communities consistently with hina_communities
+	B = create_test_graph_from_df()
+	result = hina_communities(B, return_type='object')
+	assert isinstance(result, CommunityResult)
+
+	results_no_fix = hina_communities(B)
+	assert result.best_B == results_no_fix['number of communities']
+	assert result.labels() == results_no_fix['node communities']
+	assert result.compression_ratio() == pytest.approx(results_no_fix['community structure quality value'])
+
+	for n in range(1, len(result.description_lengths)+1):
+		results_fix = hina_communities(B, fix_B=n)
+		assert result.labels(n) == results_fix['node communities']
+		assert result.quality_value(n) == pytest.approx(results_fix['community structure quality value'])
+		assert set(result.subgraphs(n)) == set(results_fix['sub graphs for each community'])
+	assert result.labels(2) is result.labels(2)
+
+	with pytest.raises(ValueError):
+		result.object_graphs()
+	with pytest.raises(ValueError):
+		hina_communities(B, return_type='test')
+
+	# A graph without edges has a defined compression ratio, computed without numerical warnings
+	empty = nx.Graph()
+	empty.add_node('Alice', bipartite='student')
+	with warnings.catch_warnings():
+		warnings.simplefilter('error')
+		result = hina_communities(empty, return_type='object', refine=True)
+		assert result.compression_ratio() == 1.0 and result.labels() == {}
+		assert result.refinement['compression ratio after'] == 1.0
+
+def create_random_graph(n_students=30, n_objects=6, seed=0, blocks=None):
+	# Create a random weighted bipartite graph with NetworkX, or with `blocks` planted groups of students and
+	# objects (student i and object j are linked with probability 0.9 in the same group, 0.05 otherwise)
+	import random
+	rng = random.Random(seed)
+	B = nx.Graph()
+	students = [f'student {i}' for i in range(n_students)]
+	objects = [f'object {j}' for j in range(n_objects)]
+	B.add_nodes_from(students, bipartite='student')
+	B.add_nodes_from(objects, bipartite='object')
+	if blocks is not None:
+		for i, student in enumerate(students):
+			for j, obj in enumerate(objects):
+				if rng.random() < (0.9 if i % blocks == j % blocks else 0.05):
+					B.add_edge(student, obj, weight=rng.randint(1, 4))
+		return B
+	for student in students:
+		for obj in rng.sample(objects, rng.randint(1, n_objects)):
+			B.add_edge(student, obj, weight=rng.randint(1, 5))
+	return B
+
+def test_hina_communities_refine():
+	# Test that the refinement never increases the MDL objective
+	B = create_random_graph()
+	greedy = hina_communities(B)
+	results = hina_communities(B, refine=True)
+	refinement = results['refinement']
+
+	assert refinement['compression ratio before'] == pytest.approx(greedy['community structure quality value'])
+	assert refinement['compression ratio after'] <= refinement['compression ratio before']
+	assert refinement['compression ratio improvement'] >= 0
+	assert results['community structure quality value'] <= greedy['community structure quality value']
+	assert results['number of communities'] == len(set(results['node communities'].values()))
+	assert set(results['node communities']) == set(greedy['node communities'])
+
+	# With a fixed number of communities, refinement keeps it
+	results_fix = hina_communities(B, fix_B=3, refine=True, max_iter=2, time_limit=10)
+	assert results_fix['number of communities'] == 3
+	assert results_fix['refinement']['number of sweeps'] <= 2
+	assert results_fix['community structure quality value'] <= hina_communities(B, fix_B=3)['community structure quality value']
+
+def test_description_length():
+	# Test that external partitions are scored with the objective optimized by hina_communities
+	B = create_random_graph()
+	result = hina_communities(B, return_type='object')
+	for n in [1, 2, result.best_B]:
+		score = description_length(B, result.labels(n))
+		assert score['number of communities'] == n
+		assert score['compression ratio'] == pytest.approx(result.compression_ratio(n))
+		assert score['description length'] == pytest.approx(score['compression ratio'] * score['naive description length'])
+
+	singletons = {node: node for node in result.labels()}
+	assert description_length(B, singletons)['compression ratio'] == pytest.approx(1.0)
+
+	# Arbitrary labels, e.g. instructor-assigned groups, and the batch variant
+	groups = {f'student {i}': 'group A' if i % 2 else 'group B' for i in range(30)}
+	partitions = [groups, result.labels(), singletons]
+	batch = description_length_batch(B, partitions)
+	assert [score['compression ratio'] for score in batch] == pytest.approx(
+		[description_length(B, partition)['compression ratio'] for partition in partitions])
+
+	with pytest.raises(ValueError):
+		description_length(B, {'student 0': 0})
+
+def test_hina_communities_multilevel():
+	# Test the multilevel mode on a graph where many students share the same object profile
+	original = create_random_graph(n_students=12, n_objects=4, seed=1)
+	B = nx.Graph()
+	B.add_nodes_from([f'student {i}' for i in range(12)] + [f'copy {i}' for i in range(12)], bipartite='student')
+	B.add_nodes_from([f'object {j}' for j in range(4)], bipartite='object')
+	for student, obj, w in original.edges(data='weight'):
+		B.add_edge(student, obj, weight=w)
+		B.add_edge(student.replace('student', 'copy'), obj, weight=w)
+
+	exact = hina_communities(B, return_type='object')
+	for coarsen in ['identical', 'support']:
+		result = hina_communities(B, return_type='object', coarsen=coarsen)
+		n_leaves = len(result.dendrogram['linkage']) + 1
+		assert n_leaves <= 12
+		assert result.naive_description_length == pytest.approx(exact.naive_description_length)
+
+		labels = result.labels()
+		assert set(labels) == set(exact.labels())
+		for i in range(12):
+			assert labels[f'copy {i}'] == labels[f'student {i}']
+		assert result.compression_ratio() == pytest.approx(description_length(B, labels)['compression ratio'])
+		assert len(set(result.labels(1).values())) == 1
+
+	results = hina_communities(B, coarsen='identical', refine=True)
+	assert results['refinement']['compression ratio after'] <= results['refinement']['compression ratio before']
+
+	with pytest.raises(ValueError):
+		hina_communities(B, coarsen='test')
+
+def test_hina_communities_warm_start():
+	# Test re-clustering an evolving graph from the previous partition
+	B = create_random_graph()
+	previous = hina_communities(B)['node communities']
+
+	# Unchanged graph: the previous communities are kept as they are
+	result = hina_communities(B, return_type='object', init_partition=previous)
+	assert len(result.dendrogram['linkage']) + 1 == len(set(previous.values()))
+	assert result.description_lengths[0] == pytest.approx(description_length(B, previous)['description length'])
+	assert result.compression_ratio() <= description_length(B, previous)['compression ratio'] + 1e-12
+
+	# New week: one student leaves and a new student arrives
+	B_new = B.copy()
+	B_new.remove_node('student 0')
+	B_new.add_node('student new', bipartite='student')
+	for obj, w in B['student 0'].items():
+		B_new.add_edge('student new', obj, weight=w['weight'])
+	# Students are added first so that edges are oriented from the student set
+	ordered = nx.Graph()
+	ordered.add_nodes_from([n for n, d in B_new.nodes(data=True) if d['bipartite'] == 'student'], bipartite='student')
+	ordered.add_nodes_from([n for n, d in B_new.nodes(data=True) if d['bipartite'] == 'object'], bipartite='object')
+	ordered.add_edges_from(B_new.edges(data=True))
+
+	results = hina_communities(ordered, init_partition=previous)
+	assert 'student new' in results['node communities']
+	assert 'student 0' not in results['node communities']
+	assert 'refinement' in results
+	n_dirty = sum(1 for label in previous.values() if label == previous['student 0'])
+	leaves = len(results['dendrogram']['linkage']) + 1
+	assert leaves == len(set(previous.values())) - 1 + (n_dirty - 1) + 1
+
+	# Only the nodes of the community of student 0 and the new student may move in the refinement
+	result = hina_communities(ordered, return_type='object', init_partition=previous)
+	dirty = {node for node, label in previous.items() if label == previous['student 0'] and node != 'student 0'}
+	assert set(result.warm_nodes) == dirty | {'student new'}
+	result.refine(movable=result.warm_nodes)
+	labels = result.labels(result.refinement['number of communities'])
+	for label in set(previous.values()) - {previous['student 0']}:
+		members = [node for node, other in previous.items() if other == label]
+		assert len({labels[node] for node in members}) == 1
+
+def test_hina_communities_warm_start_changed_edges():
+	# Test that a community whose nodes are all still present is revisited when the edges of a node changed
+	B = create_random_graph(n_students=20, n_objects=8, blocks=2)
+	previous = hina_communities(B)['node communities']
+	assert previous['student 1'] == previous['student 3'] != previous['student 0']
+
+	# student 1 now only uses the objects of the other block
+	B_new = nx.Graph()
+	B_new.add_nodes_from(B.nodes(data=True))
+	B_new.add_edges_from((i, j, d) for i, j, d in B.edges(data=True) if 'student 1' not in (i, j))
+	B_new.add_edges_from(('student 1', f'object {j}', {'weight': 3}) for j in range(0, 8, 2))
+
+	# without the previous graph, no community lost nodes, so none is revisited
+	stale = hina_communities(B_new, return_type='object', init_partition=previous)
+	assert stale.warm_nodes == []
+
+	result = hina_communities(B_new, return_type='object', init_partition=previous, init_graph=B)
+	assert set(result.warm_nodes) == {node for node, label in previous.items() if label == previous['student 1']}
+	labels = hina_communities(B_new, init_partition=previous, init_graph=B)['node communities']
+	assert labels['student 1'] == labels['student 0'] != labels['student 3']
+
+def test_hina_communities_lightweight():
+	# Test that the lightweight mode leaves the graph untouched and returns the same subgraphs as views
+	data = {
+		'student': ['Alice', 'Bob', 'Alice', 'Charlie'],
+		'object1': ['ask questions', 'answer questions', 'evaluating', 'monitoring'],
+		'object2': ['tilt head', 'shake head', 'nod head', 'nod head'],
+		'group': ['A', 'B', 'A', 'B']
+	}
+	T = get_tripartite(pd.DataFrame(data), student_col='student', object1_col='object1', object2_col='object2', group_col='group')
+	light = hina_communities(T, fix_B=2, lightweight=True)
+	assert 'updated graph object' not in light
+	assert all('communities' not in attrs for _, attrs in T.nodes(data=True))
+
+	full = hina_communities(T, fix_B=2)
+	assert light['node communities'] == full['node communities']
+	assert set(light['sub graphs for each community']) == set(full['sub graphs for each community'])
+	for community, view in light['sub graphs for each community'].items():
+		subgraph = full['sub graphs for each community'][community]
+		assert nx.is_frozen(view)
+		assert set(view.nodes) == set(subgraph.nodes)
+		assert set(map(frozenset, view.edges)) == set(map(frozenset, subgraph.edges))
+		object_graph = light['object-object graphs for each community'][community]
+		assert nx.utils.edges_equal(object_graph.edges(data=True), full['object-object graphs for each community'][community].edges(data=True))
+	with pytest.raises(KeyError):
+		light['sub graphs for each community'][-1]
+
+	# the co-occurrence matrices are only computed when an object-object graph is first accessed
+	result = hina_communities(T, fix_B=2, return_type='object')
+	object_graphs = result.to_dict(2, lightweight=True)['object-object graphs for each community']
+	assert len(object_graphs) == 2 and not result._object_matrices
+	community = next(iter(object_graphs))
+	assert object_graphs[community].number_of_edges() == result.object_graphs(2)[community].number_of_edges()
+	assert 2 in result._object_matrices
+
+def test_hina_communities_object_matrices():
+	# Test that the sparse co-occurrence matrices match the object-object graphs of each community
+	data = {
+		'student': ['Alice', 'Bob', 'Alice', 'Charlie', 'Alice', 'Alice'],
+		'object1': ['ask questions', 'answer questions', 'evaluating', 'monitoring', 'ask questions', 'nod head'],
+		'object2': ['tilt head', 'shake head', 'nod head', 'nod head', 'tilt head', 'tilt head'],
+		'group': ['A', 'B', 'A', 'B', 'A', 'A']
+	}
+	T = get_tripartite(pd.DataFrame(data), student_col='student', object1_col='object1', object2_col='object2', group_col='group')
+	result = hina_communities(T, fix_B=2, return_type='object')
+	object_matrices = result.object_matrices()
+	objects1, objects2 = object_matrices['object1 nodes'], object_matrices['object2 nodes']
+	assert set(objects1) == {'ask questions', 'answer questions', 'evaluating', 'monitoring', 'nod head'}
+	assert set(objects2) == {'tilt head', 'shake head', 'nod head'}
+
+	alice = result.labels()['Alice']
+	M = object_matrices['matrices'][alice]
+	assert M.shape == (len(objects1), len(objects2))
+	assert M[objects1.index('ask questions'), objects2.index('tilt head')] == 2
+	assert M[objects1.index('evaluating'), objects2.index('nod head')] == 1
+	assert M.sum() == 4
+
+	for community, G_ in result.object_graphs().items():
+		M = object_matrices['matrices'][community]
+		assert G_.number_of_edges() == M.nnz
+		for u, v, w in G_.edges(data='weight'):
+			u, v = (u, v) if u in objects1 else (v, u)
+			assert M[objects1.index(u), objects2.index(v)] == w
+		# an object in both sets of a community ('nod head' for Alice) is labelled as object1
+		rows = {objects1[i] for i in M.tocoo().row}
+		assert all(G_.nodes[u]['bipartite'] == ('object1' if u in rows else 'object2') for u in G_)
+	assert result.object_graphs()[alice].nodes['nod head']['bipartite'] == 'object1'
+
+def test_hina_communities_object_side():
+	# Test clustering the object set, which is the first set of the transposed graph
+	G = create_random_graph(n_students=20, n_objects=8, blocks=2)
+	results = hina_communities(G, node_set='object')
+	assert set(results['node communities']) == {f'object {j}' for j in range(8)}
+	labels = results['node communities']
+	assert all((labels[f'object {j}'] == labels['object 0']) == (j % 2 == 0) for j in range(8))
+
+	T = nx.Graph()
+	T.add_nodes_from([f'object {j}' for j in range(8)], bipartite='object')
+	T.add_nodes_from([f'student {i}' for i in range(20)], bipartite='student')
+	T.add_weighted_edges_from((o, s, w) for s, o, w in G.edges(data='weight'))
+	assert hina_communities(T)['node communities'] == labels
+	with pytest.raises(ValueError):
+		hina_communities(G, node_set='teacher')
+
+def test_hina_coclusters():
+	# Test that the joint co-clustering recovers the planted blocks with a consistent block matrix
+	G = create_random_graph(n_students=20, n_objects=8, blocks=2)
+	results = hina_coclusters(G)
+	assert results['number of communities'] == (2, 2)
+	students, objects = results['node communities'], results['object communities']
+	assert all((students[f'student {i}'] == students['student 0']) == (i % 2 == 0) for i in range(20))
+	assert all((objects[f'object {j}'] == objects['object 0']) == (j % 2 == 0) for j in range(8))
+
+	block_matrix = results['block matrix']
+	assert block_matrix.sum() == sum(w for _, _, w in G.edges(data='weight'))
+	for r in range(2):
+		for c in range(2):
+			assert block_matrix[r, c] == sum(w for s, o, w in G.edges(data='weight') if students[s] == r and objects[o] == c)
+	assert results['community structure quality value'] <= results['compression ratio before'] < 1
+
+	results_fixed = hina_coclusters(G, fix_B=(3, 2))
+	assert results_fixed['number of communities'] == (3, 2)
+
+def test_hina_communities_progress():
+	# Test that the progress callback reports every merge and can abort the run
+	G = create_test_graph_from_df()
+	calls = []
+	results = hina_communities(G, progress=lambda B, B0: calls.append((B, B0)))
+	n_students = len(results['node communities'])
+	assert calls == [(B, n_students) for B in range(n_students - 1, 0, -1)]
+
+	def abort(B, B0):
+		raise RuntimeError("cancelled")
+	with pytest.raises(RuntimeError):
+		hina_communities(G, progress=abort)
+
 if __name__ == "__main__":
-	pytest.main()
\ No newline at end of file
+	pytest.main()
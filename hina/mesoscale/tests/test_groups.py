@@ -0,0 +1,42 @@
+import pytest
+import pandas as pd
+from hina.mesoscale import hina_communities, group_communities
+from hina.construction import get_bipartite
+
+def create_test_df():
+	# Create a cohort of three groups, each with two kinds of students
+	rows = []
+	for group in ['A', 'B', 'C']:
+		for i in range(6):
+			objects = ['ask', 'answer'] if i < 3 else ['plan', 'monitor']
+			for obj in objects:
+				rows += [(group, f'{group}{i}', obj)] * (2 + i % 2)
+	return pd.DataFrame(rows, columns=['group', 'student', 'object'])
+
+def test_group_communities():
+	# Test that each group is clustered as on its own graph
+	df = create_test_df()
+	results = group_communities(df, 'student', 'object', 'group', n_jobs=1)
+
+	assert set(results['groups']) == {'A', 'B', 'C'}
+	assert len(results['node communities']) == 18
+	for group in ['A', 'B', 'C']:
+		expected = hina_communities(get_bipartite(df[df['group'] == group].copy(), 'student', 'object'))
+		labels = {student: label for (g, student), label in results['node communities'].items() if g == group}
+		assert labels == expected['node communities']
+		stats = results['groups'][group]
+		assert stats['number of communities'] == expected['number of communities']
+		assert stats['compression ratio'] == pytest.approx(expected['community structure quality value'])
+		assert stats['number of students'] == 6
+		assert stats['runtime'] >= 0
+
+def test_group_communities_parallel():
+	# Test that the process pool gives the same results as the sequential run
+	df = create_test_df()
+	sequential = group_communities(df, 'student', 'object', 'group', fix_B=2, n_jobs=1)
+	parallel = group_communities(df, 'student', 'object', 'group', fix_B=2, n_jobs=2)
+	assert sequential['node communities'] == parallel['node communities']
+	assert all(stats['number of communities'] == 2 for stats in parallel['groups'].values())
+
+if __name__ == "__main__":
+	pytest.main()
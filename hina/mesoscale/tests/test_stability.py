@@ -0,0 +1,70 @@
+import pytest
+import numpy as np
+import networkx as nx
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from hina.mesoscale import community_stability, co_assignment_frequency
+
+def create_test_graph():
+	# Create two groups of students interacting with disjoint sets of objects
+	B = nx.Graph()
+	students = [f'student {i}' for i in range(12)]
+	objects = [f'object {j}' for j in range(4)]
+	B.add_nodes_from(students, bipartite='student')
+	B.add_nodes_from(objects, bipartite='object')
+	for i, student in enumerate(students):
+		for obj in (objects[:2] if i < 6 else objects[2:]):
+			B.add_edge(student, obj, weight=3 + i % 2)
+	return B
+
+def test_community_stability():
+	# Test the bootstrap stability analysis in the current process
+	B = create_test_graph()
+	results = community_stability(B, n_boot=10, n_jobs=1, seed=0)
+
+	assert results['number of replicates'] == 10
+	assert len(results['nodes']) == 12
+	replicates = results['replicate communities']
+	assert replicates.shape == (12, 10)
+	frequency = co_assignment_frequency(replicates)
+	assert frequency.shape == (12, 12)
+	assert frequency.max() <= 1.0
+	assert np.allclose(frequency, frequency.T)
+	assert np.allclose(co_assignment_frequency(replicates, [3, 7]), frequency[[3, 7]])
+
+	# The two groups of students are recovered by the consensus partition
+	consensus = results['consensus communities']
+	assert consensus['student 0'] == consensus['student 5']
+	assert consensus['student 6'] == consensus['student 11']
+	assert consensus['student 0'] != consensus['student 6']
+	assert all(0.5 <= value <= 1.0 for value in results['node stability'].values())
+
+def test_community_stability_parallel():
+	# Test that the process pool gives the same replicates as the sequential run for a given seed
+	B = create_test_graph()
+	sequential = community_stability(B, n_boot=4, fix_B=2, n_jobs=1, seed=1)
+	parallel = community_stability(B, n_boot=4, fix_B=2, n_jobs=2, seed=1)
+	assert np.array_equal(sequential['replicate communities'], parallel['replicate communities'])
+	assert sequential['consensus communities'] == parallel['consensus communities']
+
+def test_community_stability_blocks():
+	# Test that the consensus and stabilities built block by block match those of the full frequency matrix
+	B = create_test_graph()
+	B.add_edge('student 0', 'object 2', weight=2)
+	B.add_edge('student 6', 'object 1', weight=1)
+	for threshold in [0.3, 0.5, 0.9]:
+		results = community_stability(B, n_boot=8, n_jobs=1, seed=2, threshold=threshold, block_size=5)
+		frequency = co_assignment_frequency(results['replicate communities'])
+		_, reference = connected_components(sp.csr_matrix(frequency >= threshold), directed=False)
+		consensus = np.array([results['consensus communities'][node] for node in results['nodes']])
+		same = consensus[:, None] == consensus[None, :]
+		assert np.array_equal(same, reference[:, None] == reference[None, :])
+
+		others = same.sum(axis=1) - 1
+		within = (frequency*same).sum(axis=1) - frequency.diagonal()
+		expected = np.where(others > 0, within/np.maximum(others, 1), 1.0)
+		stability = [results['node stability'][node] for node in results['nodes']]
+		assert np.allclose(stability, expected)
+
+if __name__ == "__main__":
+	pytest.main()